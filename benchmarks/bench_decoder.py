@@ -0,0 +1,168 @@
+"""
+Microbenchmark: old `MessageToDict()` dictionarize path VS `decoder.py` row decoding.
+
+usage (from repo root):
+    python benchmarks/bench_decoder.py
+    python benchmarks/bench_decoder.py --num-msgs 50000 --repeat 5
+"""
+import argparse
+import time
+import statistics
+
+from google.protobuf.json_format import MessageToDict
+
+# same protobuf path hack as client.py
+import sys
+import os
+def add_to_python_path(new_path):
+    existing_path = sys.path
+    absolute_path = os.path.abspath(new_path)
+    if absolute_path not in existing_path:
+        sys.path.append(absolute_path)
+    return sys.path
+
+file_dir_path = os.path.dirname(os.path.realpath(__file__))
+add_to_python_path(file_dir_path + "/../telemetry")
+add_to_python_path(file_dir_path + "/../telemetry/proto")
+
+from proto import telemetry_pb2
+
+from decoder import DB_ALL_COLS, decode_row, decode_rows, row_to_dict
+from copy_writer import to_epoch_ns
+
+
+def make_messages(num_msgs: int, timestamp_ns: bool = True) -> list:
+    # round robin of the 3 telemetry types, like server.cpp's sensors
+    # `timestamp_ns=False`: ISO string only, like an older server.cpp
+    msgs = []
+    for i in range(num_msgs):
+        resp = telemetry_pb2.TelemetryResponse(timestamp="2025-06-24T12:34:56.123456Z")
+        if timestamp_ns:
+            resp.timestamp_ns = 1750768496123456000
+        kind = i % 3
+        if kind == 0:
+            resp.type = telemetry_pb2.TEMPERATURE
+            resp.temperature.sensor_id = "TEMP_ENG_001"
+            resp.temperature.subsystem = telemetry_pb2.ENGINE
+            resp.temperature.temperature = 30.5 + i % 7
+            resp.temperature.unit = "celsius"
+            resp.temperature.status_bitmask = 1
+            resp.temperature.sequence_number = i
+        elif kind == 1:
+            resp.type = telemetry_pb2.PRESSURE
+            resp.pressure.sensor_id = "PRESS_FUEL_002"
+            resp.pressure.subsystem = telemetry_pb2.FUEL_TANK
+            resp.pressure.pressure = 200.25 + i % 5
+            resp.pressure.unit = "bar"
+            resp.pressure.sequence_number = i
+        else:
+            resp.type = telemetry_pb2.VELOCITY
+            resp.velocity.sensor_id = "VELO_STAGE1_001"
+            resp.velocity.subsystem = telemetry_pb2.STAGE1
+            resp.velocity.velocity_x = 8000.5
+            resp.velocity.velocity_y = 7999.5
+            resp.velocity.velocity_z = 8001.0
+            resp.velocity.unit = "m/s"
+            resp.velocity.status_bitmask = 4
+            resp.velocity.sequence_number = i
+        msgs.append(resp)
+    return msgs
+
+
+def legacy_dictionarize_data(telem_response) -> dict:
+    # the old client.py path, kept here only for comparison
+    telem_dict = MessageToDict(telem_response, always_print_fields_with_no_presence=True)
+    db_data = {col: None for col in DB_ALL_COLS}
+    db_data['reading_timestamp'] = telem_dict.get('timestamp')
+
+    if 'temperature' in telem_dict:
+        db_data['telemetry_type'] = 'TEMPERATURE'
+        temp_data = telem_dict['temperature']
+        db_data.update({
+            'sensor_id': temp_data.get('sensorId'),
+            'subsystem': temp_data.get('subsystem'),
+            'temperature': temp_data.get('temperature'),
+            'temp_unit': temp_data.get('unit'),
+            'status_bitmask': temp_data.get('statusBitmask'),
+            'sequence_number': temp_data.get('sequenceNumber')
+        })
+    elif 'pressure' in telem_dict:
+        db_data['telemetry_type'] = 'PRESSURE'
+        pressure_data = telem_dict['pressure']
+        db_data.update({
+            'sensor_id': pressure_data.get('sensorId'),
+            'subsystem': pressure_data.get('subsystem'),
+            'pressure': pressure_data.get('pressure'),
+            'pressure_unit': pressure_data.get('unit'),
+            'status_bitmask': pressure_data.get('statusBitmask'),
+            'leak_detected': pressure_data.get('leakDetected'),
+            'sequence_number': pressure_data.get('sequenceNumber')
+        })
+    elif 'velocity' in telem_dict:
+        db_data['telemetry_type'] = 'VELOCITY'
+        velocity_data = telem_dict['velocity']
+        db_data.update({
+            'sensor_id': velocity_data.get('sensorId'),
+            'subsystem': velocity_data.get('subsystem'),
+            'velocity_x': velocity_data.get('velocityX'),
+            'velocity_y': velocity_data.get('velocityY'),
+            'velocity_z': velocity_data.get('velocityZ'),
+            'velocity_unit': velocity_data.get('unit'),
+            'vibration_magnitude': velocity_data.get('vibrationMag'),
+            'status_bitmask': velocity_data.get('statusBitmask'),
+            'sequence_number': velocity_data.get('sequenceNumber')
+        })
+    return db_data
+
+
+def check_same_output(msgs):
+    # sanity check: both paths give the same columns (floats compared loosely, float32 vs shortest repr)
+    for resp in msgs[:3]:
+        legacy = legacy_dictionarize_data(resp)
+        new = row_to_dict(decode_row(resp))
+        for col in DB_ALL_COLS:
+            old_val, new_val = legacy[col], new[col]
+            if col == 'reading_timestamp':
+                assert to_epoch_ns(old_val) == to_epoch_ns(new_val), (col, old_val, new_val)
+            elif isinstance(new_val, float):
+                assert abs(old_val - new_val) < 1e-3, (col, old_val, new_val)
+            else:
+                assert old_val == new_val, (col, old_val, new_val)
+
+
+def time_per_msg(func, msgs, repeat: int) -> list[float]:
+    # seconds per message, for each repeat
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(msgs)
+        results.append((time.perf_counter() - start) / len(msgs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-msgs', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    msgs = make_messages(args.num_msgs)
+    check_same_output(msgs)
+
+    cases = {
+        'MessageToDict (old)': lambda ms: [legacy_dictionarize_data(m) for m in ms],
+        'decode_row': lambda ms: [decode_row(m) for m in ms],
+        'decode_rows (batch)': decode_rows,
+    }
+
+    print(f"{args.num_msgs} msgs x {args.repeat} repeats")
+    baseline = None
+    for name, func in cases.items():
+        per_msg = statistics.median(time_per_msg(func, msgs, args.repeat))
+        if baseline is None:
+            baseline = per_msg
+        print(f"  {name:<22} {per_msg * 1e6:10.2f} us/msg  {1 / per_msg:12.0f} msg/s  ({baseline / per_msg:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
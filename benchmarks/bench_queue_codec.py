@@ -0,0 +1,57 @@
+"""
+Benchmark: redis queue payload codecs (`telemetry/queue_codec.py`).
+
+Reports bytes/msg (what sits in redis when a backlog builds) and encode/decode time per msg.
+
+usage (from repo root):
+    python benchmarks/bench_queue_codec.py
+    python benchmarks/bench_queue_codec.py --num-msgs 50000 --repeat 5
+"""
+import argparse
+import time
+import statistics
+
+from bench_decoder import add_to_python_path, make_messages, file_dir_path
+
+add_to_python_path(file_dir_path + "/../telemetry")
+add_to_python_path(file_dir_path + "/../telemetry/proto")
+
+from decoder import decode_rows
+from queue_codec import CODECS, decode_payload
+
+
+def time_per_msg(func, num_msgs: int, repeat: int) -> float:
+    # median seconds per message
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) / num_msgs)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-msgs', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    msgs = make_messages(args.num_msgs)
+    rows = decode_rows(msgs)
+    pairs = list(zip(msgs, rows))
+
+    print(f"{args.num_msgs} msgs x {args.repeat} repeats")
+    print(f"  {'codec':<10} {'bytes/msg':>10} {'encode us/msg':>14} {'decode us/msg':>14}")
+    for name, codec in CODECS.items():
+        payloads = [codec.encode(msg, row) for msg, row in pairs]
+        # round trip check, floats are float32 in every codec's source data
+        assert decode_payload(payloads[0])[:6] == rows[0][:6], name
+
+        bytes_per_msg = sum(len(p) for p in payloads) / len(payloads)
+        encode = time_per_msg(lambda: [codec.encode(msg, row) for msg, row in pairs], args.num_msgs, args.repeat)
+        decode = time_per_msg(lambda: [decode_payload(p) for p in payloads], args.num_msgs, args.repeat)
+        print(f"  {name:<10} {bytes_per_msg:10.1f} {encode * 1e6:14.2f} {decode * 1e6:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
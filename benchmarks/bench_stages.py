@@ -0,0 +1,403 @@
+"""
+Stage-level microbenchmarks for the telemetry ingest hot path.
+
+One benchmark per stage:
+- `dictionarize`       : `client.dictionarize_data()` (gRPC message -> db row), per msg
+- `queue_json_encode`  : json queue payload encode (legacy `JsonCodec`), per msg
+- `queue_json_decode`  : json queue payload decode (`decode_payload()`), per msg
+- `queue_msgpack_*`    : same for the default msgpack codec, for comparison
+- `batcher_add`        : `DBBatcher.add()` from `--producers` concurrent tasks, while flushes keep swapping the buffer
+- `copy_encode`        : `BinaryCopyWriter.write()` of `--copy-batch` rows into a recording fake cursor
+                         (rows really go through psycopg's binary dumpers, just no server), per batch
+- `backend_validate`   : `backend.py` pydantic validation of one `TelemetryData` dict + `model_dump_json()`, per msg
+- `timestamp_iso`/`_ns`: what the COPY writer + tracer do with one row timestamp (`to_datetime()` + `to_epoch_ns()`),
+                         for an ISO string (old rows) vs the int `timestamp_ns` (now), per msg
+
+`--timestamps iso` runs every stage on messages without `timestamp_ns` (like an older server.cpp), to compare end to end.
+
+Each reports ops/s, p50/p99 latency per call and allocations (tracemalloc, separate pass so it doesn't skew timings),
+from the median (by ops/s) of `--repeat` runs, so one lucky or unlucky run doesn't set the number.
+Results go to JSON (`--output`), and are compared against a stored baseline (`--baseline`):
+- a stage regresses if its median ops/s drops by more than `--tolerance`
+    - p50/p99 are reported, not gated: a p99 of microsecond calls is mostly scheduler noise
+- the baseline keeps the settings it was recorded with (`--num-msgs`, `--repeat`, `--producers`, `--copy-batch`, `--timestamps`),
+    a run reuses whatever isn't given explicitly, and isn't compared at all if they still differ
+- exits with 1 on any regression (for CI), `--save-baseline` writes the current run as the new baseline
+
+NOTE: the stored baseline is machine specific, re-save it when comparing on a different box
+
+usage (from repo root):
+    python benchmarks/bench_stages.py
+    python benchmarks/bench_stages.py --num-msgs 50000 --output /tmp/stages.json
+    python benchmarks/bench_stages.py --only dictionarize copy_encode
+    python benchmarks/bench_stages.py --only copy_encode timestamps --timestamps iso
+    python benchmarks/bench_stages.py --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from bench_decoder import add_to_python_path, make_messages, file_dir_path
+
+add_to_python_path(file_dir_path + "/../telemetry")
+add_to_python_path(file_dir_path + "/../telemetry/proto")
+
+from psycopg import postgres
+from psycopg.adapt import Transformer
+from psycopg.pq import Format
+from pydantic import TypeAdapter
+
+from decoder import decode_rows, row_to_dict
+from queue_codec import CODECS, decode_payload
+from batcher import DBBatcher
+from copy_writer import TELEMETRY_COPY, to_datetime, to_epoch_ns
+import client
+import backend
+
+
+DEFAULT_BASELINE = os.path.join(file_dir_path, "baselines", "stages.json")
+
+# saved with the baseline, compared like for like
+DEFAULT_SETTINGS = {
+    'num_msgs': 20000,
+    'repeat': 5,
+    'producers': 8,
+    'copy_batch': 500,
+    'timestamps': 'ns',
+}
+
+
+# ---------- measuring ----------
+
+def _summary(name: str, latencies_ns: list[int], wall_s: float, ops_per_call: int, alloc: dict) -> dict:
+    latencies_ns = sorted(latencies_ns)
+    calls = len(latencies_ns)
+    return {
+        'name': name,
+        'calls': calls,
+        'ops_per_call': ops_per_call,
+        'ops_per_sec': calls * ops_per_call / wall_s,
+        'p50_us': latencies_ns[calls // 2] / 1000,
+        'p99_us': latencies_ns[min(calls - 1, int(calls * 0.99))] / 1000,
+        **alloc,
+    }
+
+
+class AllocTracker:
+    # tracemalloc pass (separate from the timed one, it slows everything down)
+    # - peak: bytes allocated on top of what was already live, per call (so temporaries count too)
+    # - retained: bytes still held once the whole pass is done
+    def __enter__(self):
+        tracemalloc.start()
+        self._start, _ = tracemalloc.get_traced_memory()
+        self.peak_total = 0
+        return self
+
+    def call(self, op, item):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = op(item)
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak_total += peak - before
+        return result
+
+    async def acall(self, op, item):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        await op(item)
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak_total += peak - before
+
+    def __exit__(self, *exc):
+        self.end, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    def summary(self, ops: int) -> dict:
+        return {
+            'alloc_peak_bytes_per_op': self.peak_total / ops,
+            'alloc_retained_bytes_per_op': (self.end - self._start) / ops,
+        }
+
+
+def measure(name: str, op, inputs: list, ops_per_call: int = 1) -> dict:
+    # sync stage, `op(item)` once per input
+    perf_counter_ns = time.perf_counter_ns
+    latencies = []
+    append = latencies.append
+    start = time.perf_counter()
+    for item in inputs:
+        t0 = perf_counter_ns()
+        op(item)
+        append(perf_counter_ns() - t0)
+    wall = time.perf_counter() - start
+
+    with AllocTracker() as alloc:
+        kept = [alloc.call(op, item) for item in inputs]
+    del kept
+    return _summary(name, latencies, wall, ops_per_call, alloc.summary(len(inputs) * ops_per_call))
+
+
+def measure_async(name: str, op, inputs: list, ops_per_call: int = 1) -> dict:
+    # async stage, `await op(item)` once per input
+    async def timed():
+        perf_counter_ns = time.perf_counter_ns
+        latencies = []
+        start = time.perf_counter()
+        for item in inputs:
+            t0 = perf_counter_ns()
+            await op(item)
+            latencies.append(perf_counter_ns() - t0)
+        return latencies, time.perf_counter() - start
+
+    async def tracked(alloc):
+        for item in inputs:
+            await alloc.acall(op, item)
+
+    latencies, wall = asyncio.run(timed())
+    with AllocTracker() as alloc:
+        asyncio.run(tracked(alloc))
+    return _summary(name, latencies, wall, ops_per_call, alloc.summary(len(inputs) * ops_per_call))
+
+
+# ---------- stages ----------
+
+def bench_dictionarize(msgs, args) -> list[dict]:
+    return [measure('dictionarize', client.dictionarize_data, msgs)]
+
+
+def bench_queue_codecs(msgs, args) -> list[dict]:
+    rows = decode_rows(msgs)
+    results = []
+    for codec_name in ('json', 'msgpack'):
+        codec = CODECS[codec_name]
+        pairs = list(zip(msgs, rows))
+        payloads = [codec.encode(msg, row) for msg, row in pairs]
+        results.append(measure(f'queue_{codec_name}_encode', lambda pair: codec.encode(*pair), pairs))
+        results.append(measure(f'queue_{codec_name}_decode', decode_payload, payloads))
+    return results
+
+
+def bench_batcher_add(msgs, args) -> list[dict]:
+    rows = decode_rows(msgs)
+    num_producers = args.producers
+
+    async def no_op_flush(rows, acks):
+        # yield once, like a real flush would
+        await asyncio.sleep(0)
+
+    async def contended(timed: bool, alloc: AllocTracker = None):
+        batcher = DBBatcher(no_op_flush, name='bench', max_batch_size=500, batch_interval=0.01, max_inflight=2)
+        batcher._controller = None
+        run_task = asyncio.create_task(batcher.run())
+        perf_counter_ns = time.perf_counter_ns
+        latencies = []
+
+        async def producer(my_rows):
+            add = batcher.add
+            for i, row in enumerate(my_rows):
+                if timed:
+                    t0 = perf_counter_ns()
+                    add(row)
+                    latencies.append(perf_counter_ns() - t0)
+                else:
+                    alloc.call(add, row)
+                if i % 16 == 0:
+                    # let the other producers + the flush loop in
+                    await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(producer(rows[i::num_producers]) for i in range(num_producers)))
+        wall = time.perf_counter() - start
+        run_task.cancel()
+        await batcher.close()
+        return latencies, wall
+
+    latencies, wall = asyncio.run(contended(True))
+    with AllocTracker() as alloc:
+        asyncio.run(contended(False, alloc))
+    result = _summary('batcher_add', latencies, wall, 1, alloc.summary(len(rows)))
+    result['producers'] = num_producers
+    return [result]
+
+
+class RecordingCopy:
+    # what `cur.copy()` gives `BinaryCopyWriter`, rows are dumped with psycopg's binary dumpers + kept as bytes
+    def __init__(self):
+        self.records = []
+        self._tx = Transformer()
+
+    def set_types(self, types):
+        oids = [postgres.types.get(name).oid for name in types]
+        self._tx.set_dumper_types(oids, Format.BINARY)
+        self._formats = [Format.BINARY] * len(oids)
+
+    async def write_row(self, row):
+        self.records.append(self._tx.dump_sequence(row, self._formats))
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.copies = []
+
+    @asynccontextmanager
+    async def copy(self, sql: str):
+        copy = RecordingCopy()
+        yield copy
+        self.copies.append((sql, copy.records))
+
+
+def bench_copy_encode(msgs, args) -> list[dict]:
+    rows = decode_rows(msgs)
+    size = args.copy_batch
+    batches = [rows[i:i + size] for i in range(0, len(rows), size)]
+
+    async def write(batch):
+        cur = RecordingCursor()
+        await TELEMETRY_COPY.write(cur, batch)
+
+    # sanity: every column got dumped
+    cur = RecordingCursor()
+    asyncio.run(TELEMETRY_COPY.write(cur, batches[0]))
+    assert len(cur.copies[0][1][0]) == len(rows[0])
+
+    result = measure_async('copy_encode', write, batches, ops_per_call=size)
+    result['copy_batch'] = size
+    return [result]
+
+
+def bench_backend_validate(msgs, args) -> list[dict]:
+    telem_dicts = [row_to_dict(row) for row in decode_rows(msgs)]
+    adapter = TypeAdapter(backend.TelemetryData)
+
+    def validate_dump(telem_dict):
+        return adapter.validate_python(telem_dict).model_dump_json()
+
+    return [measure('backend_validate', validate_dump, telem_dicts)]
+
+
+def bench_timestamps(msgs, args) -> list[dict]:
+    def convert(ts):
+        # per row: datetime for COPY, epoch ns for the latency histogram + pipeline spans
+        return to_datetime(ts), to_epoch_ns(ts)
+
+    iso = [msg.timestamp for msg in msgs]
+    ns = [to_epoch_ns(ts) for ts in iso]
+    assert [convert(ts) for ts in iso[:3]] == [convert(ts) for ts in ns[:3]]
+    return [measure('timestamp_iso', convert, iso), measure('timestamp_ns', convert, ns)]
+
+
+STAGES = {
+    'dictionarize': bench_dictionarize,
+    'queue_codecs': bench_queue_codecs,
+    'batcher_add': bench_batcher_add,
+    'copy_encode': bench_copy_encode,
+    'backend_validate': bench_backend_validate,
+    'timestamps': bench_timestamps,
+}
+
+
+# ---------- baseline ----------
+
+def median_run(same_name: tuple) -> dict:
+    # the run with the median ops/s (a real run, so its latencies + allocations go together)
+    ranked = sorted(same_name, key=lambda r: r['ops_per_sec'])
+    result = dict(ranked[len(ranked) // 2])
+    result['ops_per_sec_runs'] = [r['ops_per_sec'] for r in same_name]
+    return result
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    # -> regression messages (median ops/s only)
+    base_by_name = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = base_by_name.get(result['name'])
+        if base is None:
+            continue
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{result['name']}: ops/s {result['ops_per_sec']:,.0f} vs baseline {base['ops_per_sec']:,.0f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # settings default to the baseline's (then `DEFAULT_SETTINGS`)
+    parser.add_argument('--num-msgs', type=int)
+    parser.add_argument('--repeat', type=int, help="runs per stage, the median one (by ops/s) is kept")
+    parser.add_argument('--producers', type=int, help="concurrent producer tasks for batcher_add")
+    parser.add_argument('--copy-batch', type=int, help="rows per COPY for copy_encode")
+    parser.add_argument('--only', nargs='+', choices=list(STAGES), help="run just these stages")
+    parser.add_argument('--timestamps', choices=['ns', 'iso'], help="iso: messages without `timestamp_ns`, like an older server.cpp")
+    parser.add_argument('--output', help="write results as JSON here")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown before flagging a regression")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run to --baseline instead of comparing")
+    args = parser.parse_args()
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    base_settings = baseline.get('settings', {}) if baseline else {}
+    for key, default in DEFAULT_SETTINGS.items():
+        if getattr(args, key) is None:
+            setattr(args, key, base_settings.get(key, default))
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+
+    msgs = make_messages(args.num_msgs, timestamp_ns=args.timestamps == 'ns')
+    results = []
+    for stage in args.only or STAGES:
+        runs = [STAGES[stage](msgs, args) for _ in range(args.repeat)]
+        # per result name, the median run
+        for same_name in zip(*runs):
+            results.append(median_run(same_name))
+
+    print(f"{args.num_msgs} msgs ({args.timestamps} timestamps), median of {args.repeat} runs")
+    print(f"  {'stage':<22} {'ops/s':>12} {'p50 us':>10} {'p99 us':>10} {'peak B/op':>10} {'kept B/op':>10}")
+    for r in results:
+        print(f"  {r['name']:<22} {r['ops_per_sec']:12,.0f} {r['p50_us']:10.2f} {r['p99_us']:10.2f} {r['alloc_peak_bytes_per_op']:10.1f} {r['alloc_retained_bytes_per_op']:10.1f}")
+
+    run = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'machine': platform.platform(),
+        'settings': settings,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"results -> {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"baseline saved -> {args.baseline}")
+        return
+
+    if baseline is None:
+        print(f"no baseline at {args.baseline} (run with --save-baseline)")
+        return
+    if base_settings != settings:
+        differ = ', '.join(f"{key} {settings[key]} (baseline {base_settings.get(key)})" for key in settings if base_settings.get(key) != settings[key])
+        print(f"not comparing, settings differ from the baseline: {differ}")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"REGRESSIONS (tolerance {args.tolerance:.0%}, baseline from {baseline['created']}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"no regressions vs baseline ({args.tolerance:.0%} tolerance)")
+
+
+if __name__ == "__main__":
+    main()
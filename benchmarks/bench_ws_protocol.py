@@ -0,0 +1,81 @@
+"""
+Benchmark: websocket protocols (`telemetry/ws_protocol.py`), JSON vs msgpack vs protobuf.
+
+For validated `TelemetryData` models (what `backend.py` broadcasts), per protocol:
+- encode time per msg (done once per protocol, however many clients, see `ConnectionManager.publish()`)
+- bytes/msg, alone and in frames of `--frame-size` msgs (frame coalescing), websocket frame header included
+- at `--rate` msgs/s: share of one core spent encoding, and MB/s on the wire per client
+
+usage (from repo root):
+    python benchmarks/bench_ws_protocol.py
+    python benchmarks/bench_ws_protocol.py --rate 50000 --frame-size 100 --repeat 5
+"""
+import argparse
+import time
+import statistics
+
+from bench_decoder import add_to_python_path, make_messages, file_dir_path
+
+add_to_python_path(file_dir_path + "/../telemetry")
+add_to_python_path(file_dir_path + "/../telemetry/proto")
+
+from pydantic import TypeAdapter
+
+from decoder import decode_rows, row_to_dict
+from backend import TelemetryData
+from ws_protocol import PROTOCOLS, BINARY_FRAMERS, encode_telem, frame_text
+
+
+def time_per_msg(func, num_msgs: int, repeat: int) -> float:
+    # median seconds per message
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) / num_msgs)
+    return statistics.median(results)
+
+
+def ws_header_size(payload_len: int) -> int:
+    # server -> client frames aren't masked: 2 bytes, + 2 or 8 for the extended length
+    if payload_len < 126:
+        return 2
+    if payload_len < 65536:
+        return 4
+    return 10
+
+
+def wire_bytes(frame) -> int:
+    size = len(frame.encode()) if isinstance(frame, str) else len(frame)
+    return size + ws_header_size(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-msgs', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=10000, help='msgs/s broadcast, for the core share + MB/s columns')
+    parser.add_argument('--frame-size', type=int, default=50, help='msgs per coalesced frame')
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(TelemetryData)
+    telem_dicts = [adapter.validate_python(row_to_dict(row)) for row in decode_rows(make_messages(args.num_msgs))]
+    frame_size = args.frame_size
+
+    print(f"{args.num_msgs} msgs x {args.repeat} repeats, {args.rate:.0f} msgs/s, {frame_size} msgs/frame")
+    print(f"  {'protocol':<10} {'encode us/msg':>14} {'bytes/msg':>10} {'framed b/msg':>13} {'core %':>8} {'MB/s':>8} {'MB/s framed':>12}")
+    for protocol in PROTOCOLS:
+        encoded = [encode_telem(telem_dict, protocol) for telem_dict in telem_dicts]
+        encode = time_per_msg(lambda: [encode_telem(telem_dict, protocol) for telem_dict in telem_dicts], args.num_msgs, args.repeat)
+
+        framer = BINARY_FRAMERS.get(protocol, frame_text)
+        frames = [framer(encoded[i:i + frame_size]) for i in range(0, len(encoded), frame_size)]
+        bytes_per_msg = sum(wire_bytes(message) for message in encoded) / len(encoded)
+        framed_per_msg = sum(wire_bytes(frame) for frame in frames) / len(encoded)
+
+        print(f"  {protocol:<10} {encode * 1e6:14.2f} {bytes_per_msg:10.1f} {framed_per_msg:13.1f} {encode * args.rate * 100:8.1f}"
+              f" {bytes_per_msg * args.rate / 1e6:8.2f} {framed_per_msg * args.rate / 1e6:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,15 +23,26 @@ export default function StreamButton() {
     const [userMsg, setUserMsg] = useState("<3");
     const url = useRef<HTMLInputElement | null>(null);
     const client_id = useRef<HTMLInputElement | null>(null);
+    const max_fps = useRef<HTMLInputElement | null>(null);
 
     // var latency_total = 0
     // var msg_count = 0
 
     const onMessage = (event: MessageEvent) => {
-        const telem_dict = JSON.parse(String(event));
+        // one message, or an array of them when the backend coalesces frames (WS_FRAME_INTERVAL_MS / max_fps)
+        const parsed = JSON.parse(String(event));
+        const msgs = Array.isArray(parsed) ? parsed : [parsed];
         setUserMsg(event);
 
-        const time_sent = Date.parse(telem_dict['reading_timestamp']);
+        // latency of the newest telemetry reading in the frame (metrics, acks etc. don't have one)
+        const telem_dict = msgs.findLast((msg) => msg !== null && typeof msg === 'object' && 'reading_timestamp' in msg);
+        if (telem_dict === undefined) {
+            return;
+        }
+
+        // epoch ns (number) from client.py, ISO string from older servers
+        const reading_timestamp = telem_dict['reading_timestamp'];
+        const time_sent = typeof reading_timestamp === 'number' ? reading_timestamp / 1e6 : Date.parse(reading_timestamp);
         const time_received = Date.now();
 
         const time_diff_s = (time_received - time_sent) / 1000;
@@ -47,7 +58,7 @@ export default function StreamButton() {
         postLatency(time_diff_s)
     };
 
-    const stream_conn = StreamConnection(url, client_id, setUserMsg, onMessage);
+    const stream_conn = StreamConnection(url, client_id, max_fps, setUserMsg, onMessage);
     return (
         <div className="flex flex-col space-y-8">
             <div>
@@ -58,6 +69,10 @@ export default function StreamButton() {
                 <p>client id</p>
                 <input className="border-2 border-pink-200 p-2 rounded-[10pt]" defaultValue={"dashboard_uwu"} ref={client_id}></input>
             </div>
+            <div>
+                <p>max frames per second (empty == as fast as the backend sends)</p>
+                <input className="border-2 border-pink-200 p-2 rounded-[10pt]" defaultValue={""} ref={max_fps}></input>
+            </div>
             <ToggleButton/>
             <p>{userMsg}</p>
         </div>
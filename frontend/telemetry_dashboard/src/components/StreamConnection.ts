@@ -9,6 +9,7 @@ import { AppState } from '../store/store';
 export function StreamConnection(
     url: RefObject<HTMLInputElement | null>,
     client_id: RefObject<HTMLInputElement | null>,
+    max_fps: RefObject<HTMLInputElement | null>,
     setUserMsg: React.Dispatch<SetStateAction<string>>,
     onMessage: (event: MessageEvent) => void
 ) {
@@ -29,7 +30,9 @@ export function StreamConnection(
             // want to start streaming
             try {
 
-                const url_constructed = `${url.current?.value}?client_id=${client_id.current?.value}`;
+                // max_fps: backend coalesces messages into array frames, at most this many a second
+                const fps = max_fps.current?.value;
+                const url_constructed = `${url.current?.value}?client_id=${client_id.current?.value}` + (fps ? `&max_fps=${fps}` : "");
                 console.log("Trying to connect to url:", url_constructed);
 
 
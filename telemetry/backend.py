@@ -1,5 +1,9 @@
+import os
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import time
+from functools import partial
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -8,15 +12,42 @@ from typing import Union, Literal, Annotated, Optional
         
 import asyncio
 
+import msgpack
+
 from prometheus_client import start_http_server, Histogram
 
+from pipeline_trace import TRACER
+from pipeline_log import setup_logging, SampledLog, ThroughputSummary
+from sampling_profiler import SamplingProfiler
+from connection_manager import ConnectionManager
+from ws_protocol import encode_telem, encode_metric
+from message_bus import make_bus
+from copy_writer import to_epoch_ns
+
+# knobs in `pipeline_log.py` (`BACKEND_LOG_LEVEL=DEBUG` for the per-message lines)
+log = setup_logging('backend')
+# "Broadcasting: ..." lines, sampled + rate limited
+msg_log = SampledLog(log)
+# msgs/s + bytes/s broadcast, errors, every `LOG_SUMMARY_INTERVAL_S`
+summary = ThroughputSummary(log, msg_log)
+# toggled with /debug/profile* (`BACKEND_DEBUG_ROUTES=1`) or SIGUSR2
+profiler = SamplingProfiler('backend')
+
+# knobs
+# first one of these that's free (with `--workers N`, every worker serves its own metrics)
+BACKEND_METRICS_PORT = int(os.environ.get('BACKEND_METRICS_PORT', 8002))
+BACKEND_METRICS_PORTS = int(os.environ.get('BACKEND_METRICS_PORTS', 16))
+# /debug/* routes, off by default: no auth, and this app is the public (CORS) one
+BACKEND_DEBUG_ROUTES = os.environ.get('BACKEND_DEBUG_ROUTES', '0') == '1'
+
 LATENCY_END_TO_END = Histogram('latency_end_to_end', 'Time (seconds) from data creation to reception on frontend.', buckets=[0.01, 0.02, 0.03, 0.04, 0.05, 0.07, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5, 0.8, 1, 2, 4, 6, 8, 10, 15, 20, 30, 50, 70, 100, 200])
 
 class Latency(BaseModel):
     latency: float
 
 class TelemetryBase(BaseModel):
-    reading_timestamp: str
+    # UTC epoch ns from `client.py` (`TelemetryResponse.timestamp_ns`), ISO8601 string from older servers
+    reading_timestamp: Union[int, str]
     sensor_id: str
     subsystem: str
     sequence_number: int
@@ -52,47 +83,36 @@ TelemetryData = Annotated[
 
 class MetricData(BaseModel):
     timestamp: str
+    # same instant, UTC epoch ns (None from older metrics clients)
+    timestamp_ns: Optional[int] = None
     metric_type: Literal['kpm', 'cpm', 'pxm', 'title']
     val: Union[int, float, str] # (kpm, cpm), pxm, title
 
+# for rebuilding (already validated) models from bus payloads
+_TELEM_MODELS = {'TEMPERATURE': TemperatureData, 'PRESSURE': PressureData, 'VELOCITY': VelocityData}
+# bus payloads (see `message_bus.py`): msgpack `[kind, [model dump, ...]]`
+_BUS_TELEM = 't'
+_BUS_METRIC = 'm'
+_BUS_NOTICE = 'n'
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        print("---- Connected websocket! ----")
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        print("---- Removed websocket! ----")
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        print("---- Trying to broadcast to websockets! ----")
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                # throw away bad connection!
-                print("------ Need to throw away bad connection! ------")
-                self.disconnect(connection)
-                print(e)
-                
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # on startup
     # start prometheus endpoint
-    server, t = start_http_server(8002)
+    server, t = start_metrics_server()
+    summary_task = asyncio.create_task(summary.run())
+    profiler.install_signal_toggle()
+    if bus is not None:
+        await bus.start(on_bus_message)
     
     yield
+    
+    summary_task.cancel()
+    if bus is not None:
+        await bus.close()
+    await manager.close()
 
     # on shutdown
     server.shutdown()
@@ -100,6 +120,9 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 manager = ConnectionManager()
+# `WS_BUS`: None == broadcast straight to this worker's websockets
+bus = make_bus()
+TRACER.add_depth('websockets', lambda: len(manager.active_connections))
 
 # add NextJS frontend for /latency
 app.add_middleware(
@@ -110,15 +133,134 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def start_metrics_server():
+    for port in range(BACKEND_METRICS_PORT, BACKEND_METRICS_PORT + BACKEND_METRICS_PORTS):
+        try:
+            server, t = start_http_server(port)
+        except OSError:
+            # another worker has it
+            continue
+        log.info(f"prometheus metrics on :{port}")
+        return server, t
+    raise RuntimeError(f"no free metrics port in {BACKEND_METRICS_PORT}-{BACKEND_METRICS_PORT + BACKEND_METRICS_PORTS - 1}")
+
+
+def telem_route(telem_dict) -> tuple:
+    # what subscriptions filter on (see `connection_manager.py`)
+    return (('telemetry_type', telem_dict.telemetry_type), ('subsystem', telem_dict.subsystem), ('sensor_id', telem_dict.sensor_id))
+
+
+def broadcast_telem(telem_dicts: list) -> int:
+    # routed per message, and only serialized if some websocket wants it (once per protocol, see `ws_protocol.py`)
+    # -> bytes encoded
+    nbytes = 0
+    for telem_dict in telem_dicts:
+        conns = manager.route(telem_route(telem_dict))
+        if not conns:
+            continue
+        msg_log.debug("Broadcasting: `%s`", telem_dict)
+        # keyed for the `coalesce` policy
+        nbytes += manager.publish(conns, partial(encode_telem, telem_dict), telem_dict.sensor_id)
+    return nbytes
+
+
+def broadcast_metric(metric_dict) -> int:
+    # to whoever subscribed to this metric_type
+    # -> bytes encoded
+    conns = manager.route((('metric_type', metric_dict.metric_type),))
+    if not conns:
+        return 0
+    msg_log.debug("Broadcasting: `%s`", metric_dict)
+    # several media titles can be current at once, don't let them replace each other
+    return manager.publish(conns, partial(encode_metric, metric_dict), key=metric_dict.metric_type if metric_dict.metric_type != 'title' else None)
+
+
+def fan_out(kind: str, items: list) -> None:
+    # to this worker's websockets
+    if kind == _BUS_TELEM:
+        summary.count(len(items), broadcast_telem(items))
+    elif kind == _BUS_METRIC:
+        summary.count(len(items), sum(broadcast_metric(metric_dict) for metric_dict in items))
+    else:
+        for notice in items:
+            manager.broadcast(json.dumps(notice))
+
+
+def dispatch(kind: str, items: list) -> None:
+    # through the bus (every worker, this one included, fans out), or straight to this worker's websockets
+    if bus is None:
+        fan_out(kind, items)
+        return
+    if kind != _BUS_NOTICE:
+        items = [item.model_dump() for item in items]
+    bus.publish(msgpack.packb([kind, items]))
+
+
+def on_bus_message(payload: bytes) -> None:
+    # validated by the worker that published them, no need to do it again
+    kind, items = msgpack.unpackb(payload)
+    if kind == _BUS_TELEM:
+        items = [_TELEM_MODELS[item['telemetry_type']].model_construct(**item) for item in items]
+    elif kind == _BUS_METRIC:
+        items = [MetricData.model_construct(**item) for item in items]
+    fan_out(kind, items)
+
+
+def trace_telem(telem_dicts: list, received_at: int, sent_at: Optional[int]):
+    # sampled messages only (see `pipeline_trace.py`), after the broadcast (== queued for every websocket, or in the bus outbox with `WS_BUS`)
+    # NOTE: `received_at` is after pydantic validation, so `http` includes it
+    # all epoch ns, seconds only for the histograms
+    sampled = [telem_dict for telem_dict in telem_dicts if TRACER.is_sampled(telem_dict.sequence_number)]
+    if not sampled:
+        return
+    done_at = time.time_ns()
+    for telem_dict in sampled:
+        telem_type = telem_dict.telemetry_type
+        if sent_at is not None:
+            TRACER.observe('http', telem_type, (received_at - sent_at) / 1e9)
+        TRACER.observe('broadcast', telem_type, (done_at - received_at) / 1e9)
+        TRACER.observe('total', telem_type, (done_at - to_epoch_ns(telem_dict.reading_timestamp)) / 1e9)
+
+
+async def get_debug_pipeline():
+    # live per-stage p50/p99 of the sampled messages + queue depths
+    return await TRACER.snapshot()
+
+
+async def get_debug_profile_start(interval_ms: float = 0):
+    started = profiler.start(interval_ms)
+    return {"started": started, "interval_ms": profiler.interval_s * 1000}
+
+
+async def get_debug_profile_stop():
+    # collapsed stacks (speedscope / flamegraph.pl)
+    return profiler.stop()
+
+
+async def get_debug_profile(seconds: float = 10, interval_ms: float = 0):
+    # sample for `seconds`, then return the collapsed stacks
+    try:
+        return await profiler.capture(seconds, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+if BACKEND_DEBUG_ROUTES:
+    app.get("/debug/pipeline")(get_debug_pipeline)
+    app.get("/debug/profile/start")(get_debug_profile_start)
+    app.get("/debug/profile/stop", response_class=PlainTextResponse)(get_debug_profile_stop)
+    app.get("/debug/profile", response_class=PlainTextResponse)(get_debug_profile)
+
+
 @app.post("/telem_data")
 async def post_telem_data(telem_dict: TelemetryData):
     # TODO: type enforce the telem dict with the type
     # print(telem_dict)
     
-    # broadcast new data to frontend via web socket connection
-    telem_json = telem_dict.model_dump_json()
-    print(f"Broadcasting: `{telem_json}`")
-    await manager.broadcast(f"{telem_json}")
+    received_at = time.time_ns()
+    # broadcast new data to frontend via web socket connection (queued per websocket, see `connection_manager.py`)
+    dispatch(_BUS_TELEM, [telem_dict])
+    trace_telem([telem_dict], received_at, None)
     
     return {
         "msg": "got it!<3",
@@ -127,19 +269,31 @@ async def post_telem_data(telem_dict: TelemetryData):
     }
     
 
+@app.post("/telem_data/batch")
+async def post_telem_data_batch(telem_dicts: list[TelemetryData], x_pipeline_sent_at_ns: Optional[int] = Header(None)):
+    # batched version of /telem_data, from `client.py`'s DashboardForwarder
+    received_at = time.time_ns()
+    dispatch(_BUS_TELEM, telem_dicts)
+    trace_telem(telem_dicts, received_at, x_pipeline_sent_at_ns)
+    
+    return {
+        "msg": "got it!<3",
+        "count": len(telem_dicts),
+    }
+    
+
 @app.post("/metric_data")
 async def post_metric_data(metric_dict: MetricData):
     # TODO: type enforce the telem dict with the type
     # print(telem_dict)
     
-    # broadcast new data to frontend via web socket connection
-    metric_json = metric_dict.model_dump_json()
-    print(f"Broadcasting: `{metric_json}`")
-    await manager.broadcast(f"{metric_json}")
+    # broadcast new data to frontend via web socket connection, to whoever subscribed to this metric_type
+    dispatch(_BUS_METRIC, [metric_dict])
     
     return {
         "msg": "got it!<3",
         "timestamp": metric_dict.timestamp,
+        "timestamp_ns": metric_dict.timestamp_ns,
         "metric_type": metric_dict.metric_type,
         "val": metric_dict.val,
     }
@@ -149,7 +303,7 @@ async def post_metric_data(metric_dict: MetricData):
 async def post_latency(data: Latency):
     LATENCY_END_TO_END.observe(data.latency)
     
-    print(f"Received frontend latency: {data.latency}")
+    msg_log.debug("Received frontend latency: %s", data.latency)
     
     return {
         "msg": "latency logged! <3",
@@ -160,17 +314,20 @@ async def post_latency(data: Latency):
 # directly from example:
 #   https://fastapi.tiangolo.com/advanced/websockets/#create-a-websocket
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    print("****** RECEIVED WS CONNECTION REQUEST *******")
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, client_id: str, max_fps: Optional[float] = Query(None, ge=0)):
+    # `max_fps`: array frames at most this often (see `connection_manager.py`)
+    log.info("****** RECEIVED WS CONNECTION REQUEST *******")
+    await manager.connect(websocket, client_id, max_fps)
     try:
         # need to await a receiving websocket call
             # in order for FastAPI to detect websocket disconnects or other exceptions
         while True:
-            await websocket.receive_text()
+            # control messages (`set_rate`...)
+            manager.handle_control(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        await manager.broadcast(f"Client '{client_id}' closed the stream.")
+        # as a JSON string, so it still fits in an array frame (every worker's websockets, with a bus)
+        dispatch(_BUS_NOTICE, [f"Client '{client_id}' closed the stream."])
     except Exception as e:
         manager.disconnect(websocket)
-        print(e)
\ No newline at end of file
+        log.error(f"websocket for client '{client_id}' failed: {e}")
\ No newline at end of file
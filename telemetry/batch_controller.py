@@ -0,0 +1,134 @@
+"""
+Adaptive batch size + flush interval for `DBBatcher`.
+
+Instead of hand tuning `MAX_BATCH_SIZE`/`BATCH_INTERVAL` against `db_insertion_seconds`,
+this adjusts them at runtime to hit a p95 insert latency target:
+- inputs: observed flush (COPY + commit) durations, arrival rate, rows still buffered (queue depth)
+- p95 over target --> shrink the batch (multiplicative decrease)
+- p95 comfortably under target + rows backing up --> grow the batch (additive-ish increase)
+- flush interval == time to fill a batch at the current arrival rate, clamped
+    - so slow streams (like kpm, 1 per minute) still get flushed every `max_interval`
+- after every change the latency window starts over, so one slow period doesn't get punished twice
+
+Chosen values are exported as gauges, to see why throughput changed.
+"""
+import os
+import math
+import time
+from collections import deque
+
+from prometheus_client import Gauge
+
+
+DB_BATCH_SIZE_TARGET = Gauge('db_batch_size_target', 'Batch size (rows) chosen by the adaptive batch controller.', ['batcher'])
+DB_BATCH_INTERVAL_TARGET = Gauge('db_batch_interval_seconds', 'Flush interval (seconds) chosen by the adaptive batch controller.', ['batcher'])
+DB_INSERT_P95 = Gauge('db_insert_p95_seconds', 'Recent p95 of flush (COPY + commit) duration, as seen by the adaptive batch controller.', ['batcher'])
+DB_ARRIVAL_RATE = Gauge('db_arrival_rows_per_second', 'Smoothed row arrival rate into the db batcher.', ['batcher'])
+
+# knobs
+DB_ADAPTIVE_BATCHING = os.environ.get('DB_ADAPTIVE_BATCHING', '1') == '1'
+DB_INSERT_P95_TARGET_S = float(os.environ.get('DB_INSERT_P95_TARGET_S', 0.25))
+DB_MIN_BATCH_SIZE = int(os.environ.get('DB_MIN_BATCH_SIZE', 10))
+DB_MAX_BATCH_SIZE_LIMIT = int(os.environ.get('DB_MAX_BATCH_SIZE_LIMIT', 50000))
+DB_MIN_BATCH_INTERVAL = float(os.environ.get('DB_MIN_BATCH_INTERVAL', 0.05))
+DB_MAX_BATCH_INTERVAL = float(os.environ.get('DB_MAX_BATCH_INTERVAL', 10))
+DB_CONTROLLER_WINDOW = int(os.environ.get('DB_CONTROLLER_WINDOW', 20))
+
+# p95 needs a few samples before it means anything
+_MIN_SAMPLES = 5
+_DECREASE_FACTOR = 0.75
+_INCREASE_FACTOR = 0.1
+# only grow when p95 is under this fraction of the target
+_HEADROOM = 0.8
+# EWMA weight of the newest arrival rate sample
+_RATE_ALPHA = 0.3
+
+
+class AdaptiveBatchController:
+
+    def __init__(self, name: str, target_p95_s: float = DB_INSERT_P95_TARGET_S, batch_size: int = DB_MIN_BATCH_SIZE, batch_interval: float = DB_MAX_BATCH_INTERVAL,
+                 min_batch_size: int = DB_MIN_BATCH_SIZE, max_batch_size: int = DB_MAX_BATCH_SIZE_LIMIT,
+                 min_interval: float = DB_MIN_BATCH_INTERVAL, max_interval: float = DB_MAX_BATCH_INTERVAL, window: int = DB_CONTROLLER_WINDOW):
+        self.name = name
+        self.target_p95_s = target_p95_s
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self.batch_size = min(max(batch_size, min_batch_size), max_batch_size)
+        self.batch_interval = min(max(batch_interval, min_interval), max_interval)
+
+        self._durations = deque(maxlen=window)
+        self._arrivals = 0
+        self._rate_since = time.monotonic()
+        self.arrival_rate = 0.0
+
+        self._export(None)
+
+    def observe_arrivals(self, num_rows: int) -> None:
+        self._arrivals += num_rows
+
+    def p95(self):
+        if not self._durations:
+            return None
+        durations = sorted(self._durations)
+        return durations[max(0, math.ceil(0.95 * len(durations)) - 1)]
+
+    def _update_arrival_rate(self):
+        now = time.monotonic()
+        elapsed = now - self._rate_since
+        if elapsed <= 0:
+            return
+        rate = self._arrivals / elapsed
+        if self.arrival_rate == 0.0:
+            self.arrival_rate = rate
+        else:
+            self.arrival_rate = _RATE_ALPHA * rate + (1 - _RATE_ALPHA) * self.arrival_rate
+        self._arrivals = 0
+        self._rate_since = now
+
+    def observe_flush(self, num_rows: int, duration_s: float, queue_depth: int) -> None:
+        """
+        Called after every flush.
+        - `queue_depth`: rows that piled up in the buffer meanwhile
+        """
+        self._durations.append(duration_s)
+        self._update_arrival_rate()
+
+        p95 = self.p95()
+        if len(self._durations) >= _MIN_SAMPLES:
+            new_size = self.batch_size
+            if p95 > self.target_p95_s:
+                new_size = int(self.batch_size * _DECREASE_FACTOR)
+            elif p95 < self.target_p95_s * _HEADROOM and queue_depth >= self.batch_size:
+                new_size = self.batch_size + max(1, int(self.batch_size * _INCREASE_FACTOR))
+            new_size = min(max(new_size, self.min_batch_size), self.max_batch_size)
+
+            if new_size != self.batch_size:
+                self.batch_size = new_size
+                # fresh evidence for the new size
+                self._durations.clear()
+
+        # time to fill one batch at the current rate
+        if self.arrival_rate > 0:
+            interval = self.batch_size / self.arrival_rate
+        else:
+            interval = self.max_interval
+        self.batch_interval = min(max(interval, self.min_interval), self.max_interval)
+
+        self._export(p95)
+
+    def _export(self, p95):
+        DB_BATCH_SIZE_TARGET.labels(self.name).set(self.batch_size)
+        DB_BATCH_INTERVAL_TARGET.labels(self.name).set(self.batch_interval)
+        DB_ARRIVAL_RATE.labels(self.name).set(self.arrival_rate)
+        if p95 is not None:
+            DB_INSERT_P95.labels(self.name).set(p95)
+
+
+def make_controller(name: str, batch_size: int, batch_interval: float):
+    # None when `DB_ADAPTIVE_BATCHING=0`, then the batcher just keeps its static knobs
+    if not DB_ADAPTIVE_BATCHING:
+        return None
+    return AdaptiveBatchController(name, batch_size=batch_size, batch_interval=batch_interval)
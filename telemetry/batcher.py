@@ -0,0 +1,185 @@
+"""
+Double-buffered db batcher.
+
+Replaces the old `db_buffer` / `did_max_out` / `db_buffer_lock` globals in `client.py`,
+where the lock was held for the whole COPY + commit (so nothing could be added meanwhile).
+- `add()` / `add_many()` never await, ingestion never waits on postgres
+- a flush swaps in an empty buffer (no await in between == the whole critical section), then COPYs the full one in its own task
+- flushes on whichever comes first:
+    - `max_batch_size` rows buffered
+    - the oldest buffered row is `batch_interval` seconds old
+    - `request_flush()`
+- at most `max_inflight` flushes at once, rows keep piling into the buffer while all of them are busy
+- batch size + interval are retuned after every flush by `AdaptiveBatchController` (unless `DB_ADAPTIVE_BATCHING=0`)
+- with a `Spool` (`spool.py`), nothing is dropped while postgres is down:
+    - a failed flush goes to the spool (fsync'd, then its acks are acked, the rows are durable now)
+    - past `DB_MAX_BUFFERED_ROWS` (all flushes stuck), the buffer itself goes to the spool instead of growing
+"""
+import os
+import logging
+import time
+import asyncio
+
+from prometheus_client import Gauge
+
+from batch_controller import make_controller
+
+log = logging.getLogger('DBBatcher')
+
+
+DB_BUFFERED_ROWS = Gauge('db_batcher_buffered_rows', 'Rows waiting in the db batcher buffer.', ['batcher'])
+DB_INFLIGHT_FLUSHES = Gauge('db_batcher_inflight_flushes', 'Db flushes (COPY + commit) currently running.', ['batcher'])
+
+# knobs
+# in seconds
+BATCH_INTERVAL = float(os.environ.get('DB_BATCH_INTERVAL', 10))
+MAX_BATCH_SIZE = int(os.environ.get('DB_MAX_BATCH_SIZE', 20))
+DB_MAX_INFLIGHT_FLUSHES = int(os.environ.get('DB_MAX_INFLIGHT_FLUSHES', 2))
+# only with a spool
+DB_MAX_BUFFERED_ROWS = int(os.environ.get('DB_MAX_BUFFERED_ROWS', 100000))
+
+
+class DBBatcher:
+    """
+    `flush_rows(rows, acks)` is the async callback that actually writes a batch.
+    - `acks` are whatever tokens were handed in with the rows (like redis stream entry ids),
+        so they can be acked only once their rows are committed
+        - (or spooled, then it's called with no rows, just the acks)
+        - raising means the rows are NOT committed (they get spooled), so a failed ack after the commit must not raise
+    - `spool`: optional `Spool` for failed + overflow batches
+    """
+
+    def __init__(self, flush_rows, name: str = 'telemetry', max_batch_size: int = MAX_BATCH_SIZE, batch_interval: float = BATCH_INTERVAL, max_inflight: int = DB_MAX_INFLIGHT_FLUSHES, spool=None, max_buffered_rows: int = DB_MAX_BUFFERED_ROWS):
+        self._flush_rows = flush_rows
+        self.name = name
+        self.spool = spool
+        self.max_buffered_rows = max_buffered_rows
+        self.max_batch_size = max_batch_size
+        self.batch_interval = batch_interval
+        self._controller = make_controller(name, max_batch_size, batch_interval)
+
+        self._buffer = []
+        self._buffer_acks = []
+        # monotonic time of the oldest buffered row
+        self._oldest = None
+        self._flush_requested = False
+
+        self._wakeup = asyncio.Event()
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._flush_tasks = set()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def add(self, row: tuple, ack=None) -> None:
+        self.add_many((row,), (ack,) if ack is not None else None)
+
+    def add_many(self, rows, acks=None) -> None:
+        was_empty = not self._buffer and not self._buffer_acks
+        num_before = len(self._buffer)
+        self._buffer.extend(rows)
+        if self._controller is not None:
+            self._controller.observe_arrivals(len(self._buffer) - num_before)
+        if acks:
+            self._buffer_acks.extend(acks)
+        if was_empty:
+            # start the age timer
+            self._oldest = time.monotonic()
+            self._wakeup.set()
+        elif len(self._buffer) >= self.max_batch_size:
+            self._wakeup.set()
+        if self.spool is not None and len(self._buffer) >= self.max_buffered_rows:
+            # every flush is stuck, park the buffer on disk instead of holding it all in memory
+            rows, acks = self._swap()
+            self._spool_rows(rows, acks)
+        DB_BUFFERED_ROWS.labels(self.name).set(len(self._buffer))
+
+    def request_flush(self) -> None:
+        self._flush_requested = True
+        self._wakeup.set()
+
+    def _is_due(self) -> bool:
+        if self._oldest is None:
+            return False
+        return (
+            self._flush_requested
+            or len(self._buffer) >= self.max_batch_size
+            or time.monotonic() - self._oldest >= self.batch_interval
+        )
+
+    def _swap(self):
+        # the whole critical section, no awaits in here
+        rows, self._buffer = self._buffer, []
+        acks, self._buffer_acks = self._buffer_acks, []
+        self._oldest = None
+        self._flush_requested = False
+        DB_BUFFERED_ROWS.labels(self.name).set(0)
+        return rows, acks
+
+    def _spool_rows(self, rows: list, acks: list):
+        # on disk for real before the entries leave the PEL
+        self.spool.append(rows, sync=bool(acks))
+        if acks:
+            task = asyncio.create_task(self._ack_spooled(acks))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _ack_spooled(self, acks: list):
+        try:
+            await self._flush_rows([], acks)
+        except Exception as e:
+            log.error(f"[{self.name}] ack of {len(acks)} spooled rows failed: {e}")
+
+    async def _flush(self, rows: list, acks: list):
+        DB_INFLIGHT_FLUSHES.labels(self.name).inc()
+        start = time.perf_counter()
+        try:
+            await self._flush_rows(rows, acks)
+            if self._controller is not None and rows:
+                self._controller.observe_flush(len(rows), time.perf_counter() - start, len(self._buffer))
+                self.max_batch_size = self._controller.batch_size
+                self.batch_interval = self._controller.batch_interval
+        except Exception as e:
+            if self.spool is None:
+                log.error(f"[{self.name}] flush of {len(rows)} rows failed, dropping them: {e}")
+            else:
+                log.error(f"[{self.name}] flush of {len(rows)} rows failed, spooling them: {e}")
+                try:
+                    self._spool_rows(rows, acks)
+                except Exception as spool_e:
+                    log.error(f"[{self.name}] spooling {len(rows)} rows failed, dropping them: {spool_e}")
+        finally:
+            DB_INFLIGHT_FLUSHES.labels(self.name).dec()
+            self._inflight.release()
+
+    async def run(self):
+        log.info(f"[{self.name}] Starting!")
+        while True:
+            if self._oldest is None:
+                timeout = None
+            else:
+                timeout = max(0.0, self._oldest + self.batch_interval - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if not self._is_due():
+                continue
+
+            # bounded in-flight flushes, the buffer keeps filling while we wait here
+            await self._inflight.acquire()
+            rows, acks = self._swap()
+            task = asyncio.create_task(self._flush(rows, acks))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def close(self):
+        # flush whatever is left, and wait for every running flush
+        if self._buffer or self._buffer_acks:
+            await self._inflight.acquire()
+            rows, acks = self._swap()
+            await self._flush(rows, acks)
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks)
@@ -1,23 +1,10 @@
-import typing
-import json
-from pprint import pprint
-import time
-from datetime import datetime, timezone
-from dateutil.parser import isoparse
-import dateutil
-from functools import wraps
-
-import dateutil.utils
-import requests
 import asyncio
 
-import grpc
-from google.protobuf.json_format import MessageToDict
-
 # for protobuf bug
 # https://github.com/grpc/grpc/issues/29459
 import sys
 import os
+import logging
 def add_to_python_path(new_path):
     existing_path = sys.path
     absolute_path = os.path.abspath(new_path)
@@ -31,53 +18,57 @@ add_to_python_path(file_dir_path + "/proto")
 from proto import telemetry_pb2
 from proto import telemetry_pb2_grpc
 
-import psycopg
+from decoder import decode_row, decode_rows, row_to_dict
+from redis_queue import RedisBatchProducer, pop_batch, REDIS_QUEUE_KEY
+from redis_stream import RedisStreamProducer, RedisStreamConsumer, REDIS_STREAM_KEY, REDIS_STREAM_CONSUMER
+from queue_codec import get_codec, decode_payload
+from forwarder import DashboardForwarder
+from batcher import DBBatcher
+from db_pool import make_pool
+from pipeline import make_db_flusher, run_spool_replayer, DB_CONN_KWARGS
+from sharding import ShardSupervisor
+from hybrid_queue import HybridQueue
+from spool import make_spool
+from grpc_resume import SensorDedupIndex, reconnecting_stream
+from pipeline_trace import TRACER, run_debug_server
+from pipeline_log import setup_logging, SampledLog, ThroughputSummary
+from sampling_profiler import SamplingProfiler
+
 import redis.asyncio as aioredis
 
-from prometheus_client import start_http_server, Histogram, Gauge
+from prometheus_client import start_http_server, Histogram
 
 # prometheus metrics
 # TODO: tune the buckets..
-DB_INSERT_TIME = Histogram('db_insertion_seconds', 'Time (seconds) spent on inserting into database.', buckets=[0.007, 0.008, 0.0085, 0.009, 0.0092, 0.0094, 0.0096, 0.0098, 0.01, 0.011, 0.012, 0.015, 0.02, 0.08, 0.1, 0.2, 0.3, 0.4, 0.5, 0.8, 1.0, 2.0, 4.0, 10.0])
-    # mostly 0.0095
-LATENCY_TO_DB_INSERT = Histogram('latency_to_db_insert', 'Time from data creation to db insertion.', buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200])
-    # 4~6
-DATA_DICTIONARIZE_TIME = Histogram('data_dictionarize_seconds', 'Time (seconds) spent turning raw data from gRPC into a dictionary.', buckets=[0.007, 0.008, 0.0085, 0.009, 0.0092, 0.0094, 0.0096, 0.0098, 0.01, 0.011, 0.012, 0.015, 0.02, 0.08, 0.1, 0.2])
-    # mostly 0.0095
-REDIS_QUEUE_LENGTH = Gauge('redis_queue_len', 'Length of Redis queue, indicating backpressure from gRPC server.')
-    # 1 - 11 (at start)
+DATA_DICTIONARIZE_TIME = Histogram('data_dictionarize_seconds', 'Time (seconds) spent turning raw data from gRPC into a db row.', buckets=[0.000001, 0.0000025, 0.000005, 0.0000075, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0095, 0.01, 0.015, 0.02, 0.08, 0.1, 0.2])
+    # mostly 0.0095 with MessageToDict(), now a few microseconds with `decoder.py`
+# NOTE: `redis_queue_len` and `redis_msgs_per_round_trip` live in `redis_queue.py`, `db_insertion_seconds` and `latency_to_db_insert` in `pipeline.py`
 
 
 DEBUG = False
 
-DB_ALL_COLS = [
-    'reading_timestamp',
-    'telemetry_type',
-    'sensor_id',
-    'subsystem',
-    'sequence_number',
-    'status_bitmask',
-    
-    'temperature',
-    'temp_unit',
-    
-    'pressure',
-    'pressure_unit',
-    'leak_detected',
-    
-    'velocity_x',
-    'velocity_y',
-    'velocity_z',
-    'velocity_unit',
-    'vibration_magnitude'
-]
+# `setup_logging('client')` in __main__, knobs in `pipeline_log.py` (`CLIENT_LOG_LEVEL=DEBUG` for the per-message lines)
+log = logging.getLogger('client')
+# "Received [...]" lines, sampled + rate limited
+msg_log = SampledLog(log)
+# msgs/s, bytes/s (off the wire), errors, every `LOG_SUMMARY_INTERVAL_S`
+summary = ThroughputSummary(log, msg_log)
+# toggled on the debug server (`/debug/profile*`) or with SIGUSR2
+profiler = SamplingProfiler('client')
+
+# NOTE: batch size/interval knobs (`DB_MAX_BATCH_SIZE`, `DB_BATCH_INTERVAL`) live in `batcher.py`
 
-# in seconds
-BATCH_INTERVAL = 10
-MAX_BATCH_SIZE = 20
-db_buffer = []
-did_max_out = False
+# `list` : single `queue:telemetry` list, one reader
+# `stream` : redis stream + consumer group, run as many `client.py` workers as needed
+# `hybrid` : in-process queue straight to the batcher, spills to the redis list only under backpressure (see `hybrid_queue.py`)
+# `sharded` : no redis, `INGEST_SHARDS` worker processes partitioned by sensor_id (see `sharding.py`)
+QUEUE_MODE = os.environ.get('QUEUE_MODE', 'list')
 
+# `GetTelemetryBatchStream`: the server coalesces readings into batches, the whole pipeline works on batches
+# (`GRPC_BATCH_STREAM=0` for the old one message per gRPC message stream)
+GRPC_BATCH_STREAM = os.environ.get('GRPC_BATCH_STREAM', '1') == '1'
+GRPC_BATCH_SIZE = int(os.environ.get('GRPC_BATCH_SIZE', 256))
+GRPC_LINGER_MS = int(os.environ.get('GRPC_LINGER_MS', 5))
 
 # NOTE: replaced with Prometheus :)
 # def timing_decorator(func):
@@ -92,76 +83,14 @@ did_max_out = False
 #     return wrapper
 
 @DATA_DICTIONARIZE_TIME.time()
-def dictionarize_data(telem_response) -> dict:
-    def process_unknown_data():
-        raise NotImplementedError(f"Data processing not implemented for telemetry type: {telem_response.type}")
+def dictionarize_data(telem_response) -> tuple:
+    # straight to a db row (`DB_ALL_COLS` order), no more MessageToDict()!
+    return decode_row(telem_response)
 
-    telem_dict = MessageToDict(telem_response, always_print_fields_with_no_presence=True)
-    
-    # remap keys/headers from .proto to sql table
-    db_data = {
-        'reading_timestamp': telem_dict.get('timestamp'),
-        'telemetry_type': None,
-        'sensor_id': None,
-        'subsystem': None,
-        'sequence_number': None,
-        'status_bitmask': None,
-        # temp only
-        'temperature': None,
-        'temp_unit': None,
-        # pressure only
-        'pressure': None,
-        'pressure_unit': None,
-        'leak_detected': None,
-        # velo only
-        'velocity_x': None,
-        'velocity_y': None,
-        'velocity_z': None,
-        'velocity_unit': None,
-        'vibration_magnitude': None
-    }
-    
-    if 'temperature' in telem_dict:
-        db_data['telemetry_type'] = 'TEMPERATURE'
-        temp_data = telem_dict['temperature']
-        db_data.update({
-            'sensor_id': temp_data.get('sensorId'),
-            'subsystem': temp_data.get('subsystem'),
-            'temperature': temp_data.get('temperature'),
-            'temp_unit': temp_data.get('unit'),
-            'status_bitmask': temp_data.get('statusBitmask'),
-            'sequence_number': temp_data.get('sequenceNumber')
-        })
-        
-    elif 'pressure' in telem_dict:
-        db_data['telemetry_type'] = 'PRESSURE'
-        pressure_data = telem_dict['pressure']
-        db_data.update({
-            'sensor_id': pressure_data.get('sensorId'),
-            'subsystem': pressure_data.get('subsystem'),
-            'pressure': pressure_data.get('pressure'),
-            'pressure_unit': pressure_data.get('unit'),
-            'status_bitmask': pressure_data.get('statusBitmask'),
-            'leak_detected': pressure_data.get('leakDetected'),
-            'sequence_number': pressure_data.get('sequenceNumber')
-        })
-        
-    elif 'velocity' in telem_dict:
-        db_data['telemetry_type'] = 'VELOCITY'
-        velocity_data = telem_dict['velocity']
-        db_data.update({
-            'sensor_id': velocity_data.get('sensorId'),
-            'subsystem': velocity_data.get('subsystem'),
-            'velocity_x': velocity_data.get('velocityX'),
-            'velocity_y': velocity_data.get('velocityY'),
-            'velocity_z': velocity_data.get('velocityZ'),
-            'velocity_unit': velocity_data.get('unit'),
-            'vibration_magnitude': velocity_data.get('vibrationMag'),
-            'status_bitmask': velocity_data.get('statusBitmask'),
-            'sequence_number': velocity_data.get('sequenceNumber')
-        })
-    
-    return db_data
+@DATA_DICTIONARIZE_TIME.time()
+def dictionarize_batch(telem_responses) -> list[tuple]:
+    # NOTE: observes once per batch, not once per message
+    return decode_rows(telem_responses)
 
 async def process_data(telem_dict) -> dict:
     # TODO: do some dummy processing for testing
@@ -169,132 +98,251 @@ async def process_data(telem_dict) -> dict:
     return telem_dict
 
 
-@DB_INSERT_TIME.time()
-async def push_to_db(aconn, cur, db_buffer):
-    # COPY insert via psycopg3
-    print("------- [ I T  I S  T I M E ] -------")
-    telem_headers = ','.join(DB_ALL_COLS)
-    
-    print(f"Committing {len(db_buffer)} rows...")
-    time_now = datetime.now(timezone.utc)
-    print(f"Now: {time_now}")
-    
-    sql = f"COPY telemetry_data ({telem_headers}) FROM STDIN;"
-    async with cur.copy(sql) as copy:
-        for record in db_buffer:
-            time_record = isoparse(record[0])
-            time_diff = time_now - time_record
-            LATENCY_TO_DB_INSERT.observe(time_diff.total_seconds())
-            
-            await copy.write_row(record)
-            
-    await aconn.commit()
-    print("------- [ I T  I S  D O N E ] -------")
+def open_telemetry_stream(channel):
+    # get generated stub
+    stub = telemetry_pb2_grpc.TelemetryServiceStub(channel)
+    return stub.GetTelemetryStream(telemetry_pb2.TelemetryRequest())
+
+
+def open_telemetry_batch_stream(channel):
+    stub = telemetry_pb2_grpc.TelemetryServiceStub(channel)
+    return stub.GetTelemetryBatchStream(telemetry_pb2.TelemetryRequest(max_batch_size=GRPC_BATCH_SIZE, linger_ms=GRPC_LINGER_MS))
+
 
-async def run_db_batching(db_buffer_lock, aconn):
-    global db_buffer, did_max_out
+async def handle_telemetry_batch(telem_batch, dedup: SensorDedupIndex, codec, producer, hybrid: HybridQueue = None):
+    # one `TelemetryBatch`, as a batch all the way: decode_rows() -> one put_many() -> (reader) add_many() -> COPY
+    summary.count(len(telem_batch.responses), telem_batch.ByteSize())
+    is_duplicate = dedup.is_duplicate
+    telem_responses = [telem_response for telem_response in telem_batch.responses if not is_duplicate(telem_response)]
+    if not telem_responses:
+        return
+    msg_log.debug("Received [%s] (batch of %d)", telem_responses[-1].timestamp, len(telem_responses))
     
-    print("[run_db_batching] : Starting!")
-    async with aconn.cursor() as cur:
-        try:
-            while True:
-                async with db_buffer_lock:
-                    did_max_out = False
-                print("[run_db_batching] : Going to sleep...")
-                await asyncio.sleep(BATCH_INTERVAL)
-                print("[run_db_batching] : Woke up!")
-                async with db_buffer_lock:
-                    if not did_max_out:
-                        await push_to_db(aconn, cur, db_buffer)
-                        db_buffer.clear()
-        except Exception as e:
-            print(f"[ERROR] [run_db_batching] : {e}")
-
-
-async def add_to_batch(db_buffer_lock: asyncio.Lock, telem_dict: dict):
-    async with db_buffer_lock:
-        db_buffer.append(tuple(telem_dict.values()))
-
-async def run_grpc_stream():
-    global db_buffer
+    rows = dictionarize_batch(telem_responses)
+    TRACER.mark(rows, 'grpc')
+    
+    if hybrid is not None:
+        await hybrid.put_many(telem_responses, rows)
+        return
     
+    encode = codec.encode
+    await producer.put_many([encode(telem_response, row) for telem_response, row in zip(telem_responses, rows)])
+
+
+async def run_grpc_stream(hybrid: HybridQueue = None):
     # get redis db
-    r = aioredis.Redis(host='localhost', port=6379, decode_responses=True)
+    # binary payloads, see `queue_codec.py`
+    r = aioredis.Redis(host='localhost', port=6379, decode_responses=False)
+    codec = get_codec()
+    # batches LPUSHes (or XADDs) by count or time window
+    if hybrid is not None:
+        # only used when spilling
+        producer = hybrid.producer
+    elif QUEUE_MODE == 'stream':
+        producer = RedisStreamProducer(r)
+    else:
+        producer = RedisBatchProducer(r)
+    linger_task = asyncio.create_task(producer.run_linger())
+    # drops what a reconnect replays
+    dedup = SensorDedupIndex()
     
-    # connect to cpp server asynchronously
-    async with grpc.aio.insecure_channel('localhost:50051') as channel:
-        # get generated stub
-        stub = telemetry_pb2_grpc.TelemetryServiceStub(channel)
+    try:
+        if GRPC_BATCH_STREAM:
+            async for telem_batch in reconnecting_stream(open_telemetry_batch_stream):
+                await handle_telemetry_batch(telem_batch, dedup, codec, producer, hybrid)
+            return
         
-        stream = stub.GetTelemetryStream(telemetry_pb2.TelemetryRequest())
-    
-        try:
-            async for telem_response in stream:
-                print(f"Received [{telem_response.timestamp}]")
-                
-                # turn data into dictionary
-                telem_dict = dictionarize_data(telem_response)
-                
-                # jsonify
-                telem_json_str = json.dumps(telem_dict)
+        # reconnects (with backoff) whenever the cpp server or the channel drops
+        async for telem_response in reconnecting_stream(open_telemetry_stream):
+            summary.count(1, telem_response.ByteSize())
+            msg_log.debug("Received [%s]", telem_response.timestamp)
             
-                # add unprocessed data to redis queue
-                r_len = await r.lpush('queue:telemetry', telem_json_str)
-                
-                print(f"Length of redis queue now: {r_len}")
-                REDIS_QUEUE_LENGTH.set(r_len)
-                
-        except grpc.RpcError as e:
-            print(f"Oh no! gRPC error: {e}")
-        # finally:
-            # no need to use .close() when using `with`
-            # channel.close()
-
-
-async def run_redis_reader(db_buffer_lock, aconn):
-    global did_max_out
+            if dedup.is_duplicate(telem_response):
+                continue
+            
+            # turn data into db row
+            row = dictionarize_data(telem_response)
+            TRACER.mark((row,), 'grpc')
+            
+            if hybrid is not None:
+                # straight to the reader, unless it's falling behind
+                await hybrid.put(telem_response, row)
+                continue
+            
+            # pack for redis (REDIS_QUEUE_CODEC)
+            payload = codec.encode(telem_response, row)
+        
+            # add unprocessed data to redis queue (sent with the next batch)
+            await producer.put(payload)
+            
+    finally:
+        # don't lose whatever is still buffered for redis
+        linger_task.cancel()
+        await producer.flush()
+
+
+async def run_sharded_grpc_stream(supervisor: ShardSupervisor):
+    # `QUEUE_MODE=sharded`: no decoding here, just route the raw messages to the shard workers
+    linger_task = asyncio.create_task(supervisor.run_linger())
+    dedup = SensorDedupIndex()
     
-    r = aioredis.Redis(host='localhost', port=6379, decode_responses=True)
+    try:
+        if GRPC_BATCH_STREAM:
+            # still per message here, every reading can go to a different shard
+            async for telem_batch in reconnecting_stream(open_telemetry_batch_stream):
+                summary.count(len(telem_batch.responses), telem_batch.ByteSize())
+                for telem_response in telem_batch.responses:
+                    if not dedup.is_duplicate(telem_response):
+                        await supervisor.route(telem_response)
+            return
+        
+        async for telem_response in reconnecting_stream(open_telemetry_stream):
+            summary.count(1, telem_response.ByteSize())
+            if dedup.is_duplicate(telem_response):
+                continue
+            await supervisor.route(telem_response)
+    finally:
+        linger_task.cancel()
+        await supervisor.flush()
+
+
+async def run_sharded():
+    supervisor = ShardSupervisor()
+    supervisor.start()
+    supervise_task = asyncio.create_task(supervisor.run_supervisor())
+    summary_task = asyncio.create_task(summary.run())
+    # the parent (router) only, shard workers aren't profiled
+    debug_task = asyncio.create_task(run_debug_server(profiler=profiler))
+    try:
+        await run_sharded_grpc_stream(supervisor)
+    finally:
+        supervise_task.cancel()
+        summary_task.cancel()
+        debug_task.cancel()
+        # workers flush their own batchers before exiting
+        await asyncio.to_thread(supervisor.stop)
+
+
+async def run_redis_reader(batcher: DBBatcher, forwarder: DashboardForwarder):
+    r = aioredis.Redis(host='localhost', port=6379, decode_responses=False)
     while True:
-        async with aconn.cursor() as cur:
-            # block until get data from redis queue
-            _, telem_json_str = await r.brpop('queue:telemetry')
-            telem_dict = json.loads(telem_json_str)
-            # print(f"Popped from redis queue: {telem_dict}")
+        # block until get data from redis queue, then drain up to REDIS_POP_BATCH_SIZE at once
+        payloads = await pop_batch(r)
+        # any codec version (incl. old json entries) -> db row
+        rows = [decode_payload(payload) for payload in payloads]
+        TRACER.mark(rows, 'queue', since='grpc')
+        # print(f"Popped from redis queue: {rows}")
+        
+        # do some processing (dummy for now)
+        # telem_dict = await process_data(telem_dict)
+                        
+        # add whole batch to db batcher (never waits on the db)
+        batcher.add_many(rows)
+                        
+        # /POST to dashboard backend (batched + async, see `forwarder.py`)
+        forwarder.submit(row_to_dict(row) for row in rows)
+
+
+async def run_hybrid_reader(hybrid: HybridQueue, batcher: DBBatcher, forwarder: DashboardForwarder):
+    # `QUEUE_MODE=hybrid`: same as run_redis_reader, rows mostly come from memory
+    while True:
+        rows = await hybrid.get_batch()
+        if not rows:
+            continue
+        TRACER.mark(rows, 'queue', since='grpc')
+        batcher.add_many(rows)
+        forwarder.submit(row_to_dict(row) for row in rows)
+
+
+async def run_stream_reader(stream_consumer: RedisStreamConsumer, batcher: DBBatcher, forwarder: DashboardForwarder):
+    # `QUEUE_MODE=stream`: same as run_redis_reader, but as one consumer of a consumer group
+    await stream_consumer.ensure_group()
+    monitor_task = asyncio.create_task(stream_consumer.run_monitor())
+    
+    try:
+        while True:
+            entries = await stream_consumer.read_batch()
+            if not entries:
+                continue
+            # trimmed entries have no payload, just ack them with the rest
+            entry_ids = [entry_id for entry_id, _ in entries]
+            rows = [decode_payload(payload) for _, payload in entries if payload is not None]
+            TRACER.mark(rows, 'queue', since='grpc')
+            
+            # entry ids ride along with the rows, XACKed after the commit
+            batcher.add_many(rows, entry_ids)
             
-            # do some processing (dummy for now)
-            # telem_dict = await process_data(telem_dict)
-                            
-            # add to db batch list
-            await add_to_batch(db_buffer_lock, telem_dict)
-            async with db_buffer_lock:
-                if len(db_buffer) >= MAX_BATCH_SIZE:
-                    did_max_out = True
-                    await push_to_db(aconn, cur, db_buffer)
-                    db_buffer.clear()
-                            
-            # /POST to dashboard backend
-            dashboard_response = requests.post(url='http://127.0.0.1:8000/telem_data', json=telem_dict)
+            # /POST to dashboard backend (batched + async, see `forwarder.py`)
+            forwarder.submit(row_to_dict(row) for row in rows)
+    finally:
+        monitor_task.cancel()
 
 
 async def main():
-    db_buffer_lock = asyncio.Lock()
+    profiler.install_signal_toggle()
+    if QUEUE_MODE == 'sharded':
+        # every shard has its own db pool + forwarder
+        await run_sharded()
+        return
+    
+    forwarder = DashboardForwarder()
     
-    # connect to db
-    async with await psycopg.AsyncConnection.connect(
-        dbname='telemetry',
-        user='mirujun',
-        password='',
-        host='localhost'
-    ) as aconn:
-        await asyncio.gather(run_grpc_stream(), run_db_batching(db_buffer_lock, aconn), run_redis_reader(db_buffer_lock, aconn))
+    # connect to db (pool, `DB_POOL_MIN_SIZE`/`DB_POOL_MAX_SIZE`)
+    async with make_pool('telemetry', **DB_CONN_KWARGS) as pool:
+        # failed/overflow batches go to disk instead of being dropped (`SPOOL_ENABLED=0` to turn off)
+        # several stream workers can share a host (+ SPOOL_DIR), each gets its own spool (a fixed REDIS_STREAM_CONSUMER keeps it across restarts)
+        spool = make_spool(f"telemetry-{REDIS_STREAM_CONSUMER}" if QUEUE_MODE == 'stream' else 'telemetry')
+        if QUEUE_MODE == 'stream':
+            stream_consumer = RedisStreamConsumer(aioredis.Redis(host='localhost', port=6379, decode_responses=False))
+            batcher = DBBatcher(make_db_flusher(pool, stream_consumer), spool=spool)
+            reader = run_stream_reader(stream_consumer, batcher, forwarder)
+            grpc_stream = run_grpc_stream()
+        elif QUEUE_MODE == 'hybrid':
+            hybrid = HybridQueue(aioredis.Redis(host='localhost', port=6379, decode_responses=False))
+            await hybrid.start()
+            batcher = DBBatcher(make_db_flusher(pool), spool=spool)
+            reader = run_hybrid_reader(hybrid, batcher, forwarder)
+            grpc_stream = run_grpc_stream(hybrid)
+        else:
+            batcher = DBBatcher(make_db_flusher(pool), spool=spool)
+            reader = run_redis_reader(batcher, forwarder)
+            grpc_stream = run_grpc_stream()
+        
+        # for /debug/pipeline, next to the per-stage latencies
+        r = aioredis.Redis(host='localhost', port=6379, decode_responses=False)
+        if QUEUE_MODE == 'stream':
+            TRACER.add_depth('redis_stream', lambda: r.xlen(REDIS_STREAM_KEY))
+        else:
+            TRACER.add_depth('redis_list', lambda: r.llen(REDIS_QUEUE_KEY))
+        if QUEUE_MODE == 'hybrid':
+            TRACER.add_depth('hybrid_queue', lambda: len(hybrid))
+        TRACER.add_depth('db_batcher', lambda: len(batcher))
+        TRACER.add_depth('forward_outbox', lambda: len(forwarder))
+        if spool is not None:
+            TRACER.add_depth('spool_bytes', lambda: len(spool))
+        
+        try:
+            await asyncio.gather(
+                grpc_stream,
+                batcher.run(),
+                reader,
+                forwarder.run(),
+                run_spool_replayer(spool, pool),
+                run_debug_server(profiler=profiler),
+                summary.run()
+            )
+        finally:
+            await batcher.close()
+            if spool is not None:
+                spool.close()
     
 
 if __name__ == "__main__":
+    setup_logging('client')
     # start prometheus endpoint
     server, t = start_http_server(8001)
     
     asyncio.run(main())
     
     server.shutdown()
-    t.join()
\ No newline at end of file
+    t.join()
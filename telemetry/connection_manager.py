@@ -0,0 +1,481 @@
+"""
+Websocket fan-out for `backend.py`.
+
+`broadcast()` used to await `send_text()` on every socket in turn, so one slow browser held up every other viewer
+(and the `POST /telem_data` that `client.py` was waiting on). Now:
+- every connection gets a bounded outbound queue + its own writer task
+    - `broadcast()` is a plain (non async) enqueue per client, it never waits on a socket
+- slow consumer policy (`WS_SLOW_CONSUMER_POLICY`), once a client's queue is at `WS_SEND_QUEUE_SIZE`:
+    - `drop_oldest` (default): oldest pending message goes, the new one is queued
+    - `coalesce`: a message with a `key` (sensor_id, metric_type...) replaces the pending one with the same key,
+        so a lagging viewer gets the latest reading instead of a backlog. Otherwise like `drop_oldest`
+    - `disconnect`: the client is closed (1013, "try again later"), it can reconnect and start fresh
+- a send stuck for more than `WS_SEND_TIMEOUT_S` drops the client too
+- per client `ws_send_queue_depth` (read at scrape time) and `ws_dropped_msgs` (by reason)
+- frame coalescing: with a frame interval, everything pending goes out as one JSON array frame (`[msg, msg, ...]`)
+    at most once per interval, instead of a frame per message
+    - `WS_FRAME_INTERVAL_MS` for everyone (0 == off, a frame per message like before)
+    - a client can ask for fewer frames: `/ws?client_id=...&max_fps=10`, or `{"type": "set_rate", "max_fps": 10}` later on
+        - interval == the longer of the two, so a client can slow itself down but not go past the server's
+    - with the `coalesce` policy, a frame has at most one reading per sensor
+- control messages from the client (JSON text): `handle_control()`, answered with `{"type": "ack", ...}` / `{"type": "error", ...}`
+- `ws_frames` per client + `ws_msgs_per_frame` histogram
+- subscriptions (`SubscriptionIndex`): a client only gets what matches one of its filters
+    - `{"type": "subscribe", "id": "engine", "filter": {"subsystem": "ENGINE", "telemetry_type": ["TEMPERATURE", "PRESSURE"]}}`
+        - fields: `telemetry_type`, `subsystem`, `sensor_id`, `metric_type`. AND across fields, OR within a field's list
+        - `"filter": {}` == everything
+    - `{"type": "unsubscribe", "id": "engine"}` (no `id` == all of them)
+    - a client that never subscribed gets everything (like before). Once it has, only its subscriptions count
+    - messages are published with a route (`(("telemetry_type", ...), ("subsystem", ...), ("sensor_id", ...))`),
+        `route()` looks up who wants it in the inverted index (cached per route), and the caller can skip encoding
+        a message nobody wants
+- opt-in binary protocols, negotiated with the websocket subprotocol at connect time (`ws_protocol.py`)
+    - `telemetry.json` / none (default), `telemetry.msgpack`, `telemetry.proto`
+    - `publish()` encodes a message once per protocol among its recipients, every client on that protocol shares the result
+    - with frame coalescing, binary messages go out as one binary frame (msgpack array / `TelemetryBatch`)
+        and text ones (acks, notices, metrics for `telemetry.proto`) as a JSON array frame, next to it
+"""
+import os
+import json
+import asyncio
+import logging
+import itertools
+import collections
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from ws_protocol import negotiate, frame_text, BINARY_FRAMERS
+
+log = logging.getLogger('ConnectionManager')
+
+
+WS_CLIENTS = Gauge('ws_clients', 'Connected websocket clients.')
+WS_SEND_QUEUE_DEPTH = Gauge('ws_send_queue_depth', 'Messages waiting in a websocket client\'s outbound queue.', ['client'])
+WS_DROPPED_MSGS = Counter('ws_dropped_msgs', 'Messages a websocket client never got, by reason (drop_oldest, coalesced, disconnect).', ['client', 'reason'])
+WS_SLOW_DISCONNECTS = Counter('ws_slow_consumer_disconnects', 'Websocket clients dropped for not keeping up (full queue or stuck send).')
+WS_FRAMES = Counter('ws_frames', 'Websocket frames sent to a client.', ['client'])
+WS_PROTOCOL_CLIENTS = Gauge('ws_protocol_clients', 'Connected websocket clients per negotiated protocol.', ['protocol'])
+WS_SUBSCRIPTIONS = Gauge('ws_subscriptions', 'Websocket subscriptions (filters), all clients.')
+WS_MSGS_PER_FRAME = Histogram('ws_msgs_per_frame', 'Messages per websocket frame (1 without frame coalescing).', buckets=[1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000])
+
+# knobs
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', 1024))
+WS_SLOW_CONSUMER_POLICY = os.environ.get('WS_SLOW_CONSUMER_POLICY', 'drop_oldest')
+WS_SEND_TIMEOUT_S = float(os.environ.get('WS_SEND_TIMEOUT_S', 5))
+WS_FRAME_INTERVAL_MS = float(os.environ.get('WS_FRAME_INTERVAL_MS', 0))
+# routes (~ sensors + metric types) remembered by `SubscriptionIndex.route()`
+WS_ROUTE_CACHE_SIZE = int(os.environ.get('WS_ROUTE_CACHE_SIZE', 65536))
+
+POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+
+FILTER_FIELDS = ('telemetry_type', 'subsystem', 'sensor_id', 'metric_type')
+_TELEMETRY_FIELDS = frozenset(('telemetry_type', 'subsystem', 'sensor_id'))
+
+# websocket close code for a slow consumer
+_CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class ClientConnection:
+    """
+    One websocket + its outbound queue, drained by `run()` (the writer task).
+    - pending messages are an OrderedDict: `key -> message`, oldest first
+        - messages without a key get a unique one, so only `coalesce` ever replaces anything
+    - a message is a `str` (text frame) or `bytes` (binary frame), already encoded for `protocol`
+    """
+
+    def __init__(self, websocket, label: str, manager, max_queue: int, policy: str, send_timeout: float, frame_interval: float = 0, max_fps: float = None, protocol: str = 'json'):
+        self.websocket = websocket
+        self.label = label
+        self.protocol = protocol
+        self._manager = manager
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        # seconds, the server's (`WS_FRAME_INTERVAL_MS`) before the client asks for anything
+        self._server_frame_interval = frame_interval
+        self.frame_interval = frame_interval
+        self.max_fps = None
+        self.set_max_fps(max_fps)
+
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+        self._ready = asyncio.Event()
+        # set by `enqueue()` under the disconnect policy, the writer does the actual close
+        self.overflowed = False
+        self.task = None
+        WS_SEND_QUEUE_DEPTH.labels(label).set_function(lambda: len(self._pending))
+        self._dropped = {}
+        self._frames = WS_FRAMES.labels(label)
+        # for subscriptions without an `id`
+        self.sub_ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def set_max_fps(self, max_fps: float = None) -> None:
+        # None/0 == back to the server's interval
+        if max_fps is not None and max_fps < 0:
+            raise ValueError(f"max_fps must be >= 0, got {max_fps}")
+        self.max_fps = max_fps or None
+        self.frame_interval = max(self._server_frame_interval, 1 / max_fps if max_fps else 0)
+
+    def _drop(self, reason: str, n: int = 1) -> None:
+        counter = self._dropped.get(reason)
+        if counter is None:
+            counter = self._dropped[reason] = WS_DROPPED_MSGS.labels(self.label, reason)
+        counter.inc(n)
+
+    def enqueue(self, message, key=None) -> None:
+        if self.overflowed:
+            return
+        pending = self._pending
+        if key is not None and self.policy == 'coalesce' and key in pending:
+            # newer reading for something the client hasn't even been sent yet
+            pending[key] = message
+            self._drop('coalesced')
+            return
+        if len(pending) >= self.max_queue:
+            if self.policy == 'disconnect':
+                # nothing else gets sent, the writer closes as soon as its current send is done
+                self.overflowed = True
+                self._drop('disconnect', len(pending) + 1)
+                pending.clear()
+                self._ready.set()
+                return
+            pending.popitem(last=False)
+            self._drop('drop_oldest')
+        pending[next(self._seq) if key is None or self.policy != 'coalesce' else key] = message
+        self._ready.set()
+
+    async def _send(self, frame, n_msgs: int) -> None:
+        # `asyncio.timeout()`, not `wait_for()`: no extra task per send
+        async with asyncio.timeout(self.send_timeout):
+            if isinstance(frame, bytes):
+                await self.websocket.send_bytes(frame)
+            else:
+                await self.websocket.send_text(frame)
+        self._frames.inc()
+        WS_MSGS_PER_FRAME.observe(n_msgs)
+
+    async def run(self):
+        websocket = self.websocket
+        pending = self._pending
+        loop = asyncio.get_running_loop()
+        next_frame = 0
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                if self.overflowed:
+                    log.warning(f"[{self.label}] send queue full ({self.max_queue}), disconnecting slow consumer")
+                    WS_SLOW_DISCONNECTS.inc()
+                    async with asyncio.timeout(self.send_timeout):
+                        await websocket.close(code=_CLOSE_TRY_AGAIN_LATER)
+                    return
+
+                if not self.frame_interval:
+                    # a frame per message
+                    while pending:
+                        _, message = pending.popitem(last=False)
+                        await self._send(message, 1)
+                    continue
+
+                # wait out the rest of this frame slot, whatever comes in meanwhile goes in the same frame
+                delay = next_frame - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.overflowed:
+                    # close on the next turn
+                    self._ready.set()
+                    continue
+                if not pending:
+                    continue
+                messages = list(pending.values())
+                pending.clear()
+                next_frame = loop.time() + self.frame_interval
+                if self.protocol == 'json':
+                    await self._send(frame_text(messages), len(messages))
+                    continue
+                # binary protocol: still text for acks/notices (+ metrics on `telemetry.proto`), a frame of each kind
+                binary = [message for message in messages if isinstance(message, bytes)]
+                if binary:
+                    await self._send(BINARY_FRAMERS[self.protocol](binary), len(binary))
+                if len(binary) < len(messages):
+                    text = [message for message in messages if not isinstance(message, bytes)]
+                    await self._send(frame_text(text), len(text))
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            log.warning(f"[{self.label}] send stuck for {self.send_timeout:.0f}s, disconnecting slow consumer")
+            WS_SLOW_DISCONNECTS.inc()
+        except Exception as e:
+            # throw away bad connection!
+            log.warning(f"------ Need to throw away bad connection! ------ [{self.label}] {e}")
+        finally:
+            self._manager.disconnect(websocket)
+
+    def close(self) -> None:
+        # metrics for this client go away with it
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self._pending.clear()
+        WS_SEND_QUEUE_DEPTH.remove(self.label)
+        WS_FRAMES.remove(self.label)
+        for reason in self._dropped:
+            WS_DROPPED_MSGS.remove(self.label, reason)
+
+
+class SubscriptionIndex:
+    """
+    Inverted index `(field, value) -> subscriptions`, so routing a message costs ~ the subscriptions that mention
+    one of its values, not every client.
+    - a subscription matches once all of its fields hit (counting: hits == number of fields it filters on)
+    - `(conn, None)` in `_match_all` == a client that never subscribed (gets everything)
+    """
+
+    def __init__(self, cache_size: int = WS_ROUTE_CACHE_SIZE):
+        # (conn, sub_id) -> (filter, number of fields)
+        self._subs = {}
+        # (field, value) -> {(conn, sub_id)}
+        self._index = {}
+        # empty filters + clients without any
+        self._match_all = set()
+        # route -> tuple of conns, dropped on every change
+        self._routes = {}
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return len(self._subs)
+
+    @staticmethod
+    def parse_filter(raw: dict) -> dict:
+        # -> {field: frozenset of values}, raises ValueError for anything off
+        if not isinstance(raw, dict):
+            raise ValueError(f"filter must be an object, got {raw!r}")
+        parsed = {}
+        for field, values in raw.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"unknown filter field {field!r}, expected some of {FILTER_FIELDS}")
+            if isinstance(values, str):
+                values = [values]
+            if not isinstance(values, list) or not values or not all(isinstance(value, str) for value in values):
+                raise ValueError(f"filter values for {field!r} must be a string or a non empty list of strings")
+            parsed[field] = frozenset(values)
+        if 'metric_type' in parsed and _TELEMETRY_FIELDS & parsed.keys():
+            raise ValueError("`metric_type` can't be combined with telemetry fields in one filter (nothing would match), subscribe twice")
+        return parsed
+
+    def add_client(self, conn) -> None:
+        self._match_all.add((conn, None))
+        self._routes.clear()
+
+    def subscribe(self, conn, sub_id, sub_filter: dict) -> None:
+        # replaces `sub_id` if the client already has it
+        self.unsubscribe(conn, sub_id)
+        # first subscription == no more "everything"
+        self._match_all.discard((conn, None))
+        sub = (conn, sub_id)
+        self._subs[sub] = (sub_filter, len(sub_filter))
+        if not sub_filter:
+            self._match_all.add(sub)
+        for field, values in sub_filter.items():
+            for value in values:
+                self._index.setdefault((field, value), set()).add(sub)
+        self._routes.clear()
+        WS_SUBSCRIPTIONS.set(len(self._subs))
+
+    def unsubscribe(self, conn, sub_id) -> int:
+        # -> how many were removed (`sub_id` None == all of the client's)
+        subs = [sub for sub in self._subs if sub[0] is conn] if sub_id is None else [(conn, sub_id)]
+        removed = 0
+        for sub in subs:
+            entry = self._subs.pop(sub, None)
+            if entry is None:
+                continue
+            removed += 1
+            self._match_all.discard(sub)
+            for field, values in entry[0].items():
+                for value in values:
+                    subscribers = self._index[(field, value)]
+                    subscribers.discard(sub)
+                    if not subscribers:
+                        del self._index[(field, value)]
+        if removed:
+            self._routes.clear()
+            WS_SUBSCRIPTIONS.set(len(self._subs))
+        return removed
+
+    def remove_client(self, conn) -> None:
+        self.unsubscribe(conn, None)
+        self._match_all.discard((conn, None))
+        self._routes.clear()
+
+    def filters(self, conn) -> dict:
+        # sub_id -> filter (lists, for JSON)
+        return {sub_id: {field: sorted(values) for field, values in sub_filter.items()} for (c, sub_id), (sub_filter, _) in self._subs.items() if c is conn}
+
+    def route(self, route: tuple) -> tuple:
+        """
+        -> every connection that wants a message with these `(field, value)` pairs (each once).
+        """
+        conns = self._routes.get(route)
+        if conns is not None:
+            return conns
+        matched = {conn for conn, _ in self._match_all}
+        index = self._index
+        hits = collections.Counter()
+        for pair in route:
+            subscribers = index.get(pair)
+            if subscribers:
+                hits.update(subscribers)
+        subs = self._subs
+        for sub, n in hits.items():
+            if n == subs[sub][1]:
+                matched.add(sub[0])
+        conns = tuple(matched)
+        if len(self._routes) >= self.cache_size:
+            self._routes.clear()
+        self._routes[route] = conns
+        return conns
+
+
+class ConnectionManager:
+
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_SIZE, policy: str = WS_SLOW_CONSUMER_POLICY, send_timeout: float = WS_SEND_TIMEOUT_S, frame_interval_ms: float = WS_FRAME_INTERVAL_MS):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown slow consumer policy {policy!r}, expected one of {POLICIES}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.frame_interval = frame_interval_ms / 1000
+        # websocket -> ClientConnection
+        self.active_connections: dict = {}
+        self.subscriptions = SubscriptionIndex()
+
+    def _label(self, client_id: str) -> str:
+        # same client_id from two tabs still gets two series
+        labels = {conn.label for conn in self.active_connections.values()}
+        label = client_id
+        n = 1
+        while label in labels:
+            n += 1
+            label = f"{client_id}#{n}"
+        return label
+
+    async def connect(self, websocket, client_id: str = 'anonymous', max_fps: float = None):
+        if max_fps is not None and max_fps < 0:
+            # before `accept()`, so the handshake fails
+            raise ValueError(f"max_fps must be >= 0, got {max_fps}")
+        # first subprotocol the client offered that we speak, JSON if none
+        subprotocol, protocol = negotiate(websocket.scope.get('subprotocols'))
+        await websocket.accept(subprotocol=subprotocol)
+        conn = ClientConnection(websocket, self._label(client_id), self, self.max_queue, self.policy, self.send_timeout, self.frame_interval, max_fps, protocol)
+        self.active_connections[websocket] = conn
+        self.subscriptions.add_client(conn)
+        conn.task = asyncio.create_task(conn.run())
+        WS_CLIENTS.set(len(self.active_connections))
+        WS_PROTOCOL_CLIENTS.labels(protocol).inc()
+        log.info(f"---- Connected websocket! ---- [{conn.label}] {protocol}{f', frame every {conn.frame_interval * 1000:.0f}ms' if conn.frame_interval else ''}")
+        return conn
+
+    def disconnect(self, websocket):
+        # safe to call twice (writer task + receive loop can both notice a dead socket)
+        conn = self.active_connections.pop(websocket, None)
+        if conn is None:
+            return
+        self.subscriptions.remove_client(conn)
+        conn.close()
+        WS_CLIENTS.set(len(self.active_connections))
+        WS_PROTOCOL_CLIENTS.labels(conn.protocol).dec()
+        log.info(f"---- Removed websocket! ---- [{conn.label}]")
+
+    def send_personal_message(self, message: str, websocket):
+        conn = self.active_connections.get(websocket)
+        if conn is not None:
+            conn.enqueue(message)
+
+    def handle_control(self, websocket, text: str) -> None:
+        """
+        A text message from the client, `{"type": ..., ...}`.
+        - `set_rate`: `{"type": "set_rate", "max_fps": 10}` (`max_fps` 0/null == server default)
+        - `subscribe` / `unsubscribe` (see the module docstring)
+        - answered (through the same queue) with an `ack` or an `error`
+        """
+        conn = self.active_connections.get(websocket)
+        if conn is None:
+            return
+        try:
+            control = json.loads(text)
+            handler = self._CONTROL_HANDLERS[control['type']]
+            reply = handler(self, conn, control)
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning(f"[{conn.label}] bad control message {text[:200]!r}: {e!r}")
+            conn.enqueue(json.dumps({'type': 'error', 'error': f"bad control message: {e!r}"}))
+            return
+        conn.enqueue(json.dumps({'type': 'ack', 'request': control['type'], **reply}))
+
+    def _set_rate(self, conn: ClientConnection, control: dict) -> dict:
+        conn.set_max_fps(control.get('max_fps'))
+        log.info(f"[{conn.label}] max_fps {conn.max_fps}, frame every {conn.frame_interval * 1000:.0f}ms")
+        return {'max_fps': conn.max_fps, 'frame_interval_ms': conn.frame_interval * 1000}
+
+    def _subscribe(self, conn: ClientConnection, control: dict) -> dict:
+        sub_filter = SubscriptionIndex.parse_filter(control.get('filter', {}))
+        sub_id = control.get('id')
+        if sub_id is None:
+            sub_id = f"sub{next(conn.sub_ids)}"
+        elif not isinstance(sub_id, str):
+            raise ValueError(f"subscription id must be a string, got {sub_id!r}")
+        self.subscriptions.subscribe(conn, sub_id, sub_filter)
+        log.info(f"[{conn.label}] subscribed {sub_id!r}: {control.get('filter', {})}")
+        return {'id': sub_id, 'subscriptions': self.subscriptions.filters(conn)}
+
+    def _unsubscribe(self, conn: ClientConnection, control: dict) -> dict:
+        removed = self.subscriptions.unsubscribe(conn, control.get('id'))
+        return {'id': control.get('id'), 'removed': removed, 'subscriptions': self.subscriptions.filters(conn)}
+
+    _CONTROL_HANDLERS = {
+        'set_rate': _set_rate,
+        'subscribe': _subscribe,
+        'unsubscribe': _unsubscribe,
+    }
+
+    def route(self, route: tuple = None) -> tuple:
+        # -> connections that want a message with this route (None == everyone, for notices)
+        if route is None:
+            return tuple(self.active_connections.values())
+        return self.subscriptions.route(route)
+
+    @staticmethod
+    def send(conns: tuple, message, key=None) -> None:
+        # O(1) per client, the writer tasks do the sending
+        # same `message` for everyone, whatever their protocol (notices, acks)
+        for conn in conns:
+            conn.enqueue(message, key)
+
+    @staticmethod
+    def publish(conns: tuple, encode, key=None) -> int:
+        """
+        Like `send()`, with `encode(protocol) -> str | bytes` called once per protocol among `conns`.
+        - every client on the same protocol gets the same encoded object
+        -> bytes encoded (once per protocol, not per client)
+        """
+        encoded = {}
+        nbytes = 0
+        for conn in conns:
+            protocol = conn.protocol
+            message = encoded.get(protocol)
+            if message is None:
+                message = encoded[protocol] = encode(protocol)
+                nbytes += len(message)
+            conn.enqueue(message, key)
+        return nbytes
+
+    def broadcast(self, message: str, key=None, route: tuple = None):
+        self.send(self.route(route), message, key)
+
+    async def close(self):
+        # on shutdown
+        for websocket in list(self.active_connections):
+            self.disconnect(websocket)
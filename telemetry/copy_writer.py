@@ -0,0 +1,137 @@
+"""
+Binary COPY writer for the db batchers (`client.py` and `metrics_client.py`).
+
+`COPY ... FROM STDIN (FORMAT BINARY)` with declared column types:
+- postgres doesn't have to parse any text (ISO timestamps, floats, enums...) again
+- timestamps go in as datetimes, each row's timestamp is converted at most once,
+    and that same value feeds the latency histogram (no more `isoparse()` per row just for Prometheus)
+    - accepts epoch nanoseconds (int, `timestamp_ns` from the protos), datetimes, ISO8601 strings or epoch seconds (float)
+    - epoch ns (the normal case) never gets parsed: integer math for the datetime, and for the latency (`time.time_ns()`)
+- enums are sent as "text": the binary format of a postgres enum is just its label
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+from decoder import DB_ALL_COLS
+
+
+# same order as DB_ALL_COLS, types from `data/telem.sql`
+TELEMETRY_COL_TYPES = [
+    'timestamptz',   # reading_timestamp
+    'text',          # telemetry_type (enum)
+    'text',          # sensor_id (varchar)
+    'text',          # subsystem (enum)
+    'int4',          # sequence_number
+    'int2',          # status_bitmask (smallint)
+
+    'float4',        # temperature (real)
+    'text',          # temp_unit
+
+    'float4',        # pressure
+    'text',          # pressure_unit
+    'bool',          # leak_detected
+
+    'float4',        # velocity_x
+    'float4',        # velocity_y
+    'float4',        # velocity_z
+    'text',          # velocity_unit
+    'float4',        # vibration_magnitude
+]
+
+# `val` column of the `metric_data_*` tables, from `data/metrics.sql`
+METRIC_VAL_TYPES = {
+    'kpm': 'int4',
+    # NOTE: cpm comes in as a float from metrics.proto, but the column is INTEGER
+    'cpm': 'int4',
+    'pxm': 'float4',
+    'title': 'text',
+}
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_datetime(value) -> datetime:
+    # whatever timestamp we got -> tz aware datetime
+    if isinstance(value, int):
+        # epoch ns, exact (no float on the way, postgres keeps microseconds anyway)
+        return EPOCH + timedelta(microseconds=value // 1000)
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str):
+        # C implementation, handles `Z` and `+00:00` (python 3.11+)
+        dt = datetime.fromisoformat(value)
+    else:
+        # epoch seconds
+        return datetime.fromtimestamp(value, timezone.utc)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def to_epoch_ns(value) -> int:
+    # whatever timestamp we got -> UTC epoch ns (free for the ints, a parse for the rest)
+    if isinstance(value, int):
+        return value
+    return (to_datetime(value) - EPOCH) // timedelta(microseconds=1) * 1000
+
+
+class BinaryCopyWriter:
+    """
+    - `ts_col`: index of the timestamp column, converted with `to_datetime()`
+    - `converters`: optional {col index: func} for values that don't match the column type as is
+    """
+
+    def __init__(self, table: str, columns: list[str], types: list[str], ts_col: int = 0, converters: dict = None):
+        self.table = table
+        self.columns = columns
+        self.types = types
+        self.ts_col = ts_col
+        self.converters = converters or {}
+        self.sql = f"COPY {table} ({','.join(columns)}) FROM STDIN (FORMAT BINARY)"
+
+    def _prepare(self, rows):
+        # -> (rows ready for COPY, creation time of each row in epoch ns)
+        ts_col = self.ts_col
+        converters = self.converters.items()
+        prepared = []
+        created_at = []
+        for row in rows:
+            row = list(row)
+            ts = row[ts_col]
+            if not isinstance(ts, int):
+                # ISO strings (older servers, old spool segments...), parsed once
+                ts = to_epoch_ns(ts)
+            row[ts_col] = EPOCH + timedelta(microseconds=ts // 1000)
+            for col, convert in converters:
+                if row[col] is not None:
+                    row[col] = convert(row[col])
+            prepared.append(row)
+            created_at.append(ts)
+        return prepared, created_at
+
+    async def write(self, cur, rows, latency_histogram=None) -> None:
+        """
+        COPY all `rows` through `cur` (commit is up to the caller).
+        - `latency_histogram`: observes (now - row timestamp) for every row
+        """
+        prepared, created_at = self._prepare(rows)
+
+        async with cur.copy(self.sql) as copy:
+            copy.set_types(self.types)
+            for row in prepared:
+                await copy.write_row(row)
+
+        if latency_histogram is not None:
+            time_now = time.time_ns()
+            for ts in created_at:
+                latency_histogram.observe((time_now - ts) / 1e9)
+
+
+TELEMETRY_COPY = BinaryCopyWriter('telemetry_data', DB_ALL_COLS, TELEMETRY_COL_TYPES)
+
+
+def metric_copy_writer(metric_type: str) -> BinaryCopyWriter:
+    # table names: `metric_data_kpm`, etc.
+    converters = {1: round} if metric_type == 'cpm' else None
+    return BinaryCopyWriter(f"metric_data_{metric_type}", ['reading_timestamp', 'val'], ['timestamptz', METRIC_VAL_TYPES[metric_type]], converters=converters)
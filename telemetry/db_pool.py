@@ -0,0 +1,74 @@
+"""
+Pooled postgres connections for the db writers (`client.py` and `metrics_client.py`).
+
+Instead of one `psycopg.AsyncConnection` shared by every coroutine (so every flush was serialized behind it):
+- `make_pool()` -> `psycopg_pool.AsyncConnectionPool`
+    - configurable min/max size
+    - health check on every checkout (`check_connection`), broken connections are replaced
+    - reconnects in the background if postgres goes away, for up to `DB_POOL_RECONNECT_TIMEOUT_S`
+- `borrow()` checks out a connection for the duration of one flush, commits on exit (rolls back on error)
+    - wait time and utilization are exported to Prometheus
+"""
+import os
+import time
+from contextlib import asynccontextmanager
+
+from psycopg_pool import AsyncConnectionPool
+
+from prometheus_client import Histogram, Gauge
+
+
+DB_POOL_WAIT_TIME = Histogram('db_pool_wait_seconds', 'Time (seconds) waiting to borrow a connection from the db pool.', ['pool'], buckets=[0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0])
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Connections currently borrowed from the db pool.', ['pool'])
+DB_POOL_SIZE = Gauge('db_pool_connections', 'Connections currently open in the db pool (in use + idle).', ['pool'])
+DB_POOL_UTILIZATION = Gauge('db_pool_utilization', 'Borrowed connections / max pool size.', ['pool'])
+
+# knobs
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 4))
+DB_POOL_TIMEOUT_S = float(os.environ.get('DB_POOL_TIMEOUT_S', 30))
+DB_POOL_MAX_IDLE_S = float(os.environ.get('DB_POOL_MAX_IDLE_S', 600))
+DB_POOL_RECONNECT_TIMEOUT_S = float(os.environ.get('DB_POOL_RECONNECT_TIMEOUT_S', 300))
+
+# borrowed connections per pool name, for the gauges
+_in_use = {}
+
+
+def make_pool(name: str, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE, **conn_kwargs) -> AsyncConnectionPool:
+    """
+    Not opened yet, use it as `async with make_pool(...) as pool:`
+    - `conn_kwargs`: same as `psycopg.AsyncConnection.connect()` (dbname, user, ...)
+    """
+    _in_use[name] = 0
+    return AsyncConnectionPool(
+        kwargs=conn_kwargs,
+        min_size=min_size,
+        max_size=max_size,
+        name=name,
+        open=False,
+        timeout=DB_POOL_TIMEOUT_S,
+        max_idle=DB_POOL_MAX_IDLE_S,
+        reconnect_timeout=DB_POOL_RECONNECT_TIMEOUT_S,
+        check=AsyncConnectionPool.check_connection,
+    )
+
+
+def _export(pool: AsyncConnectionPool):
+    in_use = _in_use[pool.name]
+    DB_POOL_IN_USE.labels(pool.name).set(in_use)
+    DB_POOL_SIZE.labels(pool.name).set(pool.get_stats().get('pool_size', 0))
+    DB_POOL_UTILIZATION.labels(pool.name).set(in_use / pool.max_size)
+
+
+@asynccontextmanager
+async def borrow(pool: AsyncConnectionPool):
+    start = time.perf_counter()
+    async with pool.connection() as aconn:
+        DB_POOL_WAIT_TIME.labels(pool.name).observe(time.perf_counter() - start)
+        _in_use[pool.name] += 1
+        _export(pool)
+        try:
+            yield aconn
+        finally:
+            _in_use[pool.name] -= 1
+            _export(pool)
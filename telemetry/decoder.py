@@ -0,0 +1,168 @@
+"""
+Direct protobuf -> db row decoding for `TelemetryResponse` messages.
+
+Replaces the old `MessageToDict()` path in `client.py`
+- the schema is already enforced by `telemetry.proto`, so just read the fields directly!!
+- `WhichOneof("data")` picks the per-type row builder
+- rows are plain tuples in `DB_ALL_COLS` order, ready for COPY
+- `reading_timestamp` is the int `timestamp_ns` (UTC epoch ns), never parsed again downstream
+    - the ISO `timestamp` string only if the server didn't set `timestamp_ns` (older `server.cpp`)
+"""
+# for protobuf bug
+# https://github.com/grpc/grpc/issues/29459
+# NOTE: plain `import telemetry_pb2` (not `from proto import ...`), since `metrics_client.py` has its own `proto` package
+import sys
+import os
+def add_to_python_path(new_path):
+    existing_path = sys.path
+    absolute_path = os.path.abspath(new_path)
+    if absolute_path not in existing_path:
+        sys.path.append(absolute_path)
+    return sys.path
+
+file_dir_path = os.path.dirname(os.path.realpath(__file__))
+add_to_python_path(file_dir_path + "/proto")
+
+import telemetry_pb2
+
+
+DB_ALL_COLS = [
+    'reading_timestamp',
+    'telemetry_type',
+    'sensor_id',
+    'subsystem',
+    'sequence_number',
+    'status_bitmask',
+
+    'temperature',
+    'temp_unit',
+
+    'pressure',
+    'pressure_unit',
+    'leak_detected',
+
+    'velocity_x',
+    'velocity_y',
+    'velocity_z',
+    'velocity_unit',
+    'vibration_magnitude'
+]
+
+# enum number -> name, same strings `MessageToDict()` used to give us (and what the sql enums expect)
+SYSTEM_NAMES = {val.number: val.name for val in telemetry_pb2.System.DESCRIPTOR.values}
+
+
+def _temperature_row(timestamp, data) -> tuple:
+    subsystem = data.subsystem
+    return (
+        timestamp,
+        'TEMPERATURE',
+        data.sensor_id,
+        SYSTEM_NAMES.get(subsystem, subsystem),
+        data.sequence_number,
+        data.status_bitmask,
+        # temp only
+        data.temperature,
+        data.unit,
+        # pressure only
+        None,
+        None,
+        None,
+        # velo only
+        None,
+        None,
+        None,
+        None,
+        None,
+    )
+
+def _pressure_row(timestamp, data) -> tuple:
+    subsystem = data.subsystem
+    return (
+        timestamp,
+        'PRESSURE',
+        data.sensor_id,
+        SYSTEM_NAMES.get(subsystem, subsystem),
+        data.sequence_number,
+        data.status_bitmask,
+        # temp only
+        None,
+        None,
+        # pressure only
+        data.pressure,
+        data.unit,
+        data.leak_detected,
+        # velo only
+        None,
+        None,
+        None,
+        None,
+        None,
+    )
+
+def _velocity_row(timestamp, data) -> tuple:
+    subsystem = data.subsystem
+    return (
+        timestamp,
+        'VELOCITY',
+        data.sensor_id,
+        SYSTEM_NAMES.get(subsystem, subsystem),
+        data.sequence_number,
+        data.status_bitmask,
+        # temp only
+        None,
+        None,
+        # pressure only
+        None,
+        None,
+        None,
+        # velo only
+        data.velocity_x,
+        data.velocity_y,
+        data.velocity_z,
+        data.unit,
+        data.vibration_mag,
+    )
+
+# oneof field name -> row builder
+_ROW_BUILDERS = {
+    'temperature': _temperature_row,
+    'pressure': _pressure_row,
+    'velocity': _velocity_row,
+}
+
+
+def decode_row(telem_response) -> tuple:
+    """
+    `TelemetryResponse` -> row tuple in `DB_ALL_COLS` order.
+    - raises NotImplementedError for a message with no (or an unknown) `data` oneof
+    """
+    which = telem_response.WhichOneof("data")
+    try:
+        build_row = _ROW_BUILDERS[which]
+    except KeyError:
+        raise NotImplementedError(f"Data processing not implemented for telemetry type: {telem_response.type}")
+    return build_row(telem_response.timestamp_ns or telem_response.timestamp, getattr(telem_response, which))
+
+
+def decode_rows(telem_responses) -> list[tuple]:
+    """
+    Batch version of `decode_row()` for a list of `TelemetryResponse`s.
+    - same ordering as the input
+    """
+    builders = _ROW_BUILDERS
+    rows = []
+    append = rows.append
+    for telem_response in telem_responses:
+        which = telem_response.WhichOneof("data")
+        try:
+            build_row = builders[which]
+        except KeyError:
+            raise NotImplementedError(f"Data processing not implemented for telemetry type: {telem_response.type}")
+        append(build_row(telem_response.timestamp_ns or telem_response.timestamp, getattr(telem_response, which)))
+    return rows
+
+
+def row_to_dict(row: tuple) -> dict:
+    # for json payloads (/telem_data), keyed like the db columns
+    return dict(zip(DB_ALL_COLS, row))
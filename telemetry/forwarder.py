@@ -0,0 +1,92 @@
+"""
+Non-blocking forwarding of telemetry from `client.py` to the dashboard backend (`backend.py`).
+
+- `submit()` never awaits, it only drops dicts into a bounded outbox
+    - if the outbox is full, the oldest dict is thrown away (same as `MetricQueue`), the db is the source of truth anyway
+- `run()` drains the outbox in batches and POSTs them to `/telem_data/batch`
+    - over one long-lived, pooled `aiohttp` session (keep-alive, no new connection per message)
+    - `X-Pipeline-Sent-At-Ns` header (epoch ns), so `backend.py` can time the hop (`pipeline_trace.py`)
+"""
+import os
+import logging
+import time
+import asyncio
+
+import aiohttp
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from pipeline_trace import TRACER, DICT_FIELDS
+
+log = logging.getLogger('DashboardForwarder')
+
+
+FORWARDED_MSGS = Counter('dashboard_forwarded_msgs', 'Telemetry messages forwarded to the dashboard backend, by result.', ['result'])
+FORWARD_OUTBOX_DEPTH = Gauge('dashboard_forward_outbox_depth', 'Messages waiting in the outbox to be forwarded to the dashboard backend.')
+FORWARD_POST_TIME = Histogram('dashboard_forward_post_seconds', 'Time (seconds) per batched POST to the dashboard backend.', buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0])
+
+# knobs
+DASHBOARD_URL = os.environ.get('DASHBOARD_URL', 'http://127.0.0.1:8000')
+FORWARD_OUTBOX_SIZE = int(os.environ.get('FORWARD_OUTBOX_SIZE', 10000))
+FORWARD_BATCH_SIZE = int(os.environ.get('FORWARD_BATCH_SIZE', 500))
+FORWARD_MAX_CONNECTIONS = int(os.environ.get('FORWARD_MAX_CONNECTIONS', 4))
+FORWARD_TIMEOUT_S = float(os.environ.get('FORWARD_TIMEOUT_S', 5))
+
+# wait a bit after a failed POST, so a dead backend doesn't get hammered
+_ERROR_BACKOFF_S = 0.5
+
+
+class DashboardForwarder:
+
+    def __init__(self, base_url: str = DASHBOARD_URL, outbox_size: int = FORWARD_OUTBOX_SIZE, batch_size: int = FORWARD_BATCH_SIZE, max_connections: int = FORWARD_MAX_CONNECTIONS):
+        self.url = f"{base_url}/telem_data/batch"
+        self.batch_size = batch_size
+        self.max_connections = max_connections
+        self._outbox = asyncio.Queue(maxsize=outbox_size)
+
+    def __len__(self):
+        return self._outbox.qsize()
+
+    def submit(self, telem_dicts) -> None:
+        # non blocking, safe to call from the hot path
+        for telem_dict in telem_dicts:
+            try:
+                self._outbox.put_nowait(telem_dict)
+            except asyncio.QueueFull:
+                # throw away oldest
+                self._outbox.get_nowait()
+                self._outbox.put_nowait(telem_dict)
+                FORWARDED_MSGS.labels('dropped').inc()
+        FORWARD_OUTBOX_DEPTH.set(self._outbox.qsize())
+
+    def _take_batch(self, first) -> list:
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._outbox.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def run(self):
+        log.info("Starting!")
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        timeout = aiohttp.ClientTimeout(total=FORWARD_TIMEOUT_S)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            while True:
+                # block until there's something to send, then grab everything else up to batch_size
+                batch = self._take_batch(await self._outbox.get())
+                FORWARD_OUTBOX_DEPTH.set(self._outbox.qsize())
+
+                TRACER.mark(batch, 'outbox', since='queue', fields=DICT_FIELDS)
+                try:
+                    with FORWARD_POST_TIME.time():
+                        headers = {'X-Pipeline-Sent-At-Ns': str(time.time_ns())}
+                        async with session.post(self.url, json=batch, headers=headers) as response:
+                            response.raise_for_status()
+                    FORWARDED_MSGS.labels('ok').inc(len(batch))
+                    TRACER.mark(batch, 'post', since='outbox', fields=DICT_FIELDS)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    log.error(f"{len(batch)} msgs not forwarded: {e}")
+                    FORWARDED_MSGS.labels('error').inc(len(batch))
+                    await asyncio.sleep(_ERROR_BACKOFF_S)
@@ -0,0 +1,100 @@
+"""
+Resumable gRPC telemetry stream for `client.py`.
+
+Used to be: "Oh no! gRPC error", return, and ingestion stops for good. Now:
+- `reconnecting_stream()` reopens the channel + stream whenever it drops (or the server ends it)
+    - jittered exponential backoff between attempts, reset once messages flow again
+- `SensorDedupIndex` drops replayed/duplicated messages before they reach Redis or the db
+    - last (`sequence_number`, `timestamp_ns`) per `sensor_id`
+    - a message is a duplicate if both are <= the last ones seen
+        - (a restarted server starts counting from 0 again, but with newer timestamps, so that's not a duplicate)
+    - LRU capped at `DEDUP_MAX_SENSORS` sensors, so memory stays bounded
+"""
+import os
+import logging
+import random
+import asyncio
+from collections import OrderedDict
+
+import grpc
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger('gRPC')
+
+
+GRPC_RECONNECTS = Counter('grpc_reconnects', 'Times the telemetry gRPC stream was reopened.')
+GRPC_CONNECTED = Gauge('grpc_stream_connected', '1 while the telemetry gRPC stream is open.')
+DEDUP_DROPPED = Counter('grpc_duplicate_msgs_dropped', 'Replayed/duplicate telemetry messages dropped by the per-sensor dedup index.')
+DEDUP_SENSORS = Gauge('grpc_dedup_index_sensors', 'Sensors tracked by the dedup index.')
+
+# knobs
+GRPC_TARGET = os.environ.get('GRPC_TARGET', 'localhost:50051')
+GRPC_BACKOFF_MIN_S = float(os.environ.get('GRPC_BACKOFF_MIN_S', 0.5))
+GRPC_BACKOFF_MAX_S = float(os.environ.get('GRPC_BACKOFF_MAX_S', 30))
+DEDUP_MAX_SENSORS = int(os.environ.get('DEDUP_MAX_SENSORS', 10000))
+
+
+class SensorDedupIndex:
+
+    def __init__(self, max_sensors: int = DEDUP_MAX_SENSORS):
+        self.max_sensors = max_sensors
+        # sensor_id -> (last sequence_number, last timestamp), least recently seen first
+        self._last = OrderedDict()
+
+    def __len__(self):
+        return len(self._last)
+
+    def is_duplicate(self, telem_response) -> bool:
+        which = telem_response.WhichOneof("data")
+        if which is None:
+            # let the decoder complain about it
+            return False
+        data = getattr(telem_response, which)
+        sensor_id = data.sensor_id
+        seq = data.sequence_number
+        # ints compare cheaper than the ISO strings (which only sort right because they're all `Z`)
+        ts = telem_response.timestamp_ns or telem_response.timestamp
+
+        last = self._last.get(sensor_id)
+        if last is not None:
+            last_seq, last_ts = last
+            # (an int vs an ISO string == server got swapped for an older/newer one, not a replay)
+            if seq <= last_seq and type(ts) is type(last_ts) and ts <= last_ts:
+                DEDUP_DROPPED.inc()
+                return True
+            self._last.move_to_end(sensor_id)
+        self._last[sensor_id] = (seq, ts)
+
+        if len(self._last) > self.max_sensors:
+            self._last.popitem(last=False)
+        DEDUP_SENSORS.set(len(self._last))
+        return False
+
+
+async def reconnecting_stream(open_stream, target: str = GRPC_TARGET):
+    """
+    Yields every message of `open_stream(channel)`, across reconnects, until cancelled.
+    - `open_stream`: channel -> response stream (like `stub.GetTelemetryStream(...)`)
+    """
+    backoff = GRPC_BACKOFF_MIN_S
+    while True:
+        try:
+            # connect to cpp server asynchronously
+            async with grpc.aio.insecure_channel(target) as channel:
+                stream = open_stream(channel)
+                GRPC_CONNECTED.set(1)
+                async for response in stream:
+                    backoff = GRPC_BACKOFF_MIN_S
+                    yield response
+            log.warning(f"stream to {target} ended by the server")
+        except grpc.RpcError as e:
+            log.error(f"Oh no! gRPC error: {e}")
+        finally:
+            GRPC_CONNECTED.set(0)
+
+        delay = backoff * random.uniform(0.5, 1.5)
+        log.info(f"reconnecting to {target} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        backoff = min(backoff * 2, GRPC_BACKOFF_MAX_S)
+        GRPC_RECONNECTS.inc()
@@ -0,0 +1,135 @@
+"""
+In-process fast path for `QUEUE_MODE=hybrid`, with the Redis list only as the overflow buffer.
+
+While the reader keeps up, a row never leaves the process (no encode, no LPUSH/RPOP round trips):
+- `put()`: rows go into a bounded `asyncio.Queue`
+- once the queue is at `HYBRID_HIGH_WATER`, new rows spill to `queue:telemetry` instead (encoded with `REDIS_QUEUE_CODEC`)
+    - and keep spilling until that backlog is drained, so nothing overtakes the spilled rows
+- `get_batch()`: in-memory rows first (they're older than anything spilled), then the redis backlog,
+    then back to the fast path once the list is seen empty with nothing of ours still on its way to redis
+    - not by counting spilled vs drained rows: entries popped by someone else (or trimmed) would keep us spilling for good
+- starts in spill mode (`start()`), so a backlog left over from an earlier run is drained first
+"""
+import os
+import asyncio
+import logging
+
+from prometheus_client import Counter, Gauge
+
+from redis_queue import RedisBatchProducer, REDIS_QUEUE_KEY, REDIS_POP_BATCH_SIZE, REDIS_MSGS_PER_ROUND_TRIP
+from queue_codec import get_codec, decode_payload
+
+log = logging.getLogger('HybridQueue')
+
+
+HYBRID_MSGS = Counter('hybrid_queue_msgs', 'Telemetry messages by path taken: in-process (fast) or through redis (spill).', ['path'])
+HYBRID_DRAINED_MSGS = Counter('hybrid_queue_drained_msgs', 'Spilled messages read back from redis.')
+HYBRID_SPILL_EPISODES = Counter('hybrid_queue_spill_episodes', 'Times the in-process queue hit the high-water mark and started spilling.')
+HYBRID_SPILLING = Gauge('hybrid_queue_spilling', '1 while messages are going through redis, 0 on the fast path.')
+HYBRID_QUEUE_DEPTH = Gauge('hybrid_queue_depth', 'Rows in the in-process queue.')
+
+# knobs
+HYBRID_QUEUE_MAXSIZE = int(os.environ.get('HYBRID_QUEUE_MAXSIZE', 10000))
+HYBRID_HIGH_WATER = int(os.environ.get('HYBRID_HIGH_WATER', 8000))
+
+
+class HybridQueue:
+
+    def __init__(self, r, key: str = REDIS_QUEUE_KEY, maxsize: int = HYBRID_QUEUE_MAXSIZE, high_water: int = HYBRID_HIGH_WATER, pop_batch_size: int = REDIS_POP_BATCH_SIZE, codec=None):
+        self._r = r
+        self.key = key
+        self.high_water = min(high_water, maxsize)
+        self.pop_batch_size = pop_batch_size
+        self._codec = codec or get_codec()
+
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        # spill side, needs `run_linger()` running like the plain list mode
+        self.producer = RedisBatchProducer(r, key)
+
+        self.spilling = True
+        self._spilled = 0
+        self._drained = 0
+
+    def __len__(self):
+        # rows in memory (the spilled ones are in redis)
+        return self._queue.qsize()
+
+    async def start(self):
+        # before the first `put()`: whatever an earlier run left behind counts as spilled
+        self._spilled = await self._r.llen(self.key)
+        HYBRID_SPILLING.set(1)
+
+    async def put(self, telem_response, row: tuple) -> None:
+        queue = self._queue
+        if not self.spilling and queue.qsize() < self.high_water:
+            queue.put_nowait(row)
+            HYBRID_MSGS.labels('fast').inc()
+            return
+
+        if not self.spilling:
+            self.spilling = True
+            HYBRID_SPILL_EPISODES.inc()
+            HYBRID_SPILLING.set(1)
+        self._spilled += 1
+        HYBRID_MSGS.labels('spill').inc()
+        await self.producer.put(self._codec.encode(telem_response, row))
+
+    async def put_many(self, telem_responses, rows: list[tuple]) -> None:
+        # a whole gRPC batch takes the same path
+        queue = self._queue
+        if not self.spilling and queue.qsize() + len(rows) <= self.high_water:
+            for row in rows:
+                queue.put_nowait(row)
+            HYBRID_MSGS.labels('fast').inc(len(rows))
+            return
+
+        if not self.spilling:
+            self.spilling = True
+            HYBRID_SPILL_EPISODES.inc()
+            HYBRID_SPILLING.set(1)
+        self._spilled += len(rows)
+        HYBRID_MSGS.labels('spill').inc(len(rows))
+        encode = self._codec.encode
+        await self.producer.put_many([encode(telem_response, row) for telem_response, row in zip(telem_responses, rows)])
+
+    def _get_nowait_batch(self, first_row) -> list[tuple]:
+        rows = [first_row]
+        queue = self._queue
+        while len(rows) < self.pop_batch_size and not queue.empty():
+            rows.append(queue.get_nowait())
+        HYBRID_QUEUE_DEPTH.set(queue.qsize())
+        return rows
+
+    async def _pop_spilled(self) -> list[tuple]:
+        # anything still lingering in the producer goes out first
+        await self.producer.flush()
+        payloads = await self._r.rpop(self.key, self.pop_batch_size)
+        if payloads:
+            REDIS_MSGS_PER_ROUND_TRIP.labels('rpop').observe(len(payloads))
+            self._drained += len(payloads)
+            HYBRID_DRAINED_MSGS.inc(len(payloads))
+            return [decode_payload(payload) for payload in payloads]
+
+        if self.producer.idle:
+            # list is empty and nothing is buffered/in flight: backlog is gone, back to the fast path
+            if self._drained < self._spilled:
+                log.warning(f"left spill mode with {self._spilled - self._drained} spilled msgs never read back (popped elsewhere or trimmed)")
+            self.spilling = False
+            self._spilled = 0
+            self._drained = 0
+            HYBRID_SPILLING.set(0)
+        else:
+            # spilled meanwhile, still on its way to redis
+            await asyncio.sleep(self.producer.linger_s)
+        return []
+
+    async def get_batch(self) -> list[tuple]:
+        """
+        Up to `pop_batch_size` rows, oldest first.
+        - blocks while there's nothing at all, may return [] while switching back from spill mode
+        """
+        if not self._queue.empty():
+            return self._get_nowait_batch(self._queue.get_nowait())
+        if self.spilling:
+            return await self._pop_spilled()
+        return self._get_nowait_batch(await self._queue.get())
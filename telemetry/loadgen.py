@@ -0,0 +1,380 @@
+"""
+Pure python `TelemetryService` load generator (grpc.aio), a stand-in for `server.cpp` when benchmarking `client.py`.
+
+No CMake/protobuf/gRPC/boost build, and no `sleep_for` per sensor thread / `std::cout` per reading capping the rate:
+- configurable number of temperature, pressure and velocity sensors
+- target aggregate rate (msgs/s), paced in `LOADGEN_TICK_MS` ticks, sensors emit round robin
+- values are vectorized (numpy) random walks, one step for every sensor per round
+- one pre-serialized template per sensor, only the changing fields (values, status, sequence number) are appended per reading
+- sets both `timestamp` (ISO8601) and `timestamp_ns`, like `server.cpp`
+- responses are sent pre-serialized (no per-message serializer in grpc)
+    - `GetTelemetryBatchStream`: readings framed straight into `TelemetryBatch` bytes (honors `max_batch_size`)
+    - `GetTelemetryStream`: one message per reading, like `server.cpp` (tops out way earlier, that's the point of the batch RPC)
+- prints the rate it actually achieved every `LOADGEN_REPORT_INTERVAL_S`
+    - if achieved < target, the generator (not the client) is the bottleneck
+
+NOTE: every stream gets its own fleet at the full rate (server.cpp shares one queue between clients)
+
+usage:
+    cd telemetry
+    LOADGEN_RATE=100000 python loadgen.py
+    GRPC_TARGET=localhost:50051 python client.py
+"""
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import grpc
+
+# for protobuf bug
+# https://github.com/grpc/grpc/issues/29459
+import sys
+def add_to_python_path(new_path):
+    existing_path = sys.path
+    absolute_path = os.path.abspath(new_path)
+    if absolute_path not in existing_path:
+        sys.path.append(absolute_path)
+    return sys.path
+
+file_dir_path = os.path.dirname(os.path.realpath(__file__))
+add_to_python_path(file_dir_path + "/proto")
+
+from proto import telemetry_pb2
+from proto import telemetry_pb2_grpc
+
+
+# knobs
+LOADGEN_PORT = int(os.environ.get('LOADGEN_PORT', 50051))
+# msgs/s, all sensors together
+LOADGEN_RATE = float(os.environ.get('LOADGEN_RATE', 10000))
+LOADGEN_TEMP_SENSORS = int(os.environ.get('LOADGEN_TEMP_SENSORS', 100))
+LOADGEN_PRESSURE_SENSORS = int(os.environ.get('LOADGEN_PRESSURE_SENSORS', 100))
+LOADGEN_VELOCITY_SENSORS = int(os.environ.get('LOADGEN_VELOCITY_SENSORS', 100))
+LOADGEN_TICK_MS = float(os.environ.get('LOADGEN_TICK_MS', 10))
+LOADGEN_REPORT_INTERVAL_S = float(os.environ.get('LOADGEN_REPORT_INTERVAL_S', 5))
+LOADGEN_SEED = int(os.environ.get('LOADGEN_SEED', 0))
+
+# same defaults + cap as server.cpp
+DEFAULT_BATCH_SIZE = 256
+MAX_BATCH_SIZE = 4096
+
+# subsystems handed out round robin
+_SUBSYSTEMS = [val.number for val in telemetry_pb2.System.DESCRIPTOR.values if val.number != 0]
+
+
+def _status(values: np.ndarray, ok: tuple, warning: tuple, critical: tuple) -> np.ndarray:
+    # same status_bitmask thresholds as server.cpp: 0 ok, 1 warning, 2 critical, 4 offline
+    # (nested np.where, np.select has way more fixed overhead on a few hundred sensors)
+    return np.where(
+        (values >= ok[0]) & (values <= ok[1]), 0,
+        np.where(
+            (values >= warning[0]) & (values <= warning[1]), 1,
+            np.where((values >= critical[0]) & (values <= critical[1]), 2, 4),
+        ),
+    )
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def iso_from_ns(timestamp_ns: int) -> str:
+    # same format as server.cpp (`2025-06-24T12:34:56.123456Z`), same instant as `timestamp_ns`
+    return (_EPOCH + timedelta(microseconds=timestamp_ns // 1000)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _varint(n: int) -> bytes:
+    # protobuf base 128 varint (non-negative ints only, which is all we send)
+    if n < 0x80:
+        return bytes((n,))
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _string_field(tag: int, value: str) -> bytes:
+    encoded = value.encode()
+    return bytes((tag,)) + _varint(len(encoded)) + encoded
+
+
+# status_bitmask field tag -> {status: field bytes}
+_STATUS_FIELDS = {tag: {status: bytes((tag, status)) for status in (0, 1, 2, 4)} for tag in (0x28, 0x40)}
+
+# packed (tag, float32) fields
+_TEMP_DTYPE = np.dtype([('t0', 'u1'), ('v0', '<f4')])
+_VELOCITY_DTYPE = np.dtype([('t0', 'u1'), ('v0', '<f4'), ('t1', 'u1'), ('v1', '<f4'), ('t2', 'u1'), ('v2', '<f4'), ('t3', 'u1'), ('v3', '<f4')])
+
+# wire tags from telemetry.proto ((field number << 3) | wire type), keep in sync with it!
+# TelemetryResponse
+_TAG_TIMESTAMP = 0x0A        # 1, string
+_TAG_TYPE = 0x20             # 4, enum
+_TAG_TEMPERATURE = 0x2A      # 5, message
+_TAG_PRESSURE = 0x32         # 6, message
+_TAG_VELOCITY = 0x3A         # 7, message
+_TAG_TIMESTAMP_NS = 0x40     # 8, int64 (varint)
+# TemperatureData: sensor_id 1, subsystem 2, temperature 3, unit 4, status_bitmask 5, sequence_number 6
+# PressureData:    sensor_id 1, subsystem 2, pressure 3,    unit 4, status_bitmask 5, leak_detected 6, sequence_number 7
+# VelocityData:    sensor_id 1, subsystem 2, velocity_x/y/z 3/4/5, unit 6, vibration_mag 7, status_bitmask 8, sequence_number 9
+
+
+class SensorFleet:
+    """
+    All the simulated sensors of one stream.
+    - `generate(count)` -> the next `count` readings as serialized `TelemetryResponse`s
+    - a round == every sensor emits once, with the same sequence number
+
+    Messages are built from pre-serialized per-sensor templates (type, sensor_id, subsystem, unit),
+    only the values (packed for all sensors at once with numpy), status, sequence number and timestamps are joined in per reading
+    (protobuf setters + `SerializeToString()` per reading capped us around 300k msgs/s).
+    `_self_check()` parses the output back with the real `telemetry_pb2` classes.
+    """
+
+    def __init__(self, num_temp: int = LOADGEN_TEMP_SENSORS, num_pressure: int = LOADGEN_PRESSURE_SENSORS, num_velocity: int = LOADGEN_VELOCITY_SENSORS, seed: int = LOADGEN_SEED):
+        self._rng = np.random.default_rng(seed)
+        self.num_sensors = num_temp + num_pressure + num_velocity
+        if self.num_sensors == 0:
+            raise ValueError("need at least one sensor")
+
+        # random walk state, same starting points as server.cpp
+        self._temps = np.full(num_temp, 30.0)
+        self._pressures = np.full(num_pressure, 200.0)
+        self._velocities = np.full((num_velocity, 3), 8000.0)
+
+        # static parts of each sensor's message, in emit order
+        self.sensor_ids = []
+        self._temp_static = [self._static(f"TEMP_{i:04d}", 0x22, 'celsius') for i in range(num_temp)]
+        self._pressure_static = [self._static(f"PRESS_{i:04d}", 0x22, 'bar') for i in range(num_pressure)]
+        self._velocity_static = [self._static(f"VELO_{i:04d}", 0x32, 'm/s') for i in range(num_velocity)]
+
+        self._seq = 0
+        self._seq_len = None
+        # rest of the current round
+        self._leftover = []
+        self._self_check()
+
+    def _static(self, sensor_id: str, unit_tag: int, unit: str) -> tuple:
+        subsystem = _SUBSYSTEMS[len(self.sensor_ids) % len(_SUBSYSTEMS)]
+        self.sensor_ids.append(sensor_id)
+        # (sensor_id + subsystem fields, unit field)
+        return _string_field(0x0A, sensor_id) + bytes((0x10,)) + _varint(subsystem), _string_field(unit_tag, unit)
+
+    def _build_leads(self, seq_len: int):
+        # everything up to the values, per sensor (only changes when the sequence number varint gets longer)
+        # inner message == static + values + unit + status (2 bytes) + sequence_number (1 + seq_len bytes)
+        def leads(statics, telemetry_type, tag, values_len):
+            return [
+                bytes((_TAG_TYPE, telemetry_type, tag)) + _varint(len(static) + values_len + len(unit_field) + 2 + 1 + seq_len) + static
+                for static, unit_field in statics
+            ]
+        self._temp_leads = leads(self._temp_static, telemetry_pb2.TEMPERATURE, _TAG_TEMPERATURE, _TEMP_DTYPE.itemsize)
+        self._pressure_leads = leads(self._pressure_static, telemetry_pb2.PRESSURE, _TAG_PRESSURE, _TEMP_DTYPE.itemsize)
+        self._velocity_leads = leads(self._velocity_static, telemetry_pb2.VELOCITY, _TAG_VELOCITY, _VELOCITY_DTYPE.itemsize)
+        # unit + status fields, per sensor per status
+        self._temp_tails = [{status: unit_field + field for status, field in _STATUS_FIELDS[0x28].items()} for _, unit_field in self._temp_static]
+        self._pressure_tails = [{status: unit_field + field for status, field in _STATUS_FIELDS[0x28].items()} for _, unit_field in self._pressure_static]
+        self._velocity_tails = [{status: unit_field + field for status, field in _STATUS_FIELDS[0x40].items()} for _, unit_field in self._velocity_static]
+        self._seq_len = seq_len
+
+    def _step(self):
+        # one random walk step for every sensor
+        rng = self._rng
+        self._temps = np.clip(self._temps + rng.uniform(-10.0, 10.0, self._temps.shape), -40.0, 95.0)
+        self._pressures = np.clip(self._pressures + rng.uniform(-5.0, 5.0, self._pressures.shape), 80.0, 320.0)
+        self._velocities = np.clip(self._velocities + rng.uniform(-5.0, 5.0, self._velocities.shape), -16000.0, 16000.0)
+
+    @staticmethod
+    def _wire_values(dtype: np.dtype, tags: tuple, columns: list) -> list[bytes]:
+        # float fields (tag + float32) of every sensor at once, then split per sensor
+        packed = np.empty(len(columns[0]), dtype=dtype)
+        for i, (tag, column) in enumerate(zip(tags, columns)):
+            packed[f"t{i}"] = tag
+            packed[f"v{i}"] = column
+        raw = packed.tobytes()
+        size = dtype.itemsize
+        return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+    def _round(self, timestamp_ns: int) -> list[bytes]:
+        self._step()
+        self._seq += 1
+        seq = _varint(self._seq)
+        if len(seq) != self._seq_len:
+            self._build_leads(len(seq))
+        # NOTE: field order doesn't matter on the wire, so the timestamps (same for the whole round) go last
+        ts_field = _string_field(_TAG_TIMESTAMP, iso_from_ns(timestamp_ns)) + bytes((_TAG_TIMESTAMP_NS,)) + _varint(timestamp_ns)
+        round_readings = []
+        append = round_readings.append
+        join = b''.join
+
+        # temperature (3) / sequence_number (6)
+        seq_field = b'\x30' + seq
+        temp_status = _status(self._temps, (-10.0, 65.0), (-20.0, 75.0), (-30.0, 85.0)).tolist()
+        for lead, value, tails, status in zip(self._temp_leads, self._wire_values(_TEMP_DTYPE, (0x1D,), [self._temps]), self._temp_tails, temp_status):
+            append(join((lead, value, tails[status], seq_field, ts_field)))
+
+        # pressure (3) / sequence_number (7)
+        seq_field = b'\x38' + seq
+        pressure_status = _status(self._pressures, (180.0, 220.0), (140.0, 260.0), (100.0, 300.0)).tolist()
+        for lead, value, tails, status in zip(self._pressure_leads, self._wire_values(_TEMP_DTYPE, (0x1D,), [self._pressures]), self._pressure_tails, pressure_status):
+            append(join((lead, value, tails[status], seq_field, ts_field)))
+
+        # velocity_x/y/z (3/4/5), vibration_mag (7) / sequence_number (9)
+        seq_field = b'\x48' + seq
+        velocities = self._velocities
+        velocity_mag = np.linalg.norm(velocities, axis=1)
+        velocity_status = _status(velocity_mag, (0.0, 12000.0), (0.0, 14000.0), (0.0, 15000.0)).tolist()
+        values = self._wire_values(_VELOCITY_DTYPE, (0x1D, 0x25, 0x2D, 0x3D), [velocities[:, 0], velocities[:, 1], velocities[:, 2], velocity_mag])
+        for lead, value, tails, status in zip(self._velocity_leads, values, self._velocity_tails, velocity_status):
+            append(join((lead, value, tails[status], seq_field, ts_field)))
+
+        return round_readings
+
+    def generate(self, count: int) -> list[bytes]:
+        # one timestamp per call (== per tick)
+        timestamp_ns = time.time_ns()
+        readings = self._leftover
+        while len(readings) < count:
+            readings.extend(self._round(timestamp_ns))
+        self._leftover = readings[count:]
+        return readings[:count]
+
+    def _self_check(self):
+        # hand-built wire bytes vs the real schema, on a throwaway fleet (so the real one starts at seq 1)
+        check = SensorFleet.__new__(SensorFleet)
+        check.__dict__.update({k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in self.__dict__.items()})
+        check._rng = np.random.default_rng(0)
+        check._leftover = []
+        for raw, sensor_id in zip(check.generate(self.num_sensors), self.sensor_ids):
+            resp = telemetry_pb2.TelemetryResponse.FromString(raw)
+            data = getattr(resp, resp.WhichOneof("data"))
+            if data.sensor_id != sensor_id or data.sequence_number != 1 or not resp.HasField('type') or not resp.timestamp or not resp.timestamp_ns:
+                raise RuntimeError(f"loadgen wire templates don't match telemetry.proto anymore: {resp}")
+
+
+def frame_batch(readings: list[bytes]) -> bytes:
+    # serialized `TelemetryBatch`: each reading is field 1 (`responses`), length delimited
+    parts = []
+    append = parts.append
+    for reading in readings:
+        size = len(reading)
+        if size < 0x80:
+            append(bytes((0x0A, size)))
+        else:
+            header = bytearray(b'\x0A')
+            while size >= 0x80:
+                header.append((size & 0x7F) | 0x80)
+                size >>= 7
+            header.append(size)
+            append(bytes(header))
+        append(reading)
+    return b''.join(parts)
+
+
+class RateReport:
+    # what was actually sent, for the periodic print
+    def __init__(self):
+        self.msgs = 0
+        self.frames = 0
+
+    async def run(self, target_rate: float):
+        last_msgs, last_frames, last_time = 0, 0, time.perf_counter()
+        while True:
+            await asyncio.sleep(LOADGEN_REPORT_INTERVAL_S)
+            now = time.perf_counter()
+            elapsed = now - last_time
+            msgs_rate = (self.msgs - last_msgs) / elapsed
+            frames_rate = (self.frames - last_frames) / elapsed
+            print(f"[loadgen] : {msgs_rate:,.0f} msgs/s achieved (target {target_rate:,.0f}), {frames_rate:,.0f} gRPC msgs/s, {self.msgs:,} msgs total")
+            last_msgs, last_frames, last_time = self.msgs, self.frames, now
+
+
+class LoadGenService(telemetry_pb2_grpc.TelemetryServiceServicer):
+
+    def __init__(self, rate: float = LOADGEN_RATE, report: RateReport = None):
+        self.rate = rate
+        self.report = report or RateReport()
+
+    async def _paced(self, context):
+        # yields lists of readings, `rate` readings/s on average
+        fleet = SensorFleet()
+        tick_s = LOADGEN_TICK_MS / 1000
+        # don't try to catch up more than a few ticks at once after a stall
+        max_per_tick = max(1, int(self.rate * tick_s * 4))
+        start = time.perf_counter()
+        sent = 0
+        while not context.cancelled():
+            due = int((time.perf_counter() - start) * self.rate) - sent
+            if due <= 0:
+                await asyncio.sleep(tick_s)
+                continue
+            count = min(due, max_per_tick)
+            yield fleet.generate(count)
+            sent += count
+
+    async def GetTelemetryStream(self, request, context):
+        print("[loadgen] : Client connected for telemetry stream!")
+        report = self.report
+        async for readings in self._paced(context):
+            for reading in readings:
+                yield reading
+            report.msgs += len(readings)
+            report.frames += len(readings)
+
+    async def GetTelemetryBatchStream(self, request, context):
+        max_batch_size = min(request.max_batch_size, MAX_BATCH_SIZE) if request.max_batch_size > 0 else DEFAULT_BATCH_SIZE
+        print(f"[loadgen] : Client connected for telemetry batch stream! (max_batch_size {max_batch_size})")
+        report = self.report
+        async for readings in self._paced(context):
+            for i in range(0, len(readings), max_batch_size):
+                yield frame_batch(readings[i:i + max_batch_size])
+                report.frames += 1
+            report.msgs += len(readings)
+
+
+def _passthrough(serialized: bytes) -> bytes:
+    return serialized
+
+
+def add_loadgen_service(service: LoadGenService, server) -> None:
+    # like `add_TelemetryServiceServicer_to_server()`, but responses are already serialized
+    rpc_method_handlers = {
+        'GetTelemetryStream': grpc.unary_stream_rpc_method_handler(
+            service.GetTelemetryStream,
+            request_deserializer=telemetry_pb2.TelemetryRequest.FromString,
+            response_serializer=_passthrough,
+        ),
+        'GetTelemetryBatchStream': grpc.unary_stream_rpc_method_handler(
+            service.GetTelemetryBatchStream,
+            request_deserializer=telemetry_pb2.TelemetryRequest.FromString,
+            response_serializer=_passthrough,
+        ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler('telemetry.TelemetryService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+async def main():
+    report = RateReport()
+    server = grpc.aio.server()
+    add_loadgen_service(LoadGenService(LOADGEN_RATE, report), server)
+    server.add_insecure_port(f"0.0.0.0:{LOADGEN_PORT}")
+    await server.start()
+    print(f"[loadgen] : serving on :{LOADGEN_PORT}, {LOADGEN_RATE:,.0f} msgs/s across {LOADGEN_TEMP_SENSORS + LOADGEN_PRESSURE_SENSORS + LOADGEN_VELOCITY_SENSORS} sensors")
+
+    report_task = asyncio.create_task(report.run(LOADGEN_RATE))
+    try:
+        await server.wait_for_termination()
+    finally:
+        report_task.cancel()
+        await server.stop(1)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
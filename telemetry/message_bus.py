@@ -0,0 +1,198 @@
+"""
+Message bus between `backend.py` workers, so `uvicorn backend:app --workers N` works.
+
+Each worker only has its own websockets (`ConnectionManager` is per process), so a POST landing on worker A
+used to reach only worker A's viewers. With a bus (`WS_BUS`):
+- `/telem_data`, `/telem_data/batch`, `/metric_data` (and the "closed the stream" notices) publish to the bus instead of broadcasting
+- every worker subscribes and fans out whatever comes in to its own websockets, including what it published itself
+- `publish()` is a plain (non async) append to an outbox, a publisher task sends it in pipelined batches
+    - up to `WS_BUS_PUBLISH_BATCH` messages per round trip
+    - outbox capped at `WS_BUS_OUTBOX_SIZE`, oldest dropped (`ws_bus_dropped{reason="outbox_full"}`), a dead broker can't eat the worker's memory
+- payloads are opaque bytes here, `backend.py` decides what's in them
+
+`WS_BUS`:
+- `` (default): no bus, a worker broadcasts straight to its own websockets like before (single worker only)
+- `redis`: Redis pub/sub on `WS_BUS_CHANNEL` (`WS_BUS_REDIS_URL`)
+    - pub/sub, not a stream: viewers want the latest readings, not a replay of what they missed,
+        and nothing piles up in redis when no worker is listening
+    - a worker that loses the connection resubscribes (messages published in between are gone for its viewers)
+- `local`: in-process stand-in, same bytes in/out + same publisher/subscriber tasks without a broker (tests, one worker)
+"""
+import os
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+
+from prometheus_client import Counter, Gauge, Histogram
+
+log = logging.getLogger('MessageBus')
+
+
+WS_BUS_PUBLISHED = Counter('ws_bus_published', 'Messages published to the websocket bus.')
+WS_BUS_RECEIVED = Counter('ws_bus_received', 'Messages received from the websocket bus (fanned out to this worker\'s websockets).')
+WS_BUS_DROPPED = Counter('ws_bus_dropped', 'Messages that never made it through the websocket bus, by reason (outbox_full, publish_error, handler_error).', ['reason'])
+WS_BUS_OUTBOX_DEPTH = Gauge('ws_bus_outbox_depth', 'Messages waiting to be published to the websocket bus.')
+WS_BUS_MSGS_PER_PUBLISH = Histogram('ws_bus_msgs_per_publish', 'Messages per websocket bus publish round trip.', buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+
+# knobs
+WS_BUS = os.environ.get('WS_BUS', '')
+WS_BUS_REDIS_URL = os.environ.get('WS_BUS_REDIS_URL', 'redis://localhost:6379/0')
+WS_BUS_CHANNEL = os.environ.get('WS_BUS_CHANNEL', 'ws:broadcast')
+WS_BUS_OUTBOX_SIZE = int(os.environ.get('WS_BUS_OUTBOX_SIZE', 10000))
+WS_BUS_PUBLISH_BATCH = int(os.environ.get('WS_BUS_PUBLISH_BATCH', 256))
+WS_BUS_RETRY_S = float(os.environ.get('WS_BUS_RETRY_S', 1))
+
+BUSES = ('', 'local', 'redis')
+
+
+class MessageBus(ABC):
+    """
+    Outbox + publisher task + subscriber task, the transport is up to the subclass:
+    - `_publish_batch(batch)`: send a list of payloads (raising == the batch is dropped)
+    - `_listen(handler)`: call `handler(payload)` for every payload on the bus, until cancelled
+    """
+
+    def __init__(self, outbox_size: int = WS_BUS_OUTBOX_SIZE, publish_batch: int = WS_BUS_PUBLISH_BATCH, retry_s: float = WS_BUS_RETRY_S):
+        self.outbox_size = outbox_size
+        self.publish_batch = publish_batch
+        self.retry_s = retry_s
+        self._outbox = deque()
+        self._ready = asyncio.Event()
+        self._tasks = []
+        WS_BUS_OUTBOX_DEPTH.set_function(lambda: len(self._outbox))
+
+    def publish(self, payload: bytes) -> None:
+        outbox = self._outbox
+        if len(outbox) >= self.outbox_size:
+            outbox.popleft()
+            WS_BUS_DROPPED.labels('outbox_full').inc()
+        outbox.append(payload)
+        self._ready.set()
+
+    async def start(self, handler) -> None:
+        # `handler(payload)` is called on the event loop for every message, keep it non blocking
+        self._tasks = [
+            asyncio.create_task(self._run_publisher(), name='ws-bus-publisher'),
+            asyncio.create_task(self._run_subscriber(handler), name='ws-bus-subscriber'),
+        ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run_publisher(self):
+        outbox = self._outbox
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while outbox:
+                batch = [outbox.popleft() for _ in range(min(len(outbox), self.publish_batch))]
+                try:
+                    await self._publish_batch(batch)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    WS_BUS_DROPPED.labels('publish_error').inc(len(batch))
+                    log.warning(f"publish of {len(batch)} msgs failed, dropped: {e!r}")
+                    await asyncio.sleep(self.retry_s)
+                    continue
+                WS_BUS_PUBLISHED.inc(len(batch))
+                WS_BUS_MSGS_PER_PUBLISH.observe(len(batch))
+
+    async def _run_subscriber(self, handler):
+        def on_message(payload: bytes) -> None:
+            WS_BUS_RECEIVED.inc()
+            try:
+                handler(payload)
+            except Exception as e:
+                # one bad message shouldn't take the subscription down with it
+                WS_BUS_DROPPED.labels('handler_error').inc()
+                log.exception(f"bus message handler failed: {e!r}")
+
+        while True:
+            try:
+                await self._listen(on_message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"subscription lost, retrying in {self.retry_s:.0f}s: {e!r}")
+                await asyncio.sleep(self.retry_s)
+
+    @abstractmethod
+    async def _publish_batch(self, batch: list) -> None:
+        ...
+
+    @abstractmethod
+    async def _listen(self, handler) -> None:
+        ...
+
+
+class LocalBus(MessageBus):
+    """
+    In-process stand-in: what's published comes back to this process' own subscriber, through the same tasks.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._inbox = asyncio.Queue()
+
+    async def _publish_batch(self, batch: list) -> None:
+        for payload in batch:
+            self._inbox.put_nowait(payload)
+
+    async def _listen(self, handler) -> None:
+        inbox = self._inbox
+        while True:
+            handler(await inbox.get())
+            # drain whatever else is there without going back to the loop each time
+            while not inbox.empty():
+                handler(inbox.get_nowait())
+
+
+class RedisBus(MessageBus):
+    """
+    Redis pub/sub on one channel, `r` is a `redis.asyncio.Redis` (`decode_responses=False`).
+    """
+
+    def __init__(self, r, channel: str = WS_BUS_CHANNEL, **kwargs):
+        super().__init__(**kwargs)
+        self._r = r
+        self.channel = channel
+
+    async def _publish_batch(self, batch: list) -> None:
+        # one round trip for the whole batch
+        async with self._r.pipeline(transaction=False) as pipe:
+            for payload in batch:
+                pipe.publish(self.channel, payload)
+            await pipe.execute()
+
+    async def _listen(self, handler) -> None:
+        pubsub = self._r.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            log.info(f"subscribed to {self.channel!r}")
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                if message is not None and message['type'] == 'message':
+                    handler(message['data'])
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        await super().close()
+        await self._r.aclose()
+
+
+def make_bus(kind: str = WS_BUS):
+    # -> a bus for `WS_BUS`, or None (no bus, broadcast directly)
+    if kind not in BUSES:
+        raise ValueError(f"unknown WS_BUS {kind!r}, expected one of {BUSES}")
+    if kind == 'local':
+        return LocalBus()
+    if kind == 'redis':
+        import redis.asyncio as aioredis
+        return RedisBus(aioredis.Redis.from_url(WS_BUS_REDIS_URL, decode_responses=False))
+    return None
@@ -0,0 +1,88 @@
+"""
+DB write path shared by `client.py` and the shard workers (`sharding.py`).
+
+Lives outside `client.py` on purpose: spawned shard workers already run `client.py` as `__mp_main__`,
+so importing `client` there would run it (and register its prometheus metrics) a second time.
+"""
+import os
+import logging
+import asyncio
+
+from prometheus_client import Counter, Histogram
+
+from copy_writer import TELEMETRY_COPY
+from db_pool import borrow
+from pipeline_trace import TRACER
+
+log = logging.getLogger('client')
+
+
+# TODO: tune the buckets..
+DB_INSERT_TIME = Histogram('db_insertion_seconds', 'Time (seconds) spent on inserting into database.', buckets=[0.007, 0.008, 0.0085, 0.009, 0.0092, 0.0094, 0.0096, 0.0098, 0.01, 0.011, 0.012, 0.015, 0.02, 0.08, 0.1, 0.2, 0.3, 0.4, 0.5, 0.8, 1.0, 2.0, 4.0, 10.0])
+    # mostly 0.0095
+LATENCY_TO_DB_INSERT = Histogram('latency_to_db_insert', 'Time from data creation to db insertion.', buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200])
+    # 4~6
+STREAM_ACK_FAILED = Counter('redis_stream_ack_failed', 'Stream entries whose rows were committed but the XACK failed (left pending, redelivered on restart).')
+
+# knobs
+STREAM_ACK_ATTEMPTS = int(os.environ.get('STREAM_ACK_ATTEMPTS', 3))
+STREAM_ACK_RETRY_S = float(os.environ.get('STREAM_ACK_RETRY_S', 0.1))
+
+# shared with the shard workers
+DB_CONN_KWARGS = dict(
+    dbname='telemetry',
+    user='mirujun',
+    password='',
+    host='localhost'
+)
+
+
+@DB_INSERT_TIME.time()
+async def push_to_db(aconn, cur, rows):
+    # binary COPY insert via psycopg3, see `copy_writer.py`
+    log.debug("------- [ I T  I S  T I M E ] ------- Committing %d rows...", len(rows))
+
+    await TELEMETRY_COPY.write(cur, rows, LATENCY_TO_DB_INSERT)
+
+    await aconn.commit()
+    log.debug("------- [ I T  I S  D O N E ] -------")
+
+
+def make_db_flusher(pool, stream_consumer=None):
+    # `flush_rows` callback for DBBatcher
+    # each flush borrows its own pooled connection, so flushes (and their commits) run concurrently
+    async def flush_rows(rows, stream_ids):
+        if rows:
+            TRACER.mark(rows, 'batcher', since='queue')
+            async with borrow(pool) as aconn:
+                async with aconn.cursor() as cur:
+                    await push_to_db(aconn, cur, rows)
+            TRACER.mark(rows, 'copy', since='batcher')
+        if stream_ids:
+            # committed, safe to ack now
+            await ack_committed(stream_consumer, stream_ids)
+
+    return flush_rows
+
+
+async def ack_committed(stream_consumer, stream_ids):
+    # never raises: the rows are in already, a failed flush would spool (and later insert) them a second time
+    for attempt in range(1, STREAM_ACK_ATTEMPTS + 1):
+        try:
+            await stream_consumer.ack(stream_ids)
+            return
+        except Exception as e:
+            if attempt == STREAM_ACK_ATTEMPTS:
+                STREAM_ACK_FAILED.inc(len(stream_ids))
+                log.error(f"ack of {len(stream_ids)} committed stream entries failed {attempt} times, leaving them pending: {e!r}")
+                return
+            log.warning(f"ack of {len(stream_ids)} committed stream entries failed, retrying: {e!r}")
+            await asyncio.sleep(STREAM_ACK_RETRY_S * attempt)
+
+
+async def run_spool_replayer(spool, pool):
+    # COPYs spooled batches back once postgres is reachable again (no acks, those went out at spool time)
+    if spool is None:
+        return
+    flush_rows = make_db_flusher(pool)
+    await spool.run_replayer(lambda rows: flush_rows(rows, None))
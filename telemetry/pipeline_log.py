@@ -0,0 +1,217 @@
+"""
+One logging setup for the pipeline processes (`client.py`, `backend.py`, `metrics_client.py`, shard workers).
+
+`print()` was a blocking stdout write on the event loop, once or twice per message. Now:
+- `setup_logging(process)`: every record goes through a bounded queue to a `QueueListener` thread, which does the actual writes
+    - the loop only formats + enqueues, if the queue is full the record is dropped (and counted), never waited on
+- `SampledLog`: per-message debug lines, 1 in `LOG_SAMPLE_EVERY` and at most `LOG_MAX_PER_S` a second
+    - checks the level first, so with `LOG_LEVEL=INFO` (default) a per-message line costs one `isEnabledFor()`
+- `ThroughputSummary`: one aggregated line every `LOG_SUMMARY_INTERVAL_S` (msgs/s, bytes/s, errors, suppressed + dropped lines)
+- `LOG_FORMAT=text` (default, `[LEVEL] [logger] : msg` like the old prints) or `json` (one object per line, summary numbers as fields)
+- every knob can be set per process: `<PROCESS>_<KNOB>` wins over `<KNOB>`, like `BACKEND_LOG_LEVEL=DEBUG`
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import asyncio
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _knob(process: str, name: str, default) -> str:
+    return os.environ.get(f"{process.upper()}_{name}", os.environ.get(name, default))
+
+
+class DroppingQueueHandler(QueueHandler):
+    # `put_nowait()` on a bounded queue, a full queue drops the record instead of blocking the loop
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        # ERROR+ records from any logger, for the summary line
+        self.errors = 0
+
+    def emit(self, record):
+        if record.levelno >= logging.ERROR:
+            self.errors += 1
+        super().emit(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('[%(levelname)s] [%(name)s] : %(message)s')
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, process: str):
+        super().__init__()
+        self.process = process
+
+    def format(self, record) -> str:
+        entry = {
+            'ts': record.created,
+            'level': record.levelname,
+            'process': self.process,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        # anything passed with `extra={...}`
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_handler = None
+
+
+def setup_logging(process: str) -> logging.Logger:
+    """
+    Call once at process start, returns the process' own logger.
+    - knobs (`<PROCESS>_` prefix optional): `LOG_LEVEL` (name or number, DEBUG only applies to the process' logger, anything unknown == INFO + a warning), `LOG_FORMAT`, `LOG_FILE` (stderr if unset), `LOG_QUEUE_SIZE`
+    """
+    global _handler
+    level_name = _knob(process, 'LOG_LEVEL', 'INFO').upper()
+    log_format = _knob(process, 'LOG_FORMAT', 'text')
+    log_file = _knob(process, 'LOG_FILE', '')
+    queue_size = int(_knob(process, 'LOG_QUEUE_SIZE', 10000))
+
+    if log_file:
+        output = logging.FileHandler(log_file)
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter(process) if log_format == 'json' else TextFormatter())
+
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    root.addHandler(_handler)
+    # a name (`DEBUG`) or a number (`10`), `getLevelName()` gives back a string for anything else
+    level = int(level_name) if level_name.isdigit() else logging.getLevelName(level_name)
+    bad_level = not isinstance(level, int)
+    if bad_level:
+        level = logging.INFO
+    # DEBUG only for our own per-message lines, not every library's (asyncio, aiohttp, psycopg...)
+    root.setLevel(max(level, logging.INFO))
+    logger = logging.getLogger(process)
+    logger.setLevel(level)
+
+    listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    listener.start()
+    # flush whatever is still queued on the way out
+    atexit.register(listener.stop)
+    if bad_level:
+        logger.warning(f"unknown LOG_LEVEL {level_name!r}, using INFO (expected one of DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    return logger
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def error_records() -> int:
+    return _handler.errors if _handler is not None else 0
+
+
+class SampledLog:
+    """
+    Per-message debug lines: every `every`-th call gets through, and at most `max_per_s` of those a second.
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = None, max_per_s: float = None):
+        process = logger.name.split('.')[0]
+        self.logger = logger
+        self.every = every or int(_knob(process, 'LOG_SAMPLE_EVERY', 100))
+        self.max_per_s = max_per_s or float(_knob(process, 'LOG_MAX_PER_S', 10))
+        self.suppressed = 0
+        self._calls = 0
+        # token bucket
+        self._tokens = self.max_per_s
+        self._last_refill = time.monotonic()
+
+    def debug(self, msg: str, *args) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self._calls += 1
+        if self._calls % self.every:
+            self.suppressed += 1
+            return
+
+        now = time.monotonic()
+        self._tokens = min(self.max_per_s, self._tokens + (now - self._last_refill) * self.max_per_s)
+        self._last_refill = now
+        if self._tokens < 1:
+            self.suppressed += 1
+            return
+        self._tokens -= 1
+        self.logger.debug(msg, *args)
+
+
+class ThroughputSummary:
+    """
+    Aggregated counters, logged (INFO) every `interval_s` by `run()` instead of a line per message.
+    - errors == `error()` calls + every ERROR line logged (by any logger) in the interval
+    """
+
+    def __init__(self, logger: logging.Logger, sampled: SampledLog = None, interval_s: float = None):
+        process = logger.name.split('.')[0]
+        self.logger = logger
+        self.sampled = sampled
+        self.interval_s = interval_s or float(_knob(process, 'LOG_SUMMARY_INTERVAL_S', 10))
+        self.msgs = 0
+        self.bytes = 0
+        self.errors = 0
+        self._dropped_before = dropped_records()
+        self._errors_before = error_records()
+
+    def count(self, msgs: int = 1, nbytes: int = 0) -> None:
+        self.msgs += msgs
+        self.bytes += nbytes
+
+    def error(self, n: int = 1) -> None:
+        self.errors += n
+
+    def _emit(self, elapsed: float) -> None:
+        logged_errors = error_records() - self._errors_before
+        stats = {
+            'msgs_per_s': round(self.msgs / elapsed, 1),
+            'bytes_per_s': round(self.bytes / elapsed, 1),
+            'errors': self.errors + logged_errors,
+            'suppressed_lines': self.sampled.suppressed if self.sampled is not None else 0,
+            'dropped_lines': dropped_records() - self._dropped_before,
+        }
+        self.logger.info(
+            "%.1f msgs/s, %.1f KB/s, %d errors (last %.0fs), %d debug lines suppressed, %d log lines dropped",
+            stats['msgs_per_s'], stats['bytes_per_s'] / 1024, stats['errors'], elapsed,
+            stats['suppressed_lines'], stats['dropped_lines'],
+            extra={'summary': stats},
+        )
+        self.msgs = 0
+        self.bytes = 0
+        self.errors = 0
+        self._dropped_before += stats['dropped_lines']
+        self._errors_before += logged_errors
+        if self.sampled is not None:
+            self.sampled.suppressed = 0
+
+    async def run(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval_s)
+            now = time.monotonic()
+            self._emit(now - last)
+            last = now
@@ -0,0 +1,195 @@
+"""
+Sampled per-message pipeline spans, so a slow stage shows up as that stage (not just a fatter end-to-end histogram).
+
+- only messages with `sequence_number % PIPELINE_TRACE_SAMPLE_EVERY == 0` are traced
+    - no flag to carry around: every hop (and every process) agrees on what's sampled just from the row,
+        and it survives redis, the queue codecs and the JSON POST untouched
+    - the other messages cost one `&` + compare per hop
+- a span is `{hop: wall clock epoch ns}` for one (sensor_id, sequence_number), starting at the row's own timestamp (`created`)
+    - integer math all the way (`time.time_ns()` vs the row's `timestamp_ns`), seconds only when observed
+    - `mark(rows, hop, since)` stamps `hop` and observes `hop - since` as stage `hop`
+    - spans are dropped once every hop in `PIPELINE_TERMINAL_HOPS` is stamped (or by LRU, if a message never gets there)
+- stages in `client.py`:
+    - `grpc`    : created -> decoded in the client (cpp queue + server batching + network)
+    - `queue`   : grpc -> read back by the reader (redis list / stream / hybrid queue)
+    - `batcher` : queue -> handed to a db flush
+    - `copy`    : batcher -> COPY committed
+    - `outbox`  : queue -> POST to the dashboard starts
+    - `post`    : outbox -> POST answered
+- stages in `backend.py`: `http` (POST sent -> handler), `broadcast` (handler -> queued for every websocket), `total` (created -> queued for every websocket)
+- `pipeline_stage_seconds{stage, telemetry_type}` histogram for Prometheus,
+    plus the last `PIPELINE_TRACE_WINDOW` samples per stage for live p50/p99 on `/debug/pipeline` (with queue depths)
+    - `PIPELINE_DEBUG_HOST` (loopback by default) for `client.py`/`metrics_client.py`, `BACKEND_DEBUG_ROUTES=1` for `backend.py`
+
+NOTE: `QUEUE_MODE=sharded` workers aren't traced (yet)
+"""
+import os
+import logging
+import time
+import inspect
+import asyncio
+from collections import OrderedDict, deque
+
+from prometheus_client import Histogram
+
+from copy_writer import to_epoch_ns
+
+log = logging.getLogger('PipelineTracer')
+
+
+PIPELINE_STAGE_TIME = Histogram('pipeline_stage_seconds', 'Time (seconds) a sampled telemetry message spent in each pipeline stage.', ['stage', 'telemetry_type'], buckets=[0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60])
+
+# knobs
+PIPELINE_TRACE_ENABLED = os.environ.get('PIPELINE_TRACE_ENABLED', '1') == '1'
+# rounded down to a power of 2 (1 == trace everything)
+PIPELINE_TRACE_SAMPLE_EVERY = int(os.environ.get('PIPELINE_TRACE_SAMPLE_EVERY', 256))
+PIPELINE_TRACE_WINDOW = int(os.environ.get('PIPELINE_TRACE_WINDOW', 1024))
+PIPELINE_TRACE_MAX_SPANS = int(os.environ.get('PIPELINE_TRACE_MAX_SPANS', 65536))
+# `client.py`'s debug server
+PIPELINE_DEBUG_PORT = int(os.environ.get('PIPELINE_DEBUG_PORT', 8004))
+# no auth on it (and the profiler can be started from it), so loopback only unless asked, `0.0.0.0` to expose it
+PIPELINE_DEBUG_HOST = os.environ.get('PIPELINE_DEBUG_HOST', '127.0.0.1')
+
+PIPELINE_TERMINAL_HOPS = ('copy', 'post')
+
+# (timestamp, telemetry_type, sensor_id, sequence_number) of a record
+# db row tuples (`DB_ALL_COLS` order)
+ROW_FIELDS = (0, 1, 2, 4)
+# `row_to_dict()` dicts, like the forwarder's
+DICT_FIELDS = ('reading_timestamp', 'telemetry_type', 'sensor_id', 'sequence_number')
+
+
+class PipelineTracer:
+
+    def __init__(self, enabled: bool = PIPELINE_TRACE_ENABLED, sample_every: int = PIPELINE_TRACE_SAMPLE_EVERY, window: int = PIPELINE_TRACE_WINDOW, max_spans: int = PIPELINE_TRACE_MAX_SPANS):
+        self.enabled = enabled
+        # power of 2, so sampling is a bit mask
+        self.sample_every = 1 << (max(1, sample_every).bit_length() - 1)
+        self._mask = self.sample_every - 1
+        self.window = window
+        self.max_spans = max_spans
+        # (sensor_id, sequence_number) -> {hop: time}, least recently stamped first
+        self._spans = OrderedDict()
+        # (stage, telemetry_type) -> (histogram child's observe, last `window` durations)
+        self._series = {}
+        # name -> () -> depth (or awaitable depth)
+        self._depths = {}
+
+    def is_sampled(self, sequence_number: int) -> bool:
+        return self.enabled and not sequence_number & self._mask
+
+    def sampled(self, records, fields=ROW_FIELDS) -> list:
+        if not self.enabled:
+            return []
+        seq_f = fields[3]
+        mask = self._mask
+        return [record for record in records if not record[seq_f] & mask]
+
+    def observe(self, stage: str, telem_type: str, seconds: float) -> None:
+        series = self._series.get((stage, telem_type))
+        if series is None:
+            # `.labels()` is a lock + dict lookup, only once per (stage, type)
+            series = self._series[(stage, telem_type)] = (PIPELINE_STAGE_TIME.labels(stage, telem_type).observe, deque(maxlen=self.window))
+        observe, recent = series
+        observe(seconds)
+        recent.append(seconds)
+
+    def mark(self, records, hop: str, since: str = 'created', fields=ROW_FIELDS) -> None:
+        """
+        Stamp `hop` on every sampled record, and observe `hop - since` as stage `hop`.
+        - spans are only started by a `since='created'` hop
+        - skipped for a record whose span never got `since` (evicted, or read back by another process)
+        """
+        if not self.enabled:
+            return
+        ts_f, type_f, sensor_f, seq_f = fields
+        mask = self._mask
+        # the only per-message work for the unsampled ones
+        sampled = [record for record in records if not record[seq_f] & mask]
+        if not sampled:
+            return
+        now = time.time_ns()
+        spans = self._spans
+        for record in sampled:
+            key = (record[sensor_f], record[seq_f])
+            span = spans.get(key)
+            if span is None:
+                if since != 'created':
+                    # not ours from the start (spool replay, another worker's message...)
+                    continue
+                span = spans[key] = {'created': to_epoch_ns(record[ts_f])}
+                if len(spans) > self.max_spans:
+                    spans.popitem(last=False)
+            else:
+                spans.move_to_end(key)
+
+            start = span.get(since)
+            if start is not None:
+                self.observe(hop, record[type_f], (now - start) / 1e9)
+            span[hop] = now
+            if all(terminal in span for terminal in PIPELINE_TERMINAL_HOPS):
+                del spans[key]
+
+    def add_depth(self, name: str, get_depth) -> None:
+        # shown next to the stages on /debug/pipeline, `get_depth()` may be a coroutine
+        self._depths[name] = get_depth
+
+    async def snapshot(self) -> dict:
+        stages = {}
+        for (stage, telem_type), (_, recent) in self._series.items():
+            durations = sorted(recent)
+            if not durations:
+                continue
+            n = len(durations)
+            stages.setdefault(stage, {})[telem_type] = {
+                'samples': n,
+                'p50_ms': durations[n // 2] * 1000,
+                'p99_ms': durations[min(n - 1, int(n * 0.99))] * 1000,
+            }
+
+        depths = {}
+        for name, get_depth in self._depths.items():
+            try:
+                depth = get_depth()
+                if inspect.isawaitable(depth):
+                    depth = await depth
+            except Exception as e:
+                depth = f"error: {e}"
+            depths[name] = depth
+
+        return {
+            'enabled': self.enabled,
+            'sample_every': self.sample_every,
+            'open_spans': len(self._spans),
+            'stages': stages,
+            'queue_depths': depths,
+        }
+
+
+# one per process, like the prometheus metrics
+TRACER = PipelineTracer()
+
+
+async def run_debug_server(port: int = PIPELINE_DEBUG_PORT, tracer: PipelineTracer = TRACER, profiler=None, host: str = PIPELINE_DEBUG_HOST):
+    # GET /debug/pipeline, for processes without a web framework of their own (`client.py`, `metrics_client.py`)
+    # + /debug/profile* with a `SamplingProfiler` (`sampling_profiler.py`)
+    from aiohttp import web
+
+    async def get_pipeline(request):
+        return web.json_response(await tracer.snapshot())
+
+    app = web.Application()
+    app.router.add_get('/debug/pipeline', get_pipeline)
+    if profiler is not None:
+        from sampling_profiler import add_aiohttp_routes
+        add_aiohttp_routes(app, profiler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    log.info(f"/debug/pipeline{' + /debug/profile' if profiler is not None else ''} on {host}:{port}")
+    try:
+        # serves from its own tasks, just hold the runner open
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
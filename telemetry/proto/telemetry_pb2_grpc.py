@@ -39,6 +39,11 @@ class TelemetryServiceStub(object):
                 request_serializer=telemetry__pb2.TelemetryRequest.SerializeToString,
                 response_deserializer=telemetry__pb2.TelemetryResponse.FromString,
                 _registered_method=True)
+        self.GetTelemetryBatchStream = channel.unary_stream(
+                '/telemetry.TelemetryService/GetTelemetryBatchStream',
+                request_serializer=telemetry__pb2.TelemetryRequest.SerializeToString,
+                response_deserializer=telemetry__pb2.TelemetryBatch.FromString,
+                _registered_method=True)
 
 
 class TelemetryServiceServicer(object):
@@ -51,6 +56,13 @@ class TelemetryServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetTelemetryBatchStream(self, request, context):
+        """same data, but the server coalesces up to `max_batch_size` readings (or `linger_ms`) into each message
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_TelemetryServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -59,6 +71,11 @@ def add_TelemetryServiceServicer_to_server(servicer, server):
                     request_deserializer=telemetry__pb2.TelemetryRequest.FromString,
                     response_serializer=telemetry__pb2.TelemetryResponse.SerializeToString,
             ),
+            'GetTelemetryBatchStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.GetTelemetryBatchStream,
+                    request_deserializer=telemetry__pb2.TelemetryRequest.FromString,
+                    response_serializer=telemetry__pb2.TelemetryBatch.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'telemetry.TelemetryService', rpc_method_handlers)
@@ -96,3 +113,30 @@ class TelemetryService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GetTelemetryBatchStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/telemetry.TelemetryService/GetTelemetryBatchStream',
+            telemetry__pb2.TelemetryRequest.SerializeToString,
+            telemetry__pb2.TelemetryBatch.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
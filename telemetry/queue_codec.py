@@ -0,0 +1,98 @@
+"""
+Codecs for `queue:telemetry` payloads.
+
+Every binary payload starts with a 1 byte version, so a reader can decode a mix of codecs
+(like during a rollout, when old JSON entries are still sitting in the redis backlog):
+- `json`    : (legacy, no version byte) json dict keyed by db column, always starts with `{`
+- `proto`   : 0x01 + serialized `TelemetryResponse`
+- `msgpack` : 0x02 + msgpack array of the db row, in `DB_ALL_COLS` order
+    - floats packed as float32, which is all the .proto floats ever had
+
+`decode_payload()` always gives back a db row tuple.
+"""
+import os
+import json
+
+import msgpack
+
+from proto import telemetry_pb2
+
+from decoder import DB_ALL_COLS, decode_row, row_to_dict
+
+
+REDIS_QUEUE_CODEC = os.environ.get('REDIS_QUEUE_CODEC', 'msgpack')
+
+VERSION_PROTO = 0x01
+VERSION_MSGPACK = 0x02
+# first byte of a legacy json dict payload
+_JSON_START = ord('{')
+
+
+class JsonCodec:
+    name = 'json'
+
+    def encode(self, telem_response, row: tuple) -> bytes:
+        return json.dumps(row_to_dict(row)).encode()
+
+    def decode(self, payload) -> tuple:
+        telem_dict = json.loads(payload)
+        return tuple(telem_dict.get(col) for col in DB_ALL_COLS)
+
+
+class ProtoCodec:
+    name = 'proto'
+    _header = bytes([VERSION_PROTO])
+
+    def encode(self, telem_response, row: tuple) -> bytes:
+        return self._header + telem_response.SerializeToString()
+
+    def decode(self, payload) -> tuple:
+        return decode_row(telemetry_pb2.TelemetryResponse.FromString(payload[1:]))
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    _header = bytes([VERSION_MSGPACK])
+
+    def __init__(self):
+        self._packer = msgpack.Packer(use_single_float=True)
+
+    def encode(self, telem_response, row: tuple) -> bytes:
+        return self._header + self._packer.pack(row)
+
+    def decode(self, payload) -> tuple:
+        return msgpack.unpackb(memoryview(payload)[1:], use_list=False)
+
+
+CODECS = {
+    'json': JsonCodec(),
+    'proto': ProtoCodec(),
+    'msgpack': MsgpackCodec(),
+}
+
+_CODECS_BY_VERSION = {
+    _JSON_START: CODECS['json'],
+    VERSION_PROTO: CODECS['proto'],
+    VERSION_MSGPACK: CODECS['msgpack'],
+}
+
+
+def get_codec(name: str = REDIS_QUEUE_CODEC):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown queue codec: {name}. Must be one of : {list(CODECS)}")
+
+
+def decode_payload(payload) -> tuple:
+    """
+    Any queue payload (bytes, or str for old json entries) -> db row tuple.
+    - picks the codec from the version byte
+    """
+    if isinstance(payload, str):
+        return CODECS['json'].decode(payload)
+    try:
+        codec = _CODECS_BY_VERSION[payload[0]]
+    except (KeyError, IndexError):
+        raise ValueError(f"Unknown queue payload version: {payload[:1]!r}")
+    return codec.decode(payload)
@@ -0,0 +1,118 @@
+"""
+Micro-batched producer/consumer for the `queue:telemetry` Redis list.
+
+One round trip per batch instead of one per gRPC message:
+- producer: collects payloads for up to `REDIS_PUSH_BATCH_SIZE` msgs or `REDIS_PUSH_LINGER_MS`,
+    then sends them with multi-value `LPUSH`es in one pipeline
+- consumer: `RPOP key count` drains up to `REDIS_POP_BATCH_SIZE` msgs per call
+    - (`LMPOP` needs Redis 7, `RPOP count` works from 6.2)
+    - only falls back to a blocking `BRPOP` when the list is empty
+"""
+import os
+import asyncio
+
+from prometheus_client import Histogram, Gauge
+
+
+REDIS_QUEUE_LENGTH = Gauge('redis_queue_len', 'Length of Redis queue, indicating backpressure from gRPC server.')
+    # 1 - 11 (at start)
+REDIS_MSGS_PER_ROUND_TRIP = Histogram('redis_msgs_per_round_trip', 'Messages moved per Redis round trip.', ['op'], buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096])
+
+REDIS_QUEUE_KEY = 'queue:telemetry'
+
+# knobs
+REDIS_PUSH_BATCH_SIZE = int(os.environ.get('REDIS_PUSH_BATCH_SIZE', 256))
+REDIS_PUSH_LINGER_MS = float(os.environ.get('REDIS_PUSH_LINGER_MS', 5))
+REDIS_POP_BATCH_SIZE = int(os.environ.get('REDIS_POP_BATCH_SIZE', 256))
+
+# keep single LPUSH commands a sane size inside the pipeline
+_MAX_VALUES_PER_LPUSH = 1000
+
+
+class RedisBatchProducer:
+    """
+    Buffers payloads and LPUSHes them in batches.
+    - flushes when `max_batch_size` payloads are pending, or `linger_ms` after the first pending payload
+        - the time window needs `run_linger()` running as a task
+    - flushes are serialized, so list order == put order
+    """
+    # label for `redis_msgs_per_round_trip`
+    _op = 'lpush'
+
+    def __init__(self, r, key: str = REDIS_QUEUE_KEY, max_batch_size: int = REDIS_PUSH_BATCH_SIZE, linger_ms: float = REDIS_PUSH_LINGER_MS):
+        self._r = r
+        self.key = key
+        self.max_batch_size = max_batch_size
+        self.linger_s = linger_ms / 1000
+
+        self._pending = []
+        self._send_lock = asyncio.Lock()
+        self._has_pending = asyncio.Event()
+
+    @property
+    def idle(self) -> bool:
+        # nothing buffered, and no push on its way to redis
+        return not self._pending and not self._send_lock.locked()
+
+    async def put(self, payload) -> None:
+        self._pending.append(payload)
+        if len(self._pending) == 1:
+            # start the linger window
+            self._has_pending.set()
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+
+    async def put_many(self, payloads) -> None:
+        was_empty = not self._pending
+        self._pending.extend(payloads)
+        if was_empty and self._pending:
+            self._has_pending.set()
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+
+    async def flush(self):
+        # returns the queue length after the push, or None if there was nothing to push
+        async with self._send_lock:
+            if not self._pending:
+                return None
+            # swap before awaiting, new puts go into a fresh list
+            batch, self._pending = self._pending, []
+
+            r_len = await self._send(batch)
+            REDIS_QUEUE_LENGTH.set(r_len)
+            REDIS_MSGS_PER_ROUND_TRIP.labels(self._op).observe(len(batch))
+            return r_len
+
+    async def _send(self, batch: list) -> int:
+        async with self._r.pipeline(transaction=False) as pipe:
+            for i in range(0, len(batch), _MAX_VALUES_PER_LPUSH):
+                pipe.lpush(self.key, *batch[i:i + _MAX_VALUES_PER_LPUSH])
+            results = await pipe.execute()
+        return results[-1]
+
+    async def run_linger(self):
+        # time window flushes, so a slow stream doesn't sit in the buffer
+        while True:
+            await self._has_pending.wait()
+            self._has_pending.clear()
+            await asyncio.sleep(self.linger_s)
+            await self.flush()
+
+
+async def pop_batch(r, key: str = REDIS_QUEUE_KEY, count: int = REDIS_POP_BATCH_SIZE, timeout: float = 0) -> list:
+    """
+    Pop up to `count` of the oldest payloads (FIFO with the producer's LPUSH).
+    - one `RPOP key count` round trip while there's a backlog
+    - blocks on `BRPOP` (up to `timeout` seconds, 0 == forever) when the list is empty
+        - returns [] on timeout
+    """
+    payloads = await r.rpop(key, count)
+    if payloads:
+        REDIS_MSGS_PER_ROUND_TRIP.labels('rpop').observe(len(payloads))
+        return payloads
+
+    popped = await r.brpop([key], timeout=timeout)
+    if popped is None:
+        return []
+    REDIS_MSGS_PER_ROUND_TRIP.labels('rpop').observe(1)
+    return [popped[1]]
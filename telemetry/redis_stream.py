@@ -0,0 +1,181 @@
+"""
+Redis Streams consumer-group mode for telemetry ingestion (`QUEUE_MODE=stream` in `client.py`).
+
+The `queue:telemetry` list only lets one reader make progress safely.
+With a stream + consumer group, several `client.py` processes share one stream:
+- producer: pipelined `XADD`s, length capped with `MAXLEN ~`
+- consumer: `XREADGROUP` batches, explicit `XACK` once the rows are committed to the db
+    - on startup, re-reads its own pending entries first (same consumer name after a restart)
+    - entries left pending by a crashed worker are taken over with `XAUTOCLAIM`
+"""
+import os
+import logging
+import socket
+import time
+import asyncio
+
+import redis.exceptions
+
+from prometheus_client import Gauge, Counter
+
+from redis_queue import RedisBatchProducer, REDIS_QUEUE_LENGTH, REDIS_MSGS_PER_ROUND_TRIP, REDIS_PUSH_BATCH_SIZE, REDIS_PUSH_LINGER_MS, REDIS_POP_BATCH_SIZE
+
+log = logging.getLogger('RedisStreamConsumer')
+
+
+REDIS_STREAM_GROUP_LAG = Gauge('redis_stream_group_lag', 'Stream entries not yet delivered to the consumer group.', ['group'])
+REDIS_STREAM_CONSUMER_LAG = Gauge('redis_stream_consumer_lag_seconds', 'Age (seconds) of the newest stream entry this consumer has read.', ['consumer'])
+REDIS_STREAM_CONSUMER_PENDING = Gauge('redis_stream_consumer_pending', 'Stream entries delivered to this consumer but not acked yet.', ['consumer'])
+REDIS_STREAM_RECLAIMED = Counter('redis_stream_reclaimed', 'Stream entries taken over from idle consumers with XAUTOCLAIM.', ['consumer'])
+
+REDIS_STREAM_KEY = 'stream:telemetry'
+# field name of the payload inside each entry
+_PAYLOAD_FIELD = b'p'
+
+# knobs
+REDIS_STREAM_GROUP = os.environ.get('REDIS_STREAM_GROUP', 'telemetry_workers')
+REDIS_STREAM_CONSUMER = os.environ.get('REDIS_STREAM_CONSUMER', f"{socket.gethostname()}-{os.getpid()}")
+REDIS_STREAM_MAXLEN = int(os.environ.get('REDIS_STREAM_MAXLEN', 1000000))
+REDIS_STREAM_BLOCK_MS = int(os.environ.get('REDIS_STREAM_BLOCK_MS', 1000))
+# pending entries idle for this long belong to a dead worker
+REDIS_STREAM_CLAIM_IDLE_MS = int(os.environ.get('REDIS_STREAM_CLAIM_IDLE_MS', 30000))
+REDIS_STREAM_CLAIM_INTERVAL_S = float(os.environ.get('REDIS_STREAM_CLAIM_INTERVAL_S', 10))
+REDIS_STREAM_MONITOR_INTERVAL_S = float(os.environ.get('REDIS_STREAM_MONITOR_INTERVAL_S', 5))
+
+
+def _entry_id_ms(entry_id) -> int:
+    # stream ids are `<ms since epoch>-<seq>`
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    return int(entry_id.split('-', 1)[0])
+
+
+class RedisStreamProducer(RedisBatchProducer):
+    """
+    Same batching as `RedisBatchProducer`, but `XADD`s to a stream instead of `LPUSH`ing to a list.
+    """
+    _op = 'xadd'
+
+    def __init__(self, r, key: str = REDIS_STREAM_KEY, max_batch_size: int = REDIS_PUSH_BATCH_SIZE, linger_ms: float = REDIS_PUSH_LINGER_MS, maxlen: int = REDIS_STREAM_MAXLEN):
+        super().__init__(r, key, max_batch_size, linger_ms)
+        self.maxlen = maxlen
+
+    async def _send(self, batch: list) -> int:
+        async with self._r.pipeline(transaction=False) as pipe:
+            for payload in batch:
+                # `MAXLEN ~`, trimming only whole radix tree nodes is way cheaper than exact trimming
+                pipe.xadd(self.key, {_PAYLOAD_FIELD: payload}, maxlen=self.maxlen, approximate=True)
+            pipe.xlen(self.key)
+            results = await pipe.execute()
+        return results[-1]
+
+
+class RedisStreamConsumer:
+    """
+    One consumer of the `REDIS_STREAM_GROUP` consumer group.
+    - `read_batch()` -> list of (entry_id, payload)
+    - `ack(entry_ids)` once the rows made it into the db
+    """
+
+    def __init__(self, r, key: str = REDIS_STREAM_KEY, group: str = REDIS_STREAM_GROUP, consumer: str = REDIS_STREAM_CONSUMER, count: int = REDIS_POP_BATCH_SIZE):
+        self._r = r
+        self.key = key
+        self.group = group
+        self.consumer = consumer
+        self.count = count
+
+        # our own pending entries (from before a restart) from '0', moving past each batch read,
+        # then '>' == never delivered entries
+        self._read_id = '0'
+        self._last_claim = time.monotonic()
+
+    async def ensure_group(self):
+        try:
+            await self._r.xgroup_create(self.key, self.group, id='0', mkstream=True)
+            log.info(f"Created consumer group `{self.group}` on `{self.key}`")
+        except redis.exceptions.ResponseError as e:
+            # BUSYGROUP == another worker already made it
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _to_batch(self, entries) -> list:
+        batch = []
+        for entry_id, fields in entries:
+            # fields are empty if the entry was trimmed (MAXLEN) while still pending
+            payload = fields.get(_PAYLOAD_FIELD) if fields else None
+            batch.append((entry_id, payload))
+        return batch
+
+    async def _reclaim(self) -> list:
+        # take over entries a crashed/stuck worker never acked
+        batch = []
+        start_id = '0-0'
+        while True:
+            result = await self._r.xautoclaim(self.key, self.group, self.consumer, REDIS_STREAM_CLAIM_IDLE_MS, start_id=start_id, count=self.count)
+            start_id, entries = result[0], result[1]
+            batch.extend(self._to_batch(entries))
+            if len(batch) >= self.count or start_id in (b'0-0', '0-0'):
+                break
+        if batch:
+            log.info(f"Reclaimed {len(batch)} idle pending entries")
+            REDIS_STREAM_RECLAIMED.labels(self.consumer).inc(len(batch))
+        return batch
+
+    async def read_batch(self, block_ms: int = REDIS_STREAM_BLOCK_MS) -> list:
+        if time.monotonic() - self._last_claim >= REDIS_STREAM_CLAIM_INTERVAL_S:
+            self._last_claim = time.monotonic()
+            reclaimed = await self._reclaim()
+            if reclaimed:
+                return reclaimed
+
+        entries = []
+        if self._read_id != '>':
+            # our own pending entries first, no blocking
+            entries = await self._xreadgroup(self._read_id, block_ms=None)
+            if entries:
+                # still pending until their flush acks them, the next read starts after them
+                self._read_id = entries[-1][0]
+            else:
+                self._read_id = '>'
+        if not entries:
+            entries = await self._xreadgroup('>', block_ms=block_ms)
+        if not entries:
+            return []
+
+        REDIS_MSGS_PER_ROUND_TRIP.labels('xreadgroup').observe(len(entries))
+        REDIS_STREAM_CONSUMER_LAG.labels(self.consumer).set(max(0.0, time.time() - _entry_id_ms(entries[-1][0]) / 1000))
+        return self._to_batch(entries)
+
+    async def _xreadgroup(self, read_id: str, block_ms) -> list:
+        response = await self._r.xreadgroup(self.group, self.consumer, {self.key: read_id}, count=self.count, block=block_ms)
+        return response[0][1] if response else []
+
+    async def ack(self, entry_ids: list):
+        if entry_ids:
+            await self._r.xack(self.key, self.group, *entry_ids)
+
+    async def run_monitor(self):
+        # lag/pending gauges, to know when to scale workers out
+        while True:
+            try:
+                for group_info in await self._r.xinfo_groups(self.key):
+                    group_name = group_info.get('name')
+                    if isinstance(group_name, bytes):
+                        group_name = group_name.decode()
+                    # `lag` needs Redis 7+
+                    if group_name == self.group and group_info.get('lag') is not None:
+                        REDIS_STREAM_GROUP_LAG.labels(self.group).set(group_info['lag'])
+
+                pending = await self._r.xpending(self.key, self.group)
+                own_pending = 0
+                for consumer_info in pending.get('consumers', []):
+                    name = consumer_info['name']
+                    if isinstance(name, bytes):
+                        name = name.decode()
+                    if name == self.consumer:
+                        own_pending = consumer_info['pending']
+                REDIS_STREAM_CONSUMER_PENDING.labels(self.consumer).set(own_pending)
+                REDIS_QUEUE_LENGTH.set(await self._r.xlen(self.key))
+            except redis.exceptions.RedisError as e:
+                log.error(f"[run_monitor] {e}")
+            await asyncio.sleep(REDIS_STREAM_MONITOR_INTERVAL_S)
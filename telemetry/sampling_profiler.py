@@ -0,0 +1,187 @@
+"""
+Sampling profiler for the long running processes (`client.py`, `metrics_client.py`, `backend.py`), toggled at runtime.
+
+Instead of restarting under `cProfile` + waiting for exit:
+- a sampler thread grabs the event loop thread's stack every `PROFILER_INTERVAL_MS` (`sys._current_frames()`)
+    - nothing is hooked into the loop itself, so overhead is one stack walk per sample
+    - each sample is rooted at the asyncio task running at that moment (`task:<name> (<coroutine>)`),
+        so time is attributed per coroutine, and `<loop>` is the loop itself (select, callbacks)
+- output is collapsed stacks (`root;caller;...;callee <count>` per line)
+    - load into https://www.speedscope.app, or `flamegraph.pl profile.collapsed > profile.svg`
+- toggles:
+    - HTTP: `/debug/profile/start`, `/debug/profile/stop` (returns the collapsed stacks), `/debug/profile?seconds=N`
+        - on `client.py`'s debug server (`PIPELINE_DEBUG_PORT`), `metrics_client.py`'s (`METRICS_DEBUG_PORT`), `backend.py`'s own routes (`BACKEND_DEBUG_ROUTES=1`)
+        - the debug servers listen on `PIPELINE_DEBUG_HOST` (loopback by default)
+    - `kill -USR2 <pid>`: start, and again to stop + write `<PROFILER_DIR>/<process>-<time>.collapsed`
+- stops by itself after `PROFILER_MAX_SECONDS` (and writes the file), in case nobody comes back for it
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import threading
+from collections import Counter
+
+
+log = logging.getLogger('SamplingProfiler')
+
+# knobs
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+PROFILER_MAX_SECONDS = float(os.environ.get('PROFILER_MAX_SECONDS', 300))
+PROFILER_DIR = os.environ.get('PROFILER_DIR', os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'logs', 'profiles'))
+
+
+class SamplingProfiler:
+
+    def __init__(self, process: str, interval_ms: float = PROFILER_INTERVAL_MS, max_seconds: float = PROFILER_MAX_SECONDS, directory: str = PROFILER_DIR):
+        self.process = process
+        self.interval_s = interval_ms / 1000
+        self.max_seconds = max_seconds
+        self.directory = os.path.abspath(directory)
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started_at = None
+        # code object -> frame label, so a sample is mostly dict lookups
+        self._labels = {}
+        # last finished capture, for a `stop()` after the auto stop
+        self._last = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = None) -> bool:
+        """
+        Start sampling the calling thread's event loop (call it from the loop thread).
+        - returns False if it's already running
+        """
+        if self.running:
+            return False
+        if interval_ms:
+            self.interval_s = interval_ms / 1000
+        loop = asyncio.get_running_loop()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(threading.get_ident(), loop), name='sampling-profiler', daemon=True)
+        self._thread.start()
+        log.info(f"Started, every {self.interval_s * 1000:.1f}ms")
+        return True
+
+    def stop(self) -> str:
+        # -> collapsed stacks of the capture (the last one, if it already stopped by itself)
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+        if self._thread is not None:
+            self._thread = None
+            self._last = self.collapsed()
+        return self._last or ''
+
+    def collapsed(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + '\n'
+
+    def save(self, collapsed: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.process}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        with open(path, 'w') as f:
+            f.write(collapsed)
+        log.info(f"{self._samples} samples -> {path}")
+        return path
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _task_label(self, loop) -> str:
+        task = asyncio.current_task(loop)
+        if task is None:
+            return '<loop>'
+        coro = task.get_coro()
+        return f"task:{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+    def _sample(self, thread_id: int, loop) -> None:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            return
+        label = self._label
+        stack = []
+        while frame is not None:
+            stack.append(label(frame.f_code))
+            frame = frame.f_back
+        stack.append(self._task_label(loop))
+        stack.reverse()
+        self._stacks[';'.join(stack)] += 1
+        self._samples += 1
+
+    def _run(self, thread_id: int, loop):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval_s):
+            if time.monotonic() > deadline:
+                log.warning(f"Still running after {self.max_seconds:.0f}s, stopping")
+                self._last = self.collapsed()
+                self.save(self._last)
+                return
+            try:
+                self._sample(thread_id, loop)
+            except Exception as e:
+                # (a task finishing mid-sample, etc.) not worth dying for
+                log.debug(f"sample failed: {e}")
+
+    def toggle(self) -> None:
+        # SIGUSR2
+        if self.running:
+            self.save(self.stop())
+        else:
+            self.start()
+
+    async def capture(self, seconds: float, interval_ms: float = None) -> str:
+        # start, wait, stop (the loop keeps running meanwhile, that's what gets sampled)
+        if not self.start(interval_ms):
+            raise RuntimeError("profiler already running")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            collapsed = self.stop()
+        return collapsed
+
+    def install_signal_toggle(self, signum: int = signal.SIGUSR2) -> None:
+        # from the running loop (`loop.add_signal_handler()` == handler runs on the loop)
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, self.toggle)
+        except (ValueError, RuntimeError, NotImplementedError) as e:
+            # loop not in the main thread (or windows), HTTP toggle only
+            log.warning(f"no signal toggle: {e}")
+            return
+        log.info(f"`kill -{signal.Signals(signum).name[3:]} {os.getpid()}` toggles the profiler")
+
+
+def add_aiohttp_routes(app, profiler: SamplingProfiler) -> None:
+    # /debug/profile* on an aiohttp app (`pipeline_trace.run_debug_server()`)
+    from aiohttp import web
+
+    async def start(request):
+        started = profiler.start(float(request.query.get('interval_ms', 0)))
+        return web.json_response({'started': started, 'interval_ms': profiler.interval_s * 1000})
+
+    async def stop(request):
+        return web.Response(text=profiler.stop())
+
+    async def capture(request):
+        try:
+            collapsed = await profiler.capture(float(request.query.get('seconds', 10)), float(request.query.get('interval_ms', 0)))
+        except RuntimeError as e:
+            return web.json_response({'error': str(e)}, status=409)
+        return web.Response(text=collapsed)
+
+    app.router.add_get('/debug/profile/start', start)
+    app.router.add_get('/debug/profile/stop', stop)
+    app.router.add_get('/debug/profile', capture)
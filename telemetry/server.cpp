@@ -3,6 +3,7 @@
 #include <queue>
 #include <chrono>
 #include <atomic>
+#include <algorithm>
 #include <cstdlib>
 #include <signal.h>
 #include <csignal>
@@ -65,6 +66,31 @@ class TelemetryQueue {
         return false;
     }
     
+    // coalesce up to `max_items` into `batch`
+    // - waits up to `timeout` for the first item
+    // - then keeps collecting until `max_items`, or until `linger` has passed since the first item
+    int try_pop_batch(telemetry::TelemetryBatch& batch, int max_items, std::chrono::milliseconds linger, std::chrono::milliseconds timeout = std::chrono::milliseconds(100)) {
+        std::unique_lock<std::mutex> lock(mutex_);
+        if (!cv_.wait_for(lock, timeout, [this] {
+            return !queue_.empty();
+        })) {
+            return 0;
+        }
+
+        auto deadline = std::chrono::steady_clock::now() + linger;
+        while (batch.responses_size() < max_items) {
+            // (lock is released while waiting, so sensors can keep pushing)
+            if (queue_.empty() && !cv_.wait_until(lock, deadline, [this] {
+                return !queue_.empty();
+            })) {
+                break;
+            }
+            *batch.add_responses() = std::move(queue_.front());
+            queue_.pop();
+        }
+        return batch.responses_size();
+    }
+    
     size_t size() {
         std::lock_guard<std::mutex> lock(mutex_);
         return queue_.size();
@@ -75,6 +101,11 @@ class TelemetryQueue {
 // global queue for gRPC streaming
 TelemetryQueue telem_q;
 
+// GetTelemetryBatchStream defaults (when the request leaves them at 0) + cap
+const int DEFAULT_BATCH_SIZE = 256;
+const int MAX_BATCH_SIZE = 4096;
+const int DEFAULT_LINGER_MS = 5;
+
 // Sensor List
 std::vector<std::tuple<std::string, telemetry::TelemetryType, telemetry::System, std::string, std::uint64_t>> sensor_names = {
     // sensor_id, TelemetryType, System, unit, interval_ms
@@ -124,9 +155,21 @@ float get_randf_in_range(float lower, float upper) {
     return random_float;
 }
 
-std::string get_iso8601_timestamp() {
-    auto now = boost::posix_time::microsec_clock::universal_time();
-    return boost::posix_time::to_iso_extended_string(now) + "Z";
+int64_t get_epoch_ns() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::system_clock::now().time_since_epoch()).count();
+}
+
+std::string get_iso8601_timestamp(int64_t epoch_ns) {
+    // same instant as `epoch_ns`, for the (older) clients that still read the string
+    auto time = boost::posix_time::from_time_t(epoch_ns / 1000000000) + boost::posix_time::microseconds((epoch_ns / 1000) % 1000000);
+    return boost::posix_time::to_iso_extended_string(time) + "Z";
+}
+
+void set_timestamps(telemetry::TelemetryResponse& resp) {
+    // one clock read for both fields
+    int64_t now_ns = get_epoch_ns();
+    resp.set_timestamp_ns(now_ns);
+    resp.set_timestamp(get_iso8601_timestamp(now_ns));
 }
 
 
@@ -152,7 +195,7 @@ void temp_sensor_worker(int interval_ms, std::string sensor_id, telemetry::Syste
 
         // telem response container
         telemetry::TelemetryResponse resp;
-        resp.set_timestamp(get_iso8601_timestamp());
+        set_timestamps(resp);
         resp.set_type(telemetry::TelemetryType::TEMPERATURE);
 
         // the "inner" message "class"
@@ -212,7 +255,7 @@ void press_sensor_worker(int interval_ms, std::string sensor_id, telemetry::Syst
 
         // telem response container
         telemetry::TelemetryResponse resp;
-        resp.set_timestamp(get_iso8601_timestamp());
+        set_timestamps(resp);
         resp.set_type(telemetry::TelemetryType::PRESSURE);
 
         // the "inner" message "class"
@@ -273,7 +316,7 @@ void velo_sensor_worker(int interval_ms, std::string sensor_id, telemetry::Syste
         
         // telem response container
         telemetry::TelemetryResponse resp;
-        resp.set_timestamp(get_iso8601_timestamp());
+        set_timestamps(resp);
         resp.set_type(telemetry::TelemetryType::VELOCITY);
         
         // the "inner" message "class"
@@ -347,6 +390,34 @@ public:
 
         return Status::OK;
     }
+
+    Status GetTelemetryBatchStream(ServerContext* context, const telemetry::TelemetryRequest* request, ServerWriter<telemetry::TelemetryBatch>* writer) override {
+        // client picks the batch size + linger time
+        int max_batch_size = request->max_batch_size() > 0 ? std::min<int>(request->max_batch_size(), MAX_BATCH_SIZE) : DEFAULT_BATCH_SIZE;
+        std::chrono::milliseconds linger(request->linger_ms() > 0 ? request->linger_ms() : DEFAULT_LINGER_MS);
+        std::cout << "Client connected for telemetry batch stream! (max_batch_size " << max_batch_size << ", linger_ms " << linger.count() << ")\n";
+
+        // reused for every batch
+        telemetry::TelemetryBatch batch;
+
+        while (!context->IsCancelled() && running.load()) {
+            batch.Clear();
+            if (telem_q.try_pop_batch(batch, max_batch_size, linger, std::chrono::milliseconds(500)) > 0) {
+                if (!writer->Write(batch)) {
+                    std::cout << "Client disconnected :(\n";
+                    break;
+                }
+            }
+        }
+
+        if (context->IsCancelled()) {
+            std::cout << "Client cancelled connection.\n";
+        } else {
+            std::cout << "Telemetry batch stream has been cancelled.\n";
+        }
+
+        return Status::OK;
+    }
 };
 
 void start_grpc_server() {
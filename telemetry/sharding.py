@@ -0,0 +1,212 @@
+"""
+Multi-process sharded ingestion (`QUEUE_MODE=sharded` in `client.py`).
+
+One asyncio thread runs out of CPU on decode + batching way before postgres is the limit, so:
+- the parent process only reads the gRPC stream, and routes each message by `crc32(sensor_id) % INGEST_SHARDS`
+    - messages go over as serialized `TelemetryResponse` bytes, micro-batched per shard
+- each shard is a worker process with its own decode -> `DBBatcher` -> binary COPY pipeline (own db pool, forwarder, spool)
+- one FIFO queue + one reader per shard, so every sensor's messages are handled in order
+- the supervisor restarts crashed workers (same queue, so queued batches aren't lost)
+- per-shard throughput is exported by the parent, workers export the rest on `SHARD_METRICS_BASE_PORT + shard`
+
+NOTE: no redis in this mode, the per-shard queues are the buffer (bounded, full queues backpressure the gRPC reader)
+"""
+import os
+import logging
+import zlib
+import time
+import asyncio
+import multiprocessing as mp
+import queue as queue_lib
+
+from prometheus_client import start_http_server, Counter, Gauge
+
+from decoder import decode_rows, row_to_dict
+from pipeline_log import setup_logging
+import telemetry_pb2
+
+log = logging.getLogger('ShardSupervisor')
+
+
+SHARD_PROCESSED_MSGS = Counter('shard_processed_msgs', 'Telemetry messages decoded + batched by each shard worker.', ['shard'])
+SHARD_THROUGHPUT = Gauge('shard_msgs_per_second', 'Messages per second handled by each shard worker.', ['shard'])
+SHARD_QUEUE_DEPTH = Gauge('shard_queue_depth', 'Batches waiting in each shard queue.', ['shard'])
+SHARD_RESTARTS = Counter('shard_worker_restarts', 'Shard worker processes restarted by the supervisor.', ['shard'])
+SHARD_BACKPRESSURE = Counter('shard_queue_full', 'Times the gRPC reader had to wait on a full shard queue.', ['shard'])
+
+# knobs
+INGEST_SHARDS = int(os.environ.get('INGEST_SHARDS', os.cpu_count() or 1))
+SHARD_BATCH_SIZE = int(os.environ.get('SHARD_BATCH_SIZE', 256))
+SHARD_LINGER_MS = float(os.environ.get('SHARD_LINGER_MS', 5))
+# in batches, not messages
+SHARD_QUEUE_MAXSIZE = int(os.environ.get('SHARD_QUEUE_MAXSIZE', 1024))
+SHARD_METRICS_BASE_PORT = int(os.environ.get('SHARD_METRICS_BASE_PORT', 8010))
+SHARD_SUPERVISE_INTERVAL_S = float(os.environ.get('SHARD_SUPERVISE_INTERVAL_S', 1))
+
+
+def shard_for(sensor_id: str, num_shards: int) -> int:
+    # stable across processes + restarts (unlike `hash()`)
+    return zlib.crc32(sensor_id.encode()) % num_shards
+
+
+def shard_worker_main(shard_id: int, shard_queue, processed, metrics_port: int):
+    # entry point of a worker process
+    start_http_server(metrics_port)
+    try:
+        asyncio.run(_run_shard_worker(shard_id, shard_queue, processed))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _run_shard_worker(shard_id: int, shard_queue, processed):
+    # the same pipeline `client.py` runs, just on this shard's messages
+    # (not from `client`: it's already this process' `__mp_main__`, importing it again re-registers its metrics)
+    from pipeline import make_db_flusher, run_spool_replayer, DB_CONN_KWARGS
+    from db_pool import make_pool
+    from spool import make_spool
+    from batcher import DBBatcher
+    from forwarder import DashboardForwarder
+
+    name = f"telemetry_shard_{shard_id}"
+    # same logging knobs as the parent (`CLIENT_LOG_LEVEL`, ...)
+    setup_logging('client')
+    log = logging.getLogger(name)
+    log.info(f"Starting! (pid {os.getpid()})")
+    loop = asyncio.get_running_loop()
+    from_string = telemetry_pb2.TelemetryResponse.FromString
+    forwarder = DashboardForwarder()
+
+    async with make_pool(name, **DB_CONN_KWARGS) as pool:
+        # one spool per shard (restarted workers pick up their own segments)
+        spool = make_spool(name)
+        batcher = DBBatcher(make_db_flusher(pool), name=name, spool=spool)
+        tasks = [
+            asyncio.create_task(batcher.run()),
+            asyncio.create_task(forwarder.run()),
+            asyncio.create_task(run_spool_replayer(spool, pool)),
+        ]
+        try:
+            while True:
+                # blocking mp queue get, off the event loop
+                raw_batch = await loop.run_in_executor(None, shard_queue.get)
+                if raw_batch is None:
+                    # stop sentinel
+                    break
+                rows = decode_rows([from_string(raw) for raw in raw_batch])
+                batcher.add_many(rows)
+                forwarder.submit(row_to_dict(row) for row in rows)
+                processed[shard_id] += len(rows)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await batcher.close()
+            if spool is not None:
+                spool.close()
+    log.info("Stopped!")
+
+
+class ShardSupervisor:
+
+    def __init__(self, num_shards: int = INGEST_SHARDS):
+        self.num_shards = num_shards
+        self._ctx = mp.get_context('spawn')
+        self._queues = [self._ctx.Queue(maxsize=SHARD_QUEUE_MAXSIZE) for _ in range(num_shards)]
+        # messages processed per shard, each worker only writes its own slot
+        self._processed = self._ctx.Array('Q', num_shards, lock=False)
+        self._procs = [None] * num_shards
+        self._pending = [[] for _ in range(num_shards)]
+        # one send per shard at a time (linger flush vs size flush), so batches are queued in the order they were cut
+        self._send_locks = [asyncio.Lock() for _ in range(num_shards)]
+
+        self._last_processed = [0] * num_shards
+        self._last_time = time.monotonic()
+
+    def _spawn(self, shard_id: int):
+        proc = self._ctx.Process(
+            target=shard_worker_main,
+            args=(shard_id, self._queues[shard_id], self._processed, SHARD_METRICS_BASE_PORT + shard_id),
+            name=f"telemetry_shard_{shard_id}",
+            daemon=True,
+        )
+        proc.start()
+        self._procs[shard_id] = proc
+
+    def start(self):
+        log.info(f"Starting {self.num_shards} shard workers")
+        for shard_id in range(self.num_shards):
+            self._spawn(shard_id)
+
+    async def route(self, telem_response) -> None:
+        which = telem_response.WhichOneof("data")
+        sensor_id = getattr(telem_response, which).sensor_id if which else ''
+        shard_id = shard_for(sensor_id, self.num_shards)
+        pending = self._pending[shard_id]
+        pending.append(telem_response.SerializeToString())
+        if len(pending) >= SHARD_BATCH_SIZE:
+            await self._send(shard_id)
+
+    async def _send(self, shard_id: int):
+        async with self._send_locks[shard_id]:
+            raw_batch = self._pending[shard_id]
+            if not raw_batch:
+                return
+            # swap before awaiting, new messages go into a fresh list
+            self._pending[shard_id] = []
+            while True:
+                try:
+                    self._queues[shard_id].put_nowait(raw_batch)
+                    return
+                except queue_lib.Full:
+                    # backpressure onto the gRPC stream, without blocking the event loop
+                    SHARD_BACKPRESSURE.labels(shard_id).inc()
+                    await asyncio.sleep(0.001)
+
+    async def flush(self):
+        for shard_id in range(self.num_shards):
+            await self._send(shard_id)
+
+    async def run_linger(self):
+        # slow sensors don't sit in a half full batch
+        while True:
+            await asyncio.sleep(SHARD_LINGER_MS / 1000)
+            await self.flush()
+
+    def _export(self):
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        for shard_id in range(self.num_shards):
+            processed = self._processed[shard_id]
+            delta = processed - self._last_processed[shard_id]
+            self._last_processed[shard_id] = processed
+            SHARD_PROCESSED_MSGS.labels(shard_id).inc(delta)
+            if elapsed > 0:
+                SHARD_THROUGHPUT.labels(shard_id).set(delta / elapsed)
+            try:
+                SHARD_QUEUE_DEPTH.labels(shard_id).set(self._queues[shard_id].qsize())
+            except NotImplementedError:
+                # no qsize() on macOS
+                pass
+        self._last_time = now
+
+    async def run_supervisor(self):
+        while True:
+            await asyncio.sleep(SHARD_SUPERVISE_INTERVAL_S)
+            for shard_id, proc in enumerate(self._procs):
+                if not proc.is_alive():
+                    log.error(f"shard {shard_id} died (exit code {proc.exitcode}), restarting")
+                    SHARD_RESTARTS.labels(shard_id).inc()
+                    self._spawn(shard_id)
+            self._export()
+
+    def stop(self, timeout_s: float = 30):
+        # stop sentinel, then give the workers time to flush their batchers
+        for shard_queue in self._queues:
+            try:
+                shard_queue.put(None, timeout=1)
+            except queue_lib.Full:
+                pass
+        for proc in self._procs:
+            if proc is not None:
+                proc.join(timeout_s)
+                if proc.is_alive():
+                    proc.terminate()
@@ -0,0 +1,292 @@
+"""
+Local write-ahead spool for db batches that couldn't be written (`DBBatcher`).
+
+So a postgres outage neither drops rows nor grows the batcher's buffer forever:
+- failed flushes (and the buffer, once it passes `DB_MAX_BUFFERED_ROWS`) are appended to segment files on disk
+    - `<SPOOL_DIR>/<name>-<seq>.seg`, append-only, buffered writes
+        - `append(rows, sync=True)` also fsyncs before returning, for callers that ack the rows' source right after
+    - record == 4 byte little-endian length + msgpack array of rows
+    - a segment is sealed (fsync'd) once it reaches `SPOOL_SEGMENT_BYTES`, or when the replayer wants it
+- `run_replayer()` COPYs sealed segments back oldest first, and deletes each one once it's all in
+    - exponential backoff (with jitter) while postgres is still down
+    - records already replayed are skipped on a retry, but a crash mid-segment replays that segment from the start (at-least-once)
+    - a segment that keeps failing for any other reason than a connection problem (a row postgres will never take),
+        `SPOOL_MAX_REPLAY_ATTEMPTS` times in a row, has its unreplayed records moved to `<SPOOL_DIR>/quarantine/`,
+        so one bad row doesn't hold up every later segment
+- retention: oldest segments are deleted past `SPOOL_MAX_BYTES` or `SPOOL_RETENTION_S`
+- segments left behind by an earlier run are replayed too
+- one process per spool name: `<name>.lock` (`flock`) is held while the spool is open, a second one refuses to start
+    instead of appending to (and replaying, deleting) the same segments
+"""
+import os
+import re
+import fcntl
+import logging
+import time
+import random
+import struct
+import asyncio
+
+import msgpack
+import psycopg
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger('Spool')
+
+
+SPOOL_BYTES = Gauge('spool_bytes', 'Bytes of db batches waiting in the local spool.', ['spool'])
+SPOOL_SEGMENTS = Gauge('spool_segments', 'Segment files in the local spool.', ['spool'])
+SPOOL_WRITTEN_ROWS = Counter('spool_written_rows', 'Rows written to the local spool (failed or overflow batches).', ['spool'])
+SPOOL_REPLAYED_ROWS = Counter('spool_replayed_rows', 'Rows replayed from the local spool into postgres.', ['spool'])
+SPOOL_REPLAY_THROUGHPUT = Gauge('spool_replay_rows_per_second', 'Replay throughput of the last replayed segment.', ['spool'])
+SPOOL_DISCARDED_SEGMENTS = Counter('spool_discarded_segments', 'Segments deleted by retention before they could be replayed.', ['spool'])
+SPOOL_QUARANTINED_SEGMENTS = Counter('spool_quarantined_segments', 'Segments moved to quarantine/ after failing replay too many times.', ['spool'])
+
+# knobs
+SPOOL_ENABLED = os.environ.get('SPOOL_ENABLED', '1') == '1'
+SPOOL_DIR = os.environ.get('SPOOL_DIR', os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'logs', 'spool'))
+SPOOL_SEGMENT_BYTES = int(os.environ.get('SPOOL_SEGMENT_BYTES', 64 * 1024 * 1024))
+SPOOL_MAX_BYTES = int(os.environ.get('SPOOL_MAX_BYTES', 1024 * 1024 * 1024))
+# in seconds (default 7 days)
+SPOOL_RETENTION_S = float(os.environ.get('SPOOL_RETENTION_S', 7 * 24 * 3600))
+SPOOL_BACKOFF_MIN_S = float(os.environ.get('SPOOL_BACKOFF_MIN_S', 0.5))
+SPOOL_BACKOFF_MAX_S = float(os.environ.get('SPOOL_BACKOFF_MAX_S', 30))
+# how often the replayer looks for new segments when there's nothing to do
+SPOOL_POLL_INTERVAL_S = float(os.environ.get('SPOOL_POLL_INTERVAL_S', 1))
+# failed replays of one segment (connection errors don't count) before it's quarantined
+SPOOL_MAX_REPLAY_ATTEMPTS = int(os.environ.get('SPOOL_MAX_REPLAY_ATTEMPTS', 5))
+
+_LEN = struct.Struct('<I')
+
+# postgres (or the pool) unreachable: not the segment's fault, keep retrying it
+_TRANSIENT_ERRORS = (psycopg.OperationalError, OSError, asyncio.TimeoutError)
+
+
+def read_segment(path: str):
+    # yields every complete record (list of rows), a torn last record (crash mid-append) is skipped
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_LEN.size)
+            if len(header) < _LEN.size:
+                return
+            (size,) = _LEN.unpack(header)
+            body = f.read(size)
+            if len(body) < size:
+                log.error(f"torn record at the end of {path}, skipping it")
+                return
+            yield msgpack.unpackb(body)
+
+
+class Spool:
+
+    def __init__(self, name: str, directory: str = SPOOL_DIR, segment_bytes: int = SPOOL_SEGMENT_BYTES, max_bytes: int = SPOOL_MAX_BYTES, retention_s: float = SPOOL_RETENTION_S):
+        self.name = name
+        self.directory = os.path.abspath(directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.retention_s = retention_s
+        self.quarantine_dir = os.path.join(self.directory, 'quarantine')
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = self._acquire_lock()
+
+        self._packer = msgpack.Packer(use_single_float=True)
+        # sealed segments, oldest first, ready for replay
+        # (exact match, `telemetry` mustn't pick up `telemetry-<consumer>`'s segments)
+        segment = re.compile(rf"{re.escape(name)}-\d+\.seg")
+        self._sealed = sorted(
+            os.path.join(self.directory, f)
+            for f in os.listdir(self.directory)
+            if segment.fullmatch(f)
+        )
+        self._next_seq = self._seq_of(self._sealed[-1]) + 1 if self._sealed else 0
+        self._active = None
+        self._active_path = None
+        self._active_bytes = 0
+        self._bytes = sum(os.path.getsize(path) for path in self._sealed)
+        # records of the oldest segment already replayed, so a retry doesn't COPY them twice
+        self._head_path = None
+        self._head_done = 0
+        # failed replays of the oldest segment in a row
+        self._head_failures = 0
+        self._has_sealed = asyncio.Event()
+        if self._sealed:
+            self._has_sealed.set()
+        self._export()
+
+    def _acquire_lock(self) -> int:
+        path = os.path.join(self.directory, f"{self.name}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError(f"spool {self.name!r} in {self.directory} is already open in another process ({path} is locked), give this one its own name or SPOOL_DIR")
+        return fd
+
+    @staticmethod
+    def _seq_of(path: str) -> int:
+        return int(os.path.basename(path).rsplit('-', 1)[1].split('.')[0])
+
+    def __len__(self):
+        # bytes waiting, sealed + active
+        return self._bytes
+
+    def _export(self):
+        SPOOL_BYTES.labels(self.name).set(self._bytes)
+        SPOOL_SEGMENTS.labels(self.name).set(len(self._sealed) + (self._active is not None))
+
+    def append(self, rows: list, sync: bool = False) -> None:
+        """
+        Spool one batch. Plain buffered file write, no awaits (so it's safe from anywhere in the batcher).
+        `sync`: fsync the active segment before returning, the rows survive a crash (or power loss) once this returns.
+        """
+        if not rows:
+            return
+        body = self._packer.pack([list(row) for row in rows])
+        if self._active is None:
+            self._active_path = os.path.join(self.directory, f"{self.name}-{self._next_seq:012d}.seg")
+            self._next_seq += 1
+            self._active = open(self._active_path, 'ab')
+            self._active_bytes = 0
+        self._active.write(_LEN.pack(len(body)))
+        self._active.write(body)
+        self._active.flush()
+        if sync:
+            os.fsync(self._active.fileno())
+
+        written = _LEN.size + len(body)
+        self._active_bytes += written
+        self._bytes += written
+        SPOOL_WRITTEN_ROWS.labels(self.name).inc(len(rows))
+        if self._active_bytes >= self.segment_bytes:
+            self._seal()
+        self._enforce_retention()
+        self._export()
+
+    def _seal(self):
+        if self._active is None:
+            return
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()
+        self._sealed.append(self._active_path)
+        self._active = None
+        self._active_path = None
+        self._active_bytes = 0
+        self._has_sealed.set()
+
+    def _enforce_retention(self):
+        now = time.time()
+        while self._sealed:
+            oldest = self._sealed[0]
+            too_big = self._bytes > self.max_bytes
+            too_old = now - os.path.getmtime(oldest) > self.retention_s
+            if not (too_big or too_old):
+                return
+            log.error(f"[{self.name}] retention, deleting unreplayed segment {oldest}")
+            self._remove(oldest)
+            SPOOL_DISCARDED_SEGMENTS.labels(self.name).inc()
+
+    def _remove(self, path: str):
+        self._bytes -= os.path.getsize(path)
+        os.remove(path)
+        self._sealed.remove(path)
+
+    def _quarantine(self, path: str, skip: int) -> str:
+        # the records not replayed yet go to quarantine/ (the first `skip` are in postgres already)
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        target = os.path.join(self.quarantine_dir, os.path.basename(path))
+        with open(target, 'wb') as f:
+            for i, rows in enumerate(read_segment(path)):
+                if i < skip:
+                    continue
+                body = self._packer.pack(rows)
+                f.write(_LEN.pack(len(body)))
+                f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        self._remove(path)
+        SPOOL_QUARANTINED_SEGMENTS.labels(self.name).inc()
+        return target
+
+    async def run_replayer(self, replay_rows):
+        """
+        `replay_rows(rows)` is the async callback that COPYs + commits one batch (raises on failure).
+        """
+        log.info(f"[{self.name}] Starting replayer!")
+        backoff = SPOOL_BACKOFF_MIN_S
+        while True:
+            if not self._sealed:
+                if self._active is not None:
+                    # nothing older left, take whatever is in the active segment
+                    self._seal()
+                else:
+                    self._has_sealed.clear()
+                    try:
+                        await asyncio.wait_for(self._has_sealed.wait(), SPOOL_POLL_INTERVAL_S)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+            path = self._sealed[0]
+            if path != self._head_path:
+                self._head_path = path
+                self._head_done = 0
+                self._head_failures = 0
+            start = time.perf_counter()
+            replayed = 0
+            try:
+                for i, rows in enumerate(read_segment(path)):
+                    if i < self._head_done:
+                        continue
+                    await replay_rows(rows)
+                    self._head_done += 1
+                    replayed += len(rows)
+                    SPOOL_REPLAYED_ROWS.labels(self.name).inc(len(rows))
+            except FileNotFoundError:
+                # gone from under us, nothing left to replay from it
+                log.error(f"[{self.name}] segment {path} disappeared, skipping it")
+                self._sealed.remove(path)
+                self._export()
+                continue
+            except Exception as e:
+                if not isinstance(e, _TRANSIENT_ERRORS):
+                    self._head_failures += 1
+                    if self._head_failures >= SPOOL_MAX_REPLAY_ATTEMPTS:
+                        target = self._quarantine(path, self._head_done)
+                        log.error(f"[{self.name}] replay of {path} failed {self._head_failures} times, quarantined to {target}: {e}")
+                        self._export()
+                        continue
+                # postgres still down (or a bad batch), try the same segment again later
+                delay = backoff * random.uniform(0.5, 1.5)
+                log.error(f"[{self.name}] replay of {path} failed, retrying in {delay:.2f}s: {e}")
+                backoff = min(backoff * 2, SPOOL_BACKOFF_MAX_S)
+                await asyncio.sleep(delay)
+                continue
+
+            backoff = SPOOL_BACKOFF_MIN_S
+            elapsed = time.perf_counter() - start
+            if elapsed > 0:
+                SPOOL_REPLAY_THROUGHPUT.labels(self.name).set(replayed / elapsed)
+            log.info(f"[{self.name}] replayed {replayed} rows from {path}")
+            if path in self._sealed:
+                # (unless retention got to it first)
+                self._remove(path)
+            self._export()
+
+    def close(self):
+        # keep the active segment around for the next run
+        self._seal()
+        self._export()
+        if self._lock is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+            os.close(self._lock)
+            self._lock = None
+
+
+def make_spool(name: str) -> Spool:
+    # None == spooling off (`SPOOL_ENABLED=0`), failed batches are dropped like before
+    if not SPOOL_ENABLED:
+        return None
+    return Spool(name)
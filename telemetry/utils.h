@@ -2,10 +2,13 @@
 #define UTILS_H
 
 #include <string>
+#include <cstdint>
 #include <boost/date_time/posix_time/posix_time.hpp>
 
 float get_randf_in_range(float lower, float upper);
 
-std::string get_iso8601_timestamp();
+int64_t get_epoch_ns();
+
+std::string get_iso8601_timestamp(int64_t epoch_ns);
 
 #endif
@@ -0,0 +1,129 @@
+"""
+Websocket message encodings for `backend.py`, picked per client with the websocket subprotocol at connect time.
+
+- `telemetry.json` (or no subprotocol): JSON text frames, the default
+- `telemetry.msgpack`: binary frames, one msgpack map per message (same keys as the JSON)
+    - floats packed as float32, which is all the .proto floats ever had
+    - coalesced frames (`WS_FRAME_INTERVAL_MS` / `max_fps`): msgpack array of those maps
+- `telemetry.proto`: binary frames, one serialized `TelemetryResponse` per message (`timestamp_ns` set, or `timestamp` for an ISO one)
+    - coalesced frames: a `TelemetryBatch`
+    - metrics have no message in telemetry.proto, they stay JSON text frames
+- control replies (`ack`/`error`) and notices are always JSON text frames
+- a message is encoded at most once per protocol, however many clients get it (`ConnectionManager.publish()`)
+
+e.g. `new WebSocket(url, ["telemetry.msgpack"])` in the browser, the first offered one we know wins
+"""
+import json
+
+import msgpack
+
+from proto import telemetry_pb2
+
+
+# subprotocol -> protocol name
+SUBPROTOCOLS = {
+    'telemetry.json': 'json',
+    'telemetry.msgpack': 'msgpack',
+    'telemetry.proto': 'proto',
+}
+PROTOCOLS = tuple(SUBPROTOCOLS.values())
+
+_TYPE_NUMBERS = {val.name: val.number for val in telemetry_pb2.TelemetryType.DESCRIPTOR.values}
+_SYSTEM_NUMBERS = {val.name: val.number for val in telemetry_pb2.System.DESCRIPTOR.values}
+
+_packer = msgpack.Packer(use_single_float=True)
+
+
+def negotiate(offered: list) -> tuple:
+    # -> (subprotocol to accept with, or None, protocol name)
+    for subprotocol in offered or ():
+        protocol = SUBPROTOCOLS.get(subprotocol)
+        if protocol is not None:
+            return subprotocol, protocol
+    return None, 'json'
+
+
+def _telem_proto(telem_dict) -> bytes:
+    resp = telemetry_pb2.TelemetryResponse()
+    ts = telem_dict.reading_timestamp
+    if isinstance(ts, int):
+        resp.timestamp_ns = ts
+    else:
+        resp.timestamp = ts
+    telem_type = telem_dict.telemetry_type
+    resp.type = _TYPE_NUMBERS[telem_type]
+    if telem_type == 'TEMPERATURE':
+        data = resp.temperature
+        data.temperature = telem_dict.temperature
+        data.unit = telem_dict.temp_unit
+    elif telem_type == 'PRESSURE':
+        data = resp.pressure
+        data.pressure = telem_dict.pressure
+        data.unit = telem_dict.pressure_unit
+        data.leak_detected = bool(telem_dict.leak_detected)
+    else:
+        data = resp.velocity
+        data.velocity_x = telem_dict.velocity_x
+        data.velocity_y = telem_dict.velocity_y
+        data.velocity_z = telem_dict.velocity_z
+        data.unit = telem_dict.velocity_unit
+        if telem_dict.vibration_magnitude is not None:
+            data.vibration_mag = telem_dict.vibration_magnitude
+    data.sensor_id = telem_dict.sensor_id
+    data.subsystem = _SYSTEM_NUMBERS.get(telem_dict.subsystem, 0)
+    data.status_bitmask = telem_dict.status_bitmask
+    data.sequence_number = telem_dict.sequence_number
+    return resp.SerializeToString()
+
+
+def encode_telem(telem_dict, protocol: str):
+    # validated `TelemetryData` model -> str (text frame) or bytes (binary frame)
+    if protocol == 'msgpack':
+        return _packer.pack(telem_dict.model_dump())
+    if protocol == 'proto':
+        return _telem_proto(telem_dict)
+    return telem_dict.model_dump_json()
+
+
+def encode_metric(metric_dict, protocol: str):
+    # validated `MetricData` model, no protobuf message for these (JSON for `proto` clients)
+    if protocol == 'msgpack':
+        return _packer.pack(metric_dict.model_dump())
+    return metric_dict.model_dump_json()
+
+
+def encode_notice(notice) -> str:
+    # anything JSON-able, same text frame for every protocol
+    return json.dumps(notice)
+
+
+def _frame_msgpack(messages: list[bytes]) -> bytes:
+    # the messages are packed already, an array is just its header + the elements
+    return _packer.pack_array_header(len(messages)) + b''.join(messages)
+
+
+def _frame_proto(messages: list[bytes]) -> bytes:
+    # serialized `TelemetryBatch`: each message is field 1 (`responses`), length delimited
+    parts = []
+    append = parts.append
+    for message in messages:
+        size = len(message)
+        header = bytearray(b'\x0A')
+        while size >= 0x80:
+            header.append((size & 0x7F) | 0x80)
+            size >>= 7
+        header.append(size)
+        append(bytes(header))
+        append(message)
+    return b''.join(parts)
+
+
+def frame_text(messages: list[str]) -> str:
+    # the messages are JSON already, no need to parse + dump them again
+    return '[' + ','.join(messages) + ']'
+
+
+BINARY_FRAMERS = {
+    'msgpack': _frame_msgpack,
+    'proto': _frame_proto,
+}
@@ -0,0 +1,9 @@
+# flat imports like the scripts themselves (`cd telemetry; python client.py`)
+import os
+import sys
+
+tests_dir = os.path.dirname(os.path.realpath(__file__))
+for path in ('../telemetry', '../telemetry/proto', '../benchmarks'):
+    path = os.path.abspath(os.path.join(tests_dir, path))
+    if path not in sys.path:
+        sys.path.append(path)
@@ -0,0 +1,63 @@
+"""
+`telemetry/batch_controller.py`: batch size follows the p95 flush latency, interval follows the arrival rate.
+"""
+from batch_controller import AdaptiveBatchController, _MIN_SAMPLES
+
+
+def make_controller(**kwargs):
+    kwargs = dict(target_p95_s=0.25, batch_size=100, batch_interval=1, min_batch_size=10, max_batch_size=1000, min_interval=0.05, max_interval=10, **kwargs)
+    return AdaptiveBatchController('test', **kwargs)
+
+
+def test_no_change_until_enough_samples():
+    controller = make_controller()
+    for _ in range(_MIN_SAMPLES - 1):
+        controller.observe_flush(100, 1.0, 0)
+    assert controller.batch_size == 100
+
+
+def test_slow_flushes_shrink_the_batch():
+    controller = make_controller()
+    for _ in range(_MIN_SAMPLES):
+        controller.observe_flush(100, 1.0, 0)
+    assert controller.batch_size < 100
+    # window starts over after a change
+    assert controller.p95() is None
+
+
+def test_fast_flushes_grow_the_batch_only_when_rows_back_up():
+    idle = make_controller()
+    for _ in range(_MIN_SAMPLES):
+        idle.observe_flush(100, 0.01, 0)
+    assert idle.batch_size == 100
+
+    backed_up = make_controller()
+    for _ in range(_MIN_SAMPLES):
+        backed_up.observe_flush(100, 0.01, 500)
+    assert backed_up.batch_size > 100
+
+
+def test_batch_size_is_clamped():
+    controller = make_controller()
+    for _ in range(20 * _MIN_SAMPLES):
+        controller.observe_flush(100, 10.0, 0)
+    assert controller.batch_size == 10
+
+
+def test_interval_is_time_to_fill_a_batch(monkeypatch):
+    import batch_controller
+    now = [1000.0]
+    monkeypatch.setattr(batch_controller.time, 'monotonic', lambda: now[0])
+    controller = make_controller()
+    controller.observe_arrivals(400)
+    now[0] += 1
+    controller.observe_flush(100, 0.01, 0)
+    # 400 rows/s, 100 row batches
+    assert controller.arrival_rate == 400
+    assert controller.batch_interval == 0.25
+
+
+def test_no_arrivals_falls_back_to_the_max_interval():
+    controller = make_controller()
+    controller.observe_flush(100, 0.01, 0)
+    assert controller.batch_interval == 10
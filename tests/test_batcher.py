@@ -0,0 +1,110 @@
+"""
+`telemetry/batcher.py` (`DBBatcher`) + the commit-then-ack flusher in `telemetry/pipeline.py`.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('psycopg_pool')
+
+import pipeline
+from batcher import DBBatcher
+from spool import Spool, read_segment
+
+
+class FakeStreamConsumer:
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.acked = []
+
+    async def ack(self, entry_ids):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('redis went away')
+        self.acked.extend(entry_ids)
+
+
+@pytest.fixture(autouse=True)
+def fast_ack_retry(monkeypatch):
+    monkeypatch.setattr(pipeline, 'STREAM_ACK_RETRY_S', 0)
+
+
+def run_batcher(batcher, feed, seconds: float = 0.1):
+    async def main():
+        task = asyncio.create_task(batcher.run())
+        feed(batcher)
+        await asyncio.sleep(seconds)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await batcher.close()
+    asyncio.run(main())
+
+
+def test_size_flush_carries_the_acks():
+    flushed = []
+
+    async def flush_rows(rows, acks):
+        flushed.append((rows, acks))
+
+    batcher = DBBatcher(flush_rows, name='test_size', max_batch_size=3, batch_interval=60)
+    batcher._controller = None
+    run_batcher(batcher, lambda b: b.add_many([(1,), (2,), (3,)], ['1-0', '2-0', '3-0']))
+    assert flushed == [([(1,), (2,), (3,)], ['1-0', '2-0', '3-0'])]
+
+
+def test_close_flushes_what_is_left():
+    flushed = []
+
+    async def flush_rows(rows, acks):
+        flushed.append(rows)
+
+    batcher = DBBatcher(flush_rows, name='test_close', max_batch_size=100, batch_interval=60)
+    run_batcher(batcher, lambda b: b.add((1,)), seconds=0.01)
+    assert flushed == [[(1,)]]
+
+
+def test_failed_flush_is_spooled_fsynced_then_acked(tmp_path, monkeypatch):
+    spool = Spool('test_failed', tmp_path)
+    appends = []
+    real_append = spool.append
+    monkeypatch.setattr(spool, 'append', lambda rows, sync=False: appends.append(sync) or real_append(rows, sync))
+    acked = []
+
+    async def flush_rows(rows, acks):
+        if rows:
+            raise ConnectionError('postgres is down')
+        acked.extend(acks)
+
+    batcher = DBBatcher(flush_rows, name='test_failed', max_batch_size=2, batch_interval=60, spool=spool)
+    run_batcher(batcher, lambda b: b.add_many([(1,), (2,)], ['1-0', '2-0']))
+    spool.close()
+    assert appends == [True]
+    assert acked == ['1-0', '2-0']
+    assert [list(read_segment(path)) for path in spool._sealed] == [[[[1], [2]]]]
+
+
+def test_ack_failure_after_commit_is_not_spooled(tmp_path):
+    spool = Spool('test_ack', tmp_path)
+    consumer = FakeStreamConsumer(failures=pipeline.STREAM_ACK_ATTEMPTS)
+    committed = []
+
+    async def flush_rows(rows, acks):
+        # what `make_db_flusher` does, minus postgres
+        committed.extend(rows)
+        if acks:
+            await pipeline.ack_committed(consumer, acks)
+
+    batcher = DBBatcher(flush_rows, name='test_ack', max_batch_size=2, batch_interval=60, spool=spool)
+    run_batcher(batcher, lambda b: b.add_many([(1,), (2,)], ['1-0', '2-0']))
+    spool.close()
+    # committed once, left pending in redis, nothing spooled for a second insert
+    assert committed == [(1,), (2,)]
+    assert consumer.acked == []
+    assert spool._sealed == []
+
+
+def test_ack_is_retried():
+    consumer = FakeStreamConsumer(failures=pipeline.STREAM_ACK_ATTEMPTS - 1)
+    asyncio.run(pipeline.ack_committed(consumer, ['1-0']))
+    assert consumer.acked == ['1-0']
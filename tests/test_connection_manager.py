@@ -0,0 +1,194 @@
+"""
+`telemetry/connection_manager.py`: per-client queues, frame coalescing, subscription routing.
+"""
+import json
+import asyncio
+
+import pytest
+
+from connection_manager import ClientConnection, ConnectionManager, SubscriptionIndex
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.frames = []
+        self.closed = None
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+class FakeManager:
+
+    def __init__(self):
+        self.disconnected = []
+
+    def disconnect(self, websocket):
+        self.disconnected.append(websocket)
+
+
+_labels = iter(range(1_000_000))
+
+
+def make_conn(policy='drop_oldest', max_queue=100, frame_interval=0.0, max_fps=None, protocol='json'):
+    websocket = FakeWebSocket()
+    conn = ClientConnection(websocket, f"test-{next(_labels)}", FakeManager(), max_queue, policy, 1, frame_interval, max_fps, protocol)
+    return conn, websocket
+
+
+def run_writer(conn, enqueue, seconds: float = 0.05):
+    async def main():
+        # queued before the writer's first turn, like a burst between two frames
+        enqueue(conn)
+        task = asyncio.create_task(conn.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    asyncio.run(main())
+
+
+def json_msg(sensor_id, seq):
+    return json.dumps({'sensor_id': sensor_id, 'sequence_number': seq})
+
+
+def test_a_frame_per_message_without_coalescing():
+    conn, websocket = make_conn()
+    run_writer(conn, lambda c: [c.enqueue(json_msg('t1', i)) for i in range(3)])
+    assert websocket.frames == [json_msg('t1', i) for i in range(3)]
+
+
+def test_pending_messages_go_out_as_one_array_frame():
+    conn, websocket = make_conn(frame_interval=0.01)
+    run_writer(conn, lambda c: [c.enqueue(json_msg('t1', i)) for i in range(3)])
+    assert [json.loads(frame) for frame in websocket.frames] == [[json.loads(json_msg('t1', i)) for i in range(3)]]
+
+
+def test_coalesce_keeps_the_latest_reading_per_sensor():
+    conn, websocket = make_conn(policy='coalesce', frame_interval=0.01)
+
+    def enqueue(c):
+        for seq in range(3):
+            c.enqueue(json_msg('t1', seq), key='t1')
+            c.enqueue(json_msg('p1', seq), key='p1')
+
+    run_writer(conn, enqueue)
+    [frame] = websocket.frames
+    assert json.loads(frame) == [json.loads(json_msg('t1', 2)), json.loads(json_msg('p1', 2))]
+
+
+def test_full_queue_drops_the_oldest():
+    conn, websocket = make_conn(max_queue=2)
+    run_writer(conn, lambda c: [c.enqueue(json_msg('t1', i)) for i in range(4)])
+    assert websocket.frames == [json_msg('t1', 2), json_msg('t1', 3)]
+
+
+def test_full_queue_disconnects_under_the_disconnect_policy():
+    conn, websocket = make_conn(policy='disconnect', max_queue=2)
+    run_writer(conn, lambda c: [c.enqueue(json_msg('t1', i)) for i in range(3)])
+    assert websocket.frames == []
+    assert websocket.closed == 1013
+    assert conn._manager.disconnected == [websocket]
+
+
+def test_binary_protocol_sends_a_binary_frame_and_a_text_frame():
+    conn, websocket = make_conn(frame_interval=0.01, protocol='msgpack')
+    run_writer(conn, lambda c: [c.enqueue(b'\x01'), c.enqueue('{"type": "ack"}'), c.enqueue(b'\x02')])
+    # msgpack array header (2 elements) + the already packed messages
+    assert websocket.frames == [b'\x92\x01\x02', '[{"type": "ack"}]']
+
+
+def test_client_can_slow_down_but_not_speed_up():
+    conn, _ = make_conn(frame_interval=0.1)
+    conn.set_max_fps(2)
+    assert conn.frame_interval == 0.5
+    conn.set_max_fps(100)
+    assert conn.frame_interval == 0.1
+    conn.set_max_fps(None)
+    assert conn.frame_interval == 0.1
+    with pytest.raises(ValueError):
+        conn.set_max_fps(-1)
+
+
+def telem_route(telemetry_type, subsystem, sensor_id):
+    return (('telemetry_type', telemetry_type), ('subsystem', subsystem), ('sensor_id', sensor_id))
+
+
+def test_clients_without_subscriptions_get_everything():
+    index = SubscriptionIndex()
+    index.add_client('a')
+    assert index.route(telem_route('TEMPERATURE', 'ENGINE', 't1')) == ('a',)
+    assert index.route((('metric_type', 'kpm'),)) == ('a',)
+
+
+def test_filters_and_across_fields_or_within_one():
+    index = SubscriptionIndex()
+    index.add_client('eng')
+    index.subscribe('eng', 'e', SubscriptionIndex.parse_filter({'subsystem': 'ENGINE', 'telemetry_type': ['TEMPERATURE', 'PRESSURE']}))
+    assert index.route(telem_route('TEMPERATURE', 'ENGINE', 't1')) == ('eng',)
+    assert index.route(telem_route('PRESSURE', 'ENGINE', 'p1')) == ('eng',)
+    assert index.route(telem_route('VELOCITY', 'ENGINE', 'v1')) == ()
+    assert index.route(telem_route('PRESSURE', 'FUEL_TANK', 'p2')) == ()
+
+
+def test_each_client_once_even_with_overlapping_subscriptions():
+    index = SubscriptionIndex()
+    index.add_client('a')
+    index.subscribe('a', 'engine', SubscriptionIndex.parse_filter({'subsystem': 'ENGINE'}))
+    index.subscribe('a', 'temps', SubscriptionIndex.parse_filter({'telemetry_type': 'TEMPERATURE'}))
+    assert index.route(telem_route('TEMPERATURE', 'ENGINE', 't1')) == ('a',)
+
+
+def test_unsubscribe_and_disconnect_invalidate_cached_routes():
+    index = SubscriptionIndex()
+    index.add_client('a')
+    index.add_client('b')
+    index.subscribe('a', 'kpm', SubscriptionIndex.parse_filter({'metric_type': 'kpm'}))
+    index.subscribe('b', 'engine', SubscriptionIndex.parse_filter({'subsystem': 'ENGINE'}))
+    kpm = (('metric_type', 'kpm'),)
+    assert index.route(kpm) == ('a',)
+
+    # no subscriptions left != never subscribed, gets nothing
+    assert index.unsubscribe('a', None) == 1
+    assert index.route(kpm) == ()
+    # an empty filter is everything again
+    index.subscribe('a', 'all', {})
+    assert index.route(kpm) == ('a',)
+
+    index.remove_client('b')
+    assert index.route(telem_route('TEMPERATURE', 'ENGINE', 't1')) == ('a',)
+    assert len(index) == 1 and index._index == {}
+
+
+@pytest.mark.parametrize('raw', [
+    [],
+    {'colour': 'red'},
+    {'subsystem': []},
+    {'subsystem': [1]},
+    {'metric_type': 'kpm', 'subsystem': 'ENGINE'},
+])
+def test_bad_filters_are_rejected(raw):
+    with pytest.raises(ValueError):
+        SubscriptionIndex.parse_filter(raw)
+
+
+def test_control_messages_are_acked_or_answered_with_an_error():
+    manager = ConnectionManager()
+    conn, websocket = make_conn()
+    manager.active_connections[websocket] = conn
+    manager.subscriptions.add_client(conn)
+
+    manager.handle_control(websocket, json.dumps({'type': 'subscribe', 'id': 'e', 'filter': {'subsystem': 'ENGINE'}}))
+    manager.handle_control(websocket, json.dumps({'type': 'subscribe', 'filter': {'nope': 'x'}}))
+    manager.handle_control(websocket, 'not json')
+    replies = [json.loads(message) for message in conn._pending.values()]
+    assert replies[0] == {'type': 'ack', 'request': 'subscribe', 'id': 'e', 'subscriptions': {'e': {'subsystem': ['ENGINE']}}}
+    assert [reply['type'] for reply in replies[1:]] == ['error', 'error']
+    assert manager.route(telem_route('TEMPERATURE', 'ENGINE', 't1')) == (conn,)
+    assert manager.route(telem_route('TEMPERATURE', 'AVIONICS', 't2')) == ()
@@ -0,0 +1,90 @@
+"""
+`telemetry/copy_writer.py`: rows go out as binary COPY values of the declared column types, and come back the same.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import pytest
+
+from psycopg import postgres
+from psycopg.adapt import Transformer
+from psycopg.pq import Format
+
+from bench_decoder import make_messages
+from decoder import decode_rows
+from copy_writer import TELEMETRY_COPY, TELEMETRY_COL_TYPES, metric_copy_writer, to_datetime, to_epoch_ns
+
+
+class LoopbackCopy:
+    # dumps every row like psycopg's binary COPY would, then loads it back with the same types
+    def __init__(self):
+        self.rows = []
+
+    def set_types(self, types):
+        oids = [postgres.types.get(name).oid for name in types]
+        self._formats = [Format.BINARY] * len(oids)
+        self._dump = Transformer()
+        self._dump.set_dumper_types(oids, Format.BINARY)
+        self._load = Transformer()
+        self._load.set_loader_types(oids, Format.BINARY)
+
+    async def write_row(self, row):
+        self.rows.append(self._load.load_sequence(self._dump.dump_sequence(row, self._formats)))
+
+
+class LoopbackCursor:
+    def __init__(self):
+        self.copies = []
+
+    @asynccontextmanager
+    async def copy(self, sql: str):
+        copy = LoopbackCopy()
+        yield copy
+        self.copies.append((sql, copy.rows))
+
+
+class RecordingHistogram:
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, value):
+        self.observed.append(value)
+
+
+def test_timestamp_conversions_agree():
+    ns = 1750768496123456000
+    expected = datetime(2025, 6, 24, 12, 34, 56, 123456, tzinfo=timezone.utc)
+    for value in (ns, '2025-06-24T12:34:56.123456Z', '2025-06-24T12:34:56.123456+00:00', expected, expected.replace(tzinfo=None)):
+        assert to_datetime(value) == expected
+        assert to_epoch_ns(value) == ns
+
+
+def test_telemetry_rows_round_trip():
+    rows = decode_rows(make_messages(3)) + decode_rows(make_messages(3, timestamp_ns=False))
+    cur = LoopbackCursor()
+    histogram = RecordingHistogram()
+    asyncio.run(TELEMETRY_COPY.write(cur, rows, histogram))
+
+    [(sql, loaded)] = cur.copies
+    assert sql.startswith('COPY telemetry_data (reading_timestamp,telemetry_type,') and sql.endswith('(FORMAT BINARY)')
+    assert len(loaded) == len(rows)
+    for row, back in zip(rows, loaded):
+        assert back[0] == to_datetime(row[0])
+        for col_type, value, loaded_value in zip(TELEMETRY_COL_TYPES[1:], row[1:], back[1:]):
+            if col_type == 'float4' and value is not None:
+                assert loaded_value == pytest.approx(value, rel=1e-6)
+            elif col_type == 'bool' and value is not None:
+                assert loaded_value is bool(value)
+            else:
+                assert loaded_value == value
+    # one latency per row, from the row's own timestamp
+    assert len(histogram.observed) == len(rows) and min(histogram.observed) > 0
+
+
+def test_cpm_is_rounded_for_its_integer_column():
+    cur = LoopbackCursor()
+    asyncio.run(metric_copy_writer('cpm').write(cur, [(1750768496123456000, 41.6)]))
+    [(sql, loaded)] = cur.copies
+    assert sql.startswith('COPY metric_data_cpm (reading_timestamp,val)')
+    assert loaded[0][1] == 42
@@ -0,0 +1,66 @@
+"""
+Debug endpoints stay off the network unless asked for:
+- `pipeline_trace.run_debug_server()` (`client.py`, `metrics_client.py`) binds `PIPELINE_DEBUG_HOST`, loopback by default
+- `backend.py`'s `/debug/*` routes only exist with `BACKEND_DEBUG_ROUTES=1`
+"""
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+import pipeline_trace
+
+telemetry_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'telemetry')
+
+
+def debug_server_host(monkeypatch, **kwargs):
+    from aiohttp import web
+    hosts = []
+
+    class RecordingSite(web.TCPSite):
+        def __init__(self, runner, host, port, **site_kwargs):
+            hosts.append(host)
+            super().__init__(runner, host, 0, **site_kwargs)
+
+    monkeypatch.setattr(web, 'TCPSite', RecordingSite)
+
+    async def main():
+        task = asyncio.create_task(pipeline_trace.run_debug_server(**kwargs))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    asyncio.run(main())
+    return hosts
+
+
+def test_debug_server_is_loopback_by_default(monkeypatch):
+    assert debug_server_host(monkeypatch) == ['127.0.0.1']
+
+
+def test_debug_server_host_can_be_opened_up(monkeypatch):
+    assert debug_server_host(monkeypatch, host='0.0.0.0') == ['0.0.0.0']
+
+
+def backend_debug_routes(**overrides) -> list:
+    # fresh interpreter: the routes are registered at import time (and the metrics can't be registered twice)
+    pytest.importorskip('fastapi')
+    code = "import json, backend; print(json.dumps(sorted(r.path for r in backend.app.routes if r.path.startswith('/debug'))))"
+    env = {key: value for key, value in os.environ.items() if key != 'BACKEND_DEBUG_ROUTES'}
+    env.update(overrides)
+    output = subprocess.run([sys.executable, '-c', code], cwd=telemetry_dir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_backend_profile_routes_are_opt_in():
+    assert not [path for path in backend_debug_routes() if path.startswith('/debug/profile')]
+    assert {'/debug/profile', '/debug/profile/start', '/debug/profile/stop'} <= set(backend_debug_routes(BACKEND_DEBUG_ROUTES='1'))
+
+
+def test_backend_pipeline_route_is_opt_in():
+    assert '/debug/pipeline' not in backend_debug_routes()
+    assert '/debug/pipeline' in backend_debug_routes(BACKEND_DEBUG_ROUTES='1')
@@ -0,0 +1,40 @@
+"""
+`telemetry/decoder.py`: direct row decoding matches the old `MessageToDict()` path.
+"""
+import pytest
+
+import telemetry_pb2
+from bench_decoder import make_messages, check_same_output
+from decoder import DB_ALL_COLS, decode_row, decode_rows, row_to_dict
+
+
+def test_same_columns_as_message_to_dict():
+    check_same_output(make_messages(3))
+    check_same_output(make_messages(3, timestamp_ns=False))
+
+
+def test_rows_are_in_db_column_order():
+    temp, pressure, velocity = (row_to_dict(row) for row in decode_rows(make_messages(3)))
+    assert len(decode_row(make_messages(1)[0])) == len(DB_ALL_COLS)
+    assert temp['telemetry_type'] == 'TEMPERATURE' and temp['subsystem'] == 'ENGINE' and temp['temp_unit'] == 'celsius'
+    assert temp['pressure'] is None and temp['velocity_x'] is None
+    assert pressure['telemetry_type'] == 'PRESSURE' and pressure['pressure_unit'] == 'bar' and pressure['temperature'] is None
+    assert velocity['telemetry_type'] == 'VELOCITY' and velocity['velocity_unit'] == 'm/s' and velocity['sequence_number'] == 2
+
+
+def test_timestamp_ns_wins_over_the_iso_string():
+    with_ns, without_ns = make_messages(1)[0], make_messages(1, timestamp_ns=False)[0]
+    assert decode_row(with_ns)[0] == 1750768496123456000
+    assert decode_row(without_ns)[0] == "2025-06-24T12:34:56.123456Z"
+
+
+def test_batch_decode_keeps_order():
+    msgs = make_messages(10)
+    assert decode_rows(msgs) == [decode_row(msg) for msg in msgs]
+
+
+def test_message_without_data_is_rejected():
+    with pytest.raises(NotImplementedError):
+        decode_row(telemetry_pb2.TelemetryResponse())
+    with pytest.raises(NotImplementedError):
+        decode_rows(make_messages(2) + [telemetry_pb2.TelemetryResponse()])
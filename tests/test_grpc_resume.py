@@ -0,0 +1,62 @@
+"""
+`telemetry/grpc_resume.py`: `SensorDedupIndex` drops what a reconnect replays, nothing else.
+"""
+import pytest
+
+pytest.importorskip('grpc')
+
+import telemetry_pb2
+from grpc_resume import SensorDedupIndex
+
+
+def reading(sensor_id: str, seq: int, timestamp_ns: int = 0, timestamp: str = ''):
+    resp = telemetry_pb2.TelemetryResponse(timestamp=timestamp, timestamp_ns=timestamp_ns, type=telemetry_pb2.TEMPERATURE)
+    resp.temperature.sensor_id = sensor_id
+    resp.temperature.sequence_number = seq
+    return resp
+
+
+def test_replayed_readings_are_duplicates():
+    index = SensorDedupIndex()
+    assert not index.is_duplicate(reading('TEMP_1', 1, 100))
+    assert not index.is_duplicate(reading('TEMP_1', 2, 200))
+    # the server replays after a reconnect
+    assert index.is_duplicate(reading('TEMP_1', 1, 100))
+    assert index.is_duplicate(reading('TEMP_1', 2, 200))
+    assert not index.is_duplicate(reading('TEMP_1', 3, 300))
+
+
+def test_sensors_are_tracked_separately():
+    index = SensorDedupIndex()
+    assert not index.is_duplicate(reading('TEMP_1', 5, 500))
+    assert not index.is_duplicate(reading('TEMP_2', 1, 100))
+
+
+def test_restarted_sensor_is_not_a_duplicate():
+    # sequence numbers start over, but time keeps going
+    index = SensorDedupIndex()
+    assert not index.is_duplicate(reading('TEMP_1', 50, 500))
+    assert not index.is_duplicate(reading('TEMP_1', 1, 600))
+
+
+def test_swapped_server_timestamp_kind_is_not_a_duplicate():
+    # epoch ns vs an ISO string from an older server, not comparable
+    index = SensorDedupIndex()
+    assert not index.is_duplicate(reading('TEMP_1', 5, 500))
+    assert not index.is_duplicate(reading('TEMP_1', 1, timestamp='2025-06-24T12:34:56Z'))
+
+
+def test_least_recently_seen_sensor_is_evicted():
+    index = SensorDedupIndex(max_sensors=2)
+    index.is_duplicate(reading('TEMP_1', 1, 100))
+    index.is_duplicate(reading('TEMP_2', 1, 100))
+    index.is_duplicate(reading('TEMP_1', 2, 200))
+    index.is_duplicate(reading('TEMP_3', 1, 100))
+    assert len(index) == 2
+    assert index.is_duplicate(reading('TEMP_1', 2, 200))
+    # TEMP_2 was forgotten, its replay gets through
+    assert not index.is_duplicate(reading('TEMP_2', 1, 100))
+
+
+def test_message_without_data_is_left_to_the_decoder():
+    assert not SensorDedupIndex().is_duplicate(telemetry_pb2.TelemetryResponse())
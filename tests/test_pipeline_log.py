@@ -0,0 +1,44 @@
+"""
+`telemetry/pipeline_log.py`: `setup_logging()` knobs.
+"""
+import logging
+
+import pytest
+
+import pipeline_log
+
+
+@pytest.fixture(autouse=True)
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    if pipeline_log._handler is not None:
+        root.removeHandler(pipeline_log._handler)
+        pipeline_log._handler = None
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    path = tmp_path / 'testproc.log'
+    monkeypatch.setenv('TESTPROC_LOG_FILE', str(path))
+    return path
+
+
+@pytest.mark.parametrize('knob, level', [('DEBUG', logging.DEBUG), ('warning', logging.WARNING), ('10', 10)])
+def test_level_by_name_or_number(monkeypatch, log_file, knob, level):
+    monkeypatch.setenv('TESTPROC_LOG_LEVEL', knob)
+    logger = pipeline_log.setup_logging('testproc')
+    assert logger.level == level
+    # libraries stay at INFO
+    assert logging.getLogger().level == max(level, logging.INFO)
+
+
+def test_unknown_level_falls_back_to_info_with_a_warning(monkeypatch, log_file, caplog):
+    monkeypatch.setenv('TESTPROC_LOG_LEVEL', 'verbose')
+    logger = pipeline_log.setup_logging('testproc')
+    assert logger.level == logging.INFO
+    assert logging.getLogger().level == logging.INFO
+    assert any("unknown LOG_LEVEL 'VERBOSE', using INFO" in record.getMessage() for record in caplog.records if record.levelno == logging.WARNING)
@@ -0,0 +1,55 @@
+"""
+`RedisStreamConsumer` against fakeredis: pending backlog reads, then new entries.
+"""
+import asyncio
+
+import fakeredis
+
+from redis_stream import RedisStreamConsumer, RedisStreamProducer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _setup(num_entries: int):
+    r = fakeredis.aioredis.FakeRedis()
+    producer = RedisStreamProducer(r, key='stream:test')
+    await producer.put_many([b'%d' % i for i in range(num_entries)])
+    await producer.flush()
+    # a first run read everything and died before acking any of it
+    crashed = RedisStreamConsumer(r, key='stream:test', group='g', consumer='worker-1', count=num_entries)
+    await crashed.ensure_group()
+    crashed._read_id = '>'
+    assert len(await crashed.read_batch(block_ms=None)) == num_entries
+    return r, producer
+
+
+def test_pending_backlog_larger_than_count_is_read_once():
+    async def main():
+        r, producer = await _setup(10)
+        consumer = RedisStreamConsumer(r, key='stream:test', group='g', consumer='worker-1', count=4)
+        payloads = []
+        # nothing acked in between, like a flush that hasn't finished yet
+        for _ in range(3):
+            payloads.extend(payload for _, payload in await consumer.read_batch(block_ms=None))
+        assert payloads == [b'%d' % i for i in range(10)]
+
+        # backlog done: only new entries from here on
+        await producer.put(b'new')
+        await producer.flush()
+        assert [payload for _, payload in await consumer.read_batch(block_ms=None)] == [b'new']
+        assert await consumer.read_batch(block_ms=None) == []
+
+    run(main())
+
+
+def test_ack_removes_from_pending():
+    async def main():
+        r, _ = await _setup(3)
+        consumer = RedisStreamConsumer(r, key='stream:test', group='g', consumer='worker-1', count=10)
+        entries = await consumer.read_batch(block_ms=None)
+        await consumer.ack([entry_id for entry_id, _ in entries])
+        assert (await r.xpending('stream:test', 'g'))['pending'] == 0
+
+    run(main())
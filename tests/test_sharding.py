@@ -0,0 +1,52 @@
+"""
+`ShardSupervisor` routing/queueing, without spawning any worker.
+"""
+import asyncio
+import queue as queue_lib
+
+from sharding import ShardSupervisor, shard_for
+
+
+def test_shard_for_is_stable():
+    assert shard_for('TEMP_ENG_001', 4) == shard_for('TEMP_ENG_001', 4)
+    assert {shard_for(f"sensor_{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+class FullUntilNextBatch:
+    """
+    Full for the first batch until a newer batch tries to get in (or after a few tries),
+    i.e. room shows up right when a second send is waiting too.
+    """
+
+    def __init__(self, first_tries: int = 5):
+        self.items = []
+        self.first_tries = first_tries
+        self._first = None
+        self._tries = 0
+
+    def put_nowait(self, item):
+        if self._first is None:
+            self._first = item
+        if item is self._first and self._tries < self.first_tries:
+            self._tries += 1
+            raise queue_lib.Full
+        self._tries = self.first_tries
+        self.items.append(item)
+
+
+def test_concurrent_sends_keep_batch_order_on_a_full_queue():
+    async def main():
+        supervisor = ShardSupervisor(num_shards=1)
+        shard_queue = FullUntilNextBatch()
+        supervisor._queues[0] = shard_queue
+
+        # linger flush takes the first batch, a size flush the next one while the first is still waiting
+        supervisor._pending[0] = [1]
+        first = asyncio.create_task(supervisor._send(0))
+        await asyncio.sleep(0)
+        supervisor._pending[0] = [2, 3]
+        second = asyncio.create_task(supervisor._send(0))
+        await asyncio.gather(first, second)
+        return shard_queue.items
+
+    assert asyncio.run(main()) == [[1], [2, 3]]
@@ -0,0 +1,38 @@
+"""
+Smoke test: `QUEUE_MODE=sharded` shard workers come up and stay up.
+
+Runs the real `client.py` as `__main__` (that's what spawned workers re-run as `__mp_main__`),
+no gRPC server / postgres needed: the parent keeps reconnecting and the worker's pool keeps retrying.
+
+usage (from repo root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import signal
+import subprocess
+
+import pytest
+
+pytest.importorskip('grpc')
+pytest.importorskip('psycopg_pool')
+
+telemetry_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'telemetry')
+
+RUN_SECONDS = 8
+
+
+def test_shard_worker_stays_alive():
+    env = dict(os.environ, QUEUE_MODE='sharded', INGEST_SHARDS='1', SPOOL_DIR=os.path.join(os.environ.get('TMPDIR', '/tmp'), f"spool-smoke-{os.getpid()}"))
+    proc = subprocess.Popen([sys.executable, '-u', 'client.py'], cwd=telemetry_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        output, _ = proc.communicate(timeout=RUN_SECONDS)
+    except subprocess.TimeoutExpired:
+        proc.send_signal(signal.SIGINT)
+        output, _ = proc.communicate(timeout=30)
+    else:
+        pytest.fail(f"client.py exited early ({proc.returncode}):\n{output}")
+
+    assert "[telemetry_shard_0] : Starting!" in output, output
+    assert "died" not in output, output
+    assert "DuplicateTimeseries" not in output, output
@@ -0,0 +1,91 @@
+"""
+`telemetry/ws_protocol.py`: subprotocol negotiation, per-protocol encodings and their coalesced frames.
+"""
+import json
+
+import msgpack
+import pytest
+
+pytest.importorskip('fastapi')
+
+import telemetry_pb2
+from pydantic import TypeAdapter
+
+from backend import TelemetryData, MetricData
+from bench_decoder import make_messages
+from connection_manager import ConnectionManager
+from decoder import decode_rows, row_to_dict
+from ws_protocol import BINARY_FRAMERS, encode_metric, encode_telem, frame_text, negotiate
+
+
+def telem_dicts(num_msgs: int = 3, timestamp_ns: bool = True) -> list:
+    adapter = TypeAdapter(TelemetryData)
+    return [adapter.validate_python(row_to_dict(row)) for row in decode_rows(make_messages(num_msgs, timestamp_ns))]
+
+
+def test_first_offered_known_subprotocol_wins():
+    assert negotiate(['graphql-ws', 'telemetry.proto', 'telemetry.msgpack']) == ('telemetry.proto', 'proto')
+    assert negotiate(['graphql-ws']) == (None, 'json')
+    assert negotiate(None) == (None, 'json')
+
+
+def test_json_and_msgpack_carry_the_same_fields():
+    for telem_dict in telem_dicts():
+        as_json = json.loads(encode_telem(telem_dict, 'json'))
+        as_msgpack = msgpack.unpackb(encode_telem(telem_dict, 'msgpack'))
+        assert as_json.keys() == as_msgpack.keys()
+        for key, value in as_json.items():
+            assert as_msgpack[key] == (pytest.approx(value, rel=1e-6) if isinstance(value, float) else value)
+
+
+@pytest.mark.parametrize('timestamp_ns', [True, False])
+def test_proto_decodes_back_to_the_same_reading(timestamp_ns):
+    for telem_dict in telem_dicts(timestamp_ns=timestamp_ns):
+        resp = telemetry_pb2.TelemetryResponse.FromString(encode_telem(telem_dict, 'proto'))
+        if timestamp_ns:
+            assert resp.timestamp_ns == telem_dict.reading_timestamp
+        else:
+            assert resp.timestamp == telem_dict.reading_timestamp
+        data = getattr(resp, resp.WhichOneof('data'))
+        assert telemetry_pb2.TelemetryType.Name(resp.type) == telem_dict.telemetry_type
+        assert data.sensor_id == telem_dict.sensor_id
+        assert telemetry_pb2.System.Name(data.subsystem) == telem_dict.subsystem
+        assert data.sequence_number == telem_dict.sequence_number
+
+
+def test_metrics_stay_json_for_proto_clients():
+    metric = MetricData(timestamp='2025-06-24T12:34:56Z', metric_type='kpm', val=3)
+    assert json.loads(encode_metric(metric, 'proto'))['val'] == 3
+    assert msgpack.unpackb(encode_metric(metric, 'msgpack'))['val'] == 3
+
+
+def test_coalesced_frames():
+    dicts = telem_dicts(5)
+    assert json.loads(frame_text([encode_telem(d, 'json') for d in dicts])) == [json.loads(encode_telem(d, 'json')) for d in dicts]
+    assert msgpack.unpackb(BINARY_FRAMERS['msgpack']([encode_telem(d, 'msgpack') for d in dicts])) == [msgpack.unpackb(encode_telem(d, 'msgpack')) for d in dicts]
+    batch = telemetry_pb2.TelemetryBatch.FromString(BINARY_FRAMERS['proto']([encode_telem(d, 'proto') for d in dicts]))
+    assert [resp.SerializeToString() for resp in batch.responses] == [encode_telem(d, 'proto') for d in dicts]
+
+
+def test_large_proto_messages_get_multi_byte_length_prefixes():
+    big = telemetry_pb2.TelemetryResponse(timestamp='x' * 300).SerializeToString()
+    batch = telemetry_pb2.TelemetryBatch.FromString(BINARY_FRAMERS['proto']([big, big]))
+    assert [resp.timestamp for resp in batch.responses] == ['x' * 300] * 2
+
+
+class Conn:
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.got = []
+
+    def enqueue(self, message, key=None):
+        self.got.append(message)
+
+
+def test_publish_encodes_once_per_protocol():
+    conns = [Conn('json'), Conn('json'), Conn('msgpack'), Conn('proto')]
+    calls = []
+    ConnectionManager.publish(conns, lambda protocol: calls.append(protocol) or protocol.encode())
+    assert sorted(calls) == ['json', 'msgpack', 'proto']
+    # the same object, not just equal bytes
+    assert conns[0].got[0] is conns[1].got[0]
@@ -1,25 +1,15 @@
-import typing
 from typing import Union
-import json
-from pprint import pprint
-import time
-from datetime import datetime, timezone
-from dateutil.parser import isoparse
-import dateutil
-from functools import wraps
-
-import dateutil.utils
-import requests
+
 import asyncio
 import aiohttp
 
 import grpc
-from google.protobuf.json_format import MessageToDict
 
 # for protobuf bug
 # https://github.com/grpc/grpc/issues/29459
 import sys
 import os
+import logging
 def add_to_python_path(new_path):
     existing_path = sys.path
     absolute_path = os.path.abspath(new_path)
@@ -29,11 +19,19 @@ def add_to_python_path(new_path):
 
 file_dir_path = os.path.dirname(os.path.realpath(__file__))
 add_to_python_path(file_dir_path + "/proto")
+# shared db batching with telemetry/client.py
+add_to_python_path(file_dir_path + "/../telemetry")
 
 from proto import metrics_pb2
 from proto import metrics_pb2_grpc
 
-import psycopg
+from batcher import DBBatcher
+from copy_writer import metric_copy_writer
+from db_pool import make_pool, borrow
+from spool import make_spool
+from pipeline_log import setup_logging, SampledLog, ThroughputSummary
+from pipeline_trace import run_debug_server
+from sampling_profiler import SamplingProfiler
 
 from prometheus_client import start_http_server, Histogram, Gauge
 
@@ -51,6 +49,17 @@ REDIS_QUEUE_LENGTH = Gauge('redis_queue_len', 'Length of Redis queue, indicating
 
 DEBUG = False
 
+# `setup_logging('metrics_client')` in __main__, knobs in `telemetry/pipeline_log.py` (`METRICS_CLIENT_LOG_LEVEL=DEBUG` for the per-message lines)
+log = logging.getLogger('metrics_client')
+# per-response lines, sampled + rate limited
+msg_log = SampledLog(log)
+# msgs/s, bytes/s (off the wire), errors, every `LOG_SUMMARY_INTERVAL_S`
+summary = ThroughputSummary(log, msg_log)
+# toggled on the debug server (`/debug/profile*`) or with SIGUSR2
+profiler = SamplingProfiler('metrics_client')
+# (`client.py` has 8004)
+METRICS_DEBUG_PORT = int(os.environ.get('METRICS_DEBUG_PORT', 8005))
+
 
 async def process_data(telem_dict) -> dict:
     # TODO: some dummy processing for testing
@@ -59,23 +68,22 @@ async def process_data(telem_dict) -> dict:
 
 
 class Metric_Data():
-    def __init__(self, metric_type, aconn):
+    def __init__(self, metric_type, pool):
         self.metric_type = metric_type
         if self.metric_type not in ['kpm', 'pxm', 'cpm', 'title']:
-            print(f"[ERROR] : `metric_type` malformatted. Must be one of : ['kpm', 'pxm', 'cpm', 'title']")
+            log.error(f"`metric_type` malformatted. Must be one of : ['kpm', 'pxm', 'cpm', 'title']")
             return
         
-        self.db_buffer_lock = asyncio.Lock()
+        # postgres connection pool, shared by all 4 metrics
+        # each flush borrows its own connection, so one slow commit doesn't stall the other streams
+        self.pool = pool
         
-        # in seconds
-        self.BATCH_INTERVAL = 10
-        self.MAX_BATCH_SIZE = 20
-
-        self.db_buffer = []
-        self.did_max_out = False
-        
-        # postgres async conn
-        self.aconn = aconn
+        # failed/overflow batches go to a local spool, replayed once postgres is back (see `telemetry/spool.py`)
+        self.spool = make_spool(self.metric_type)
+        # batch size + interval start at `DB_MAX_BATCH_SIZE`/`DB_BATCH_INTERVAL`, then adapt (see `batch_controller.py`)
+        self.batcher = DBBatcher(self.flush_rows, name=self.metric_type, spool=self.spool)
+        # binary COPY into `metric_data_<metric_type>`
+        self.copy_writer = metric_copy_writer(self.metric_type)
         
         # connect to python server asynchronously
         channel = grpc.aio.insecure_channel('localhost:50052')
@@ -91,135 +99,120 @@ class Metric_Data():
         elif self.metric_type == 'title':
             self.stream = stub.GetMediaStream(metrics_pb2.MetricRequest())
 
-    async def add_to_batch(self, timestamp: str, val: Union[float, str, int]):
-        async with self.db_buffer_lock:
-            self.db_buffer.append((timestamp, val))
+    def add_to_batch(self, timestamp: Union[int, str], val: Union[float, str, int]):
+        # never waits on the db
+        self.batcher.add((timestamp, val))
 
     async def handle_metric_response(self, metric_response):
-        timestamp = metric_response.timestamp
+        # epoch ns for the db (no parsing in the COPY writer), ISO string only from an older metrics_server.py
+        timestamp = metric_response.timestamp_ns or metric_response.timestamp
         if self.metric_type != metric_response.WhichOneof("data"):
-            print(f"[ WARNING ] : `metric_response` and `self.metric_type` mismatch? Skipping...")
+            log.warning(f"[{self.metric_type}] `metric_response` and `self.metric_type` mismatch? Skipping...")
             return
         
         try:
             val = getattr(metric_response, self.metric_type)
         except Exception:
-            print(f"[ WARNING ] : metric_response is malformatted? Contains unknown metric_type. Skipping...")
+            log.warning(f"[{self.metric_type}] metric_response is malformatted? Contains unknown metric_type. Skipping...")
             return
         
         # add to db batch list
-        await self.add_to_batch(timestamp, val)
-        async with self.db_buffer_lock:
-            async with self.aconn.cursor() as cur:
-                if len(self.db_buffer) >= self.MAX_BATCH_SIZE:
-                    self.did_max_out = True
-                    await self.push_to_db(cur)
-                    self.db_buffer.clear()
+        self.add_to_batch(timestamp, val)
                         
         # /POST to dashboard backend
         metric_dict = {
-            "timestamp": timestamp,
+            "timestamp": metric_response.timestamp,
+            "timestamp_ns": metric_response.timestamp_ns or None,
             "metric_type": self.metric_type,
             "val": val
         }
         async with aiohttp.ClientSession() as session:
            async with session.post('http://127.0.0.1:8000/metric_data', json=metric_dict) as response:
             data = await response.text()
-            print(f"[{self.metric_type}] : Sent data: {val}, timestamp [{timestamp}]")
-            print (data)
+            msg_log.debug("[%s] Sent data: %s, timestamp [%s], response: %s", self.metric_type, val, timestamp, data)
         
     async def run_grpc_stream(self):
         try:
             async for metric_response in self.stream:
-                print(f"Received [{metric_response.timestamp}]")
+                summary.count(1, metric_response.ByteSize())
+                msg_log.debug("[%s] Received [%s]", self.metric_type, metric_response.timestamp)
                 await self.handle_metric_response(metric_response)
                 
         except grpc.RpcError as e:
-            print(f"Oh no! gRPC error: {e}")
+            log.error(f"[{self.metric_type}] Oh no! gRPC error: {e}")
         # finally:
             # no need to use .close() when using `with`
             # channel.close()
         
-    async def run_db_batching(self):
-        print(f"[{self.metric_type}] [run_db_batching] : Starting!")
-        async with self.aconn.cursor() as cur:
-            try:
-                while True:
-                    async with self.db_buffer_lock:
-                        self.did_max_out = False
-                    print(f"[{self.metric_type}] [run_db_batching] : Going to sleep...")
-                    await asyncio.sleep(self.BATCH_INTERVAL)
-                    print(f"[{self.metric_type}] [run_db_batching] : Woke up!")
-                    async with self.db_buffer_lock:
-                        if not self.did_max_out:
-                            await self.push_to_db(cur)
-                            self.db_buffer.clear()
-            except Exception as e:
-                print(f"[ERROR] [{self.metric_type}] [run_db_batching] : {e}")
+    async def flush_rows(self, rows, acks):
+        # `flush_rows` callback for DBBatcher
+        async with borrow(self.pool) as aconn:
+            async with aconn.cursor() as cur:
+                await self.push_to_db(aconn, cur, rows)
+    
+    async def run_spool_replayer(self):
+        if self.spool is None:
+            return
+        await self.spool.run_replayer(lambda rows: self.flush_rows(rows, None))
     
     @DB_INSERT_TIME.time()
-    async def push_to_db(self, cur):
-        # COPY insert via psycopg3
-        print("------- [ I T  I S  T I M E ] -------")
-        metric_headers = 'reading_timestamp,val'
-        # 'timestamp' (str, ISO8601 with UTC timezone), 
-        # 'val' (float)
+    async def push_to_db(self, aconn, cur, rows):
+        # binary COPY insert via psycopg3, see `telemetry/copy_writer.py`
+        # 'timestamp' (int UTC epoch ns, or str ISO8601 with UTC timezone from an older server), 
+        # 'val' (int, float or str, depending on metric_type)
         
-        if not self.db_buffer:
-            print("No rows to commit")
-            print("------- [ I T  I S  D O N E ] -------")
+        if not rows:
             return
         
-        print(f"Committing {len(self.db_buffer)} rows...")
+        log.debug("------- [ I T  I S  T I M E ] ------- [%s] Committing %d rows...", self.metric_type, len(rows))
         
         # table names: `metric_data_kpm`, etc.
-        sql = f"COPY metric_data_{self.metric_type} ({metric_headers}) FROM STDIN;"
-        async with cur.copy(sql) as copy:
-            for record in self.db_buffer:
-                await copy.write_row(record)
-                
-                # time for prometheus
-                time_record = isoparse(record[0])
-                time_now = datetime.now(timezone.utc)
-                time_diff = time_now - time_record
-                LATENCY_TO_DB_INSERT.observe(time_diff.total_seconds())
-                
+        await self.copy_writer.write(cur, rows, LATENCY_TO_DB_INSERT)
                 
-        await self.aconn.commit()
-        print("------- [ I T  I S  D O N E ] -------")
+        await aconn.commit()
+        log.debug("------- [ I T  I S  D O N E ] -------")
 
 async def main():
+    profiler.install_signal_toggle()
     
     
-    
-    # connect to db
-    async with await psycopg.AsyncConnection.connect(
+    # connect to db (pool, `DB_POOL_MIN_SIZE`/`DB_POOL_MAX_SIZE`)
+    async with make_pool(
+        'metrics',
         dbname='dashboard',
         user='mirujun',
         password='',
         host='localhost'
-    ) as aconn:
-        kpm_data = Metric_Data('kpm', aconn)
-        cpm_data = Metric_Data('cpm', aconn)
-        pxm_data = Metric_Data('pxm', aconn)
-        title_data = Metric_Data('title', aconn)
+    ) as pool:
+        kpm_data = Metric_Data('kpm', pool)
+        cpm_data = Metric_Data('cpm', pool)
+        pxm_data = Metric_Data('pxm', pool)
+        title_data = Metric_Data('title', pool)
         
         await asyncio.gather(
             kpm_data.run_grpc_stream(),
-            kpm_data.run_db_batching(),
+            kpm_data.batcher.run(),
+            kpm_data.run_spool_replayer(),
             
             cpm_data.run_grpc_stream(),
-            cpm_data.run_db_batching(),
+            cpm_data.batcher.run(),
+            cpm_data.run_spool_replayer(),
             
             pxm_data.run_grpc_stream(),
-            pxm_data.run_db_batching(),
+            pxm_data.batcher.run(),
+            pxm_data.run_spool_replayer(),
             
             title_data.run_grpc_stream(),
-            title_data.run_db_batching()
+            title_data.batcher.run(),
+            title_data.run_spool_replayer(),
+            
+            summary.run(),
+            run_debug_server(METRICS_DEBUG_PORT, profiler=profiler)
         )
     
 
 if __name__ == "__main__":
+    setup_logging('metrics_client')
     # start prometheus endpoint
     server, t = start_http_server(8003)
     
@@ -19,7 +19,7 @@ import keyboardData as keyboardData
 import mouseData as mouseData
 import mediaData as mediaData
 
-from utils import MetricQueue
+from utils import MetricQueue, iso_from_ns
 
 import grpc
 
@@ -110,8 +110,8 @@ class MetricService(metrics_pb2_grpc.MetricServiceServicer):
             # nonblocking to continuously check active client
             metric_tuple = kpm_queue.get()
             if metric_tuple != None:
-                val, timestamp = metric_tuple
-                yield metrics_pb2.MetricResponse(kpm=val, timestamp=timestamp)
+                val, timestamp_ns = metric_tuple
+                yield metrics_pb2.MetricResponse(kpm=val, timestamp=iso_from_ns(timestamp_ns), timestamp_ns=timestamp_ns)
             else:
                 # sleep for a bit
                 # it'll be max 60 seconds until new message
@@ -124,8 +124,8 @@ class MetricService(metrics_pb2_grpc.MetricServiceServicer):
             # nonblocking to continuously check active client
             metric_tuple = mouse_speed_queue.get()
             if metric_tuple != None:
-                val, timestamp = metric_tuple
-                yield metrics_pb2.MetricResponse(pxm=val, timestamp=timestamp)
+                val, timestamp_ns = metric_tuple
+                yield metrics_pb2.MetricResponse(pxm=val, timestamp=iso_from_ns(timestamp_ns), timestamp_ns=timestamp_ns)
             else:
                 # sleep for a bit
                 time.sleep(0.5)
@@ -136,8 +136,8 @@ class MetricService(metrics_pb2_grpc.MetricServiceServicer):
             # nonblocking to continuously check active client
             metric_tuple = cpm_queue.get()
             if metric_tuple != None:
-                val, timestamp = metric_tuple
-                yield metrics_pb2.MetricResponse(cpm=val, timestamp=timestamp)
+                val, timestamp_ns = metric_tuple
+                yield metrics_pb2.MetricResponse(cpm=val, timestamp=iso_from_ns(timestamp_ns), timestamp_ns=timestamp_ns)
             else:
                 # sleep for a bit
                 time.sleep(20)
@@ -148,8 +148,8 @@ class MetricService(metrics_pb2_grpc.MetricServiceServicer):
             # nonblocking to continuously check active client
             metric_tuple = media_queue.get()
             if metric_tuple != None:
-                val, timestamp = metric_tuple
-                yield metrics_pb2.MetricResponse(title=val, timestamp=timestamp)
+                val, timestamp_ns = metric_tuple
+                yield metrics_pb2.MetricResponse(title=val, timestamp=iso_from_ns(timestamp_ns), timestamp_ns=timestamp_ns)
             else:
                 # sleep for a bit
                 time.sleep(10)
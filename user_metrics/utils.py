@@ -1,14 +1,23 @@
 from queue import Queue, Empty, Full
 import logging
+import time
+
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def iso_from_ns(timestamp_ns: int) -> str:
+    # epoch ns -> the old `str(datetime.now(timezone.utc))` format, for `MetricResponse.timestamp`
+    return str(EPOCH + timedelta(microseconds=timestamp_ns // 1000))
 
-from datetime import datetime, timezone
 
 class MetricQueue:
     """
     Queue with behavior:
     - maxsize 10
-    - queue of tuples (val, timestamp)
-    - string timestamp (datetime format, utc timezone) is auto appended during insertion (put())
+    - queue of tuples (val, timestamp_ns)
+    - int timestamp (UTC epoch ns, `time.time_ns()`) is auto appended during insertion (put())
     - if queue full:
         queue.put(val) discards oldest value at front of queue
         and adds newest value `val`
@@ -23,13 +32,13 @@ class MetricQueue:
         
     def put(self, val) -> None:
         # throw away oldest val if queue full
-        now_time = datetime.now(timezone.utc)
+        now_time = time.time_ns()
         try:
-            self._queue.put_nowait((val, str(now_time)))
+            self._queue.put_nowait((val, now_time))
         except Full:
             dropped, timestamp = self._queue.get_nowait()
-            self._queue.put_nowait((val, str(now_time)))
-            self._logger.warning(f'Queue ({self._name}) full. Dropped old value: [{dropped}] of timestamp [{timestamp}]')
+            self._queue.put_nowait((val, now_time))
+            self._logger.warning(f'Queue ({self._name}) full. Dropped old value: [{dropped}] of timestamp [{iso_from_ns(timestamp)}]')
     
     def get(self):
         # return val or None if empty